@@ -0,0 +1,136 @@
+"""
+Throughput benchmark for ``clean_text``.
+
+Times the single-pass ``TextCleaner`` against the regex cleaner it replaced
+(whitespace collapsing followed by lazy ``%PDF.*?endobj`` and
+``obj.*?endobj`` scans) on multi-megabyte synthetic inputs:
+
+- ``prose``: extracted PDF text, wrapped lines with hyphenated breaks;
+- ``obj-heavy``: the same prose with the words "obj"/"object" throughout and
+  no "endobj", where every lazy scan runs to the end of the text;
+- ``pdf-dump``: a raw PDF file pasted as text, mostly object syntax.
+
+Usage (from ``backend/``):
+    python -m benchmarks.bench_clean --sizes 1 2 4 8
+"""
+
+import argparse
+import math
+import random
+import re
+import time
+from typing import Callable, Dict, List
+
+from room_rag.ingest import clean_text
+
+MB = 1024 * 1024
+
+_PARAGRAPH_BREAK_RE = re.compile(r'[^\S\n]*\n[^\S\n]*(?:\n\s*)+')
+_LINE_BREAK_RE = re.compile(r'[^\S\n]*\n[^\S\n]*')
+_SPACE_RE = re.compile(r'[^\S\n]+')
+
+
+def legacy_clean_text(text: str) -> str:
+    """The regex cleaner ``TextCleaner`` replaced."""
+    text = _PARAGRAPH_BREAK_RE.sub('\n\n', text)
+    text = _LINE_BREAK_RE.sub('\n', text)
+    text = _SPACE_RE.sub(' ', text)
+    text = re.sub(r'%PDF.*?endobj', '', text, flags=re.S)
+    text = re.sub(r'obj.*?endobj', '', text, flags=re.S)
+    return text.strip()
+
+
+def make_prose(size: int, rng: random.Random, words: List[str]) -> str:
+    """Wrapped paragraphs of ``words``, about ``size`` characters long."""
+    lines = []
+    length = 0
+    while length < size:
+        line = " ".join(rng.choices(words, k=rng.randint(8, 14)))
+        if rng.random() < 0.1:
+            line += " hyphen-"  # Continued on the next line
+        lines.append(line)
+        lines.append("\n\n" if rng.random() < 0.1 else "\n")
+        length += len(line) + 1
+    return "".join(lines)
+
+
+def make_pdf_dump(size: int, rng: random.Random) -> str:
+    """``%PDF`` header followed by objects, each closed by ``endobj``."""
+    parts = ["%PDF-1.4\n"]
+    length = 0
+    number = 1
+    while length < size:
+        body = " ".join(f"/K{rng.randint(0, 99)} {rng.randint(0, 9999)}" for _ in range(rng.randint(4, 40)))
+        part = f"{number} 0 obj\n<< {body} >>\nstream\n{'x' * rng.randint(0, 400)}\nendstream\nendobj\n"
+        parts.append(part)
+        length += len(part)
+        number += 1
+    return "".join(parts)
+
+
+def make_inputs(size: int, rng: random.Random) -> Dict[str, str]:
+    vocab = ["room", "multilingual", "assistant", "document", "ﬁle", "chunk", "answer", "retrieval",
+             "the", "of", "and", "a", "to", "in", "is", "page", "index", "query", "model", "text"]
+    return {
+        "prose": make_prose(size, rng, vocab),
+        "obj-heavy": make_prose(size, rng, vocab + ["obj", "object", "objects"]),
+        "pdf-dump": make_pdf_dump(size, rng),
+    }
+
+
+def time_call(fn: Callable[[str], str], text: str, repeat: int) -> float:
+    """Best of ``repeat`` runs, in seconds."""
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 2, 4, 8], help="input sizes in MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--legacy-limit", type=float, default=0.25,
+                        help="skip the legacy cleaner on obj-heavy input above this many MB (it is quadratic)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    timings: Dict[str, List] = {}
+
+    # The quadratic case, at sizes the legacy cleaner finishes in
+    sizes = sorted({size for size in [args.legacy_limit / 4, args.legacy_limit / 2, args.legacy_limit]
+                    + args.sizes if size > 0})
+
+    print(f"{'input':>10} {'MB':>6} {'new MB/s':>10} {'legacy MB/s':>12} {'speedup':>8}")
+    for size in sizes:
+        for name, text in make_inputs(int(size * MB), rng).items():
+            new = time_call(clean_text, text, args.repeat)
+            legacy = None
+            if name != "obj-heavy" or size <= args.legacy_limit:
+                legacy = time_call(legacy_clean_text, text, 1)
+            timings.setdefault(name, []).append((len(text), new, legacy))
+
+            mb = len(text) / MB
+            legacy_text = f"{mb / legacy:12.1f}" if legacy is not None else f"{'-':>12}"
+            speedup = f"{legacy / new:7.1f}x" if legacy is not None else f"{'-':>8}"
+            print(f"{name:>10} {mb:6.2f} {mb / new:10.1f} {legacy_text} {speedup}")
+
+    # Least-squares slope of log(time) against log(size): ~1 is linear, ~2 quadratic
+    print()
+    for name, rows in timings.items():
+        for label, column in (("new", 1), ("legacy", 2)):
+            points = [(math.log(row[0]), math.log(row[column])) for row in rows if row[column]]
+            if len(points) < 2:
+                continue
+            mean_x = sum(x for x, _ in points) / len(points)
+            mean_y = sum(y for _, y in points) / len(points)
+            slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / \
+                sum((x - mean_x) ** 2 for x, _ in points)
+            print(f"{name:>10} {label:>7}: time ~ O(n^{slope:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Query latency benchmark for the BM25 inverted index.
+
+Builds synthetic corpora of increasing size and times ``InvertedIndex.search``
+against a linear scan over every chunk. Vocabulary grows with the corpus
+(Heaps' law) and term frequencies follow a Zipf distribution, which is how
+real document collections behave.
+
+Usage (from ``backend/``):
+    python -m benchmarks.bench_index --sizes 1000 4000 16000 64000
+"""
+
+import argparse
+import math
+import random
+import time
+from typing import List, Tuple
+
+from room_rag.index import InvertedIndex, query_terms, tokenize
+
+
+def make_corpus(n_chunks: int, words_per_chunk: int,
+                rng: random.Random) -> Tuple[List[str], List[str], List[float]]:
+    """Generate ``n_chunks`` synthetic chunks, the vocabulary they draw from and its Zipf weights."""
+    vocab_size = int(40 * n_chunks ** 0.6) + 1000
+    weights = [1.0 / rank for rank in range(1, vocab_size + 1)]
+    vocab = [f"w{rank}" for rank in range(vocab_size)]
+    return [
+        " ".join(rng.choices(vocab, weights=weights, k=words_per_chunk))
+        for _ in range(n_chunks)
+    ], vocab, weights
+
+
+def linear_scan(chunks: List[str], terms: List[str], top_k: int):
+    """Reference scan that tokenizes every chunk per query."""
+    wanted = set(terms)
+    scores = []
+    for i, chunk in enumerate(chunks):
+        overlap = len(wanted.intersection(tokenize(chunk)))
+        if overlap:
+            scores.append((overlap, i))
+    scores.sort(reverse=True)
+    return scores[:top_k]
+
+
+def time_queries(fn, queries, repeat: int) -> float:
+    """Return mean seconds per query."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            fn(query)
+    return (time.perf_counter() - start) / (repeat * len(queries))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 4000, 16000, 64000])
+    parser.add_argument("--words", type=int, default=120, help="tokens per chunk")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--scan-limit", type=int, default=16000,
+                        help="skip the linear-scan baseline above this size")
+    parser.add_argument("--zipf-queries", action="store_true",
+                        help="draw query terms by corpus frequency (long postings) instead of uniformly")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = []
+
+    print(f"{'chunks':>8} {'index ms':>10} {'scan ms':>10} {'build s':>8}")
+    for size in args.sizes:
+        chunks, vocab, weights = make_corpus(size, args.words, rng)
+
+        start = time.perf_counter()
+        index = InvertedIndex()
+        index.add_many(0, chunks)
+        index.flush()
+        build = time.perf_counter() - start
+
+        if args.zipf_queries:
+            queries = [query_terms(" ".join(rng.choices(vocab, weights=weights, k=3))) for _ in range(args.queries)]
+        else:
+            queries = [query_terms(" ".join(rng.sample(vocab, 3))) for _ in range(args.queries)]
+        index_latency = time_queries(lambda q: index.search(q, 5), queries, repeat=3)
+
+        scan_latency = None
+        if size <= args.scan_limit:
+            scan_latency = time_queries(lambda q: linear_scan(chunks, q, 5), queries[:20], repeat=1)
+
+        results.append((size, index_latency))
+        scan_text = f"{scan_latency * 1000:10.3f}" if scan_latency is not None else f"{'-':>10}"
+        print(f"{size:>8} {index_latency * 1000:10.3f} {scan_text} {build:8.2f}")
+
+    # Least-squares slope of log(latency) against log(size)
+    if len(results) > 1:
+        xs = [math.log(size) for size, _ in results]
+        ys = [math.log(latency) for _, latency in results]
+        mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / \
+            sum((x - mean_x) ** 2 for x in xs)
+        verdict = "sublinear" if slope < 1 else "NOT sublinear"
+        print(f"\nquery latency ~ O(n^{slope:.2f}) -> {verdict}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+End-to-end benchmark of the RAG engine on synthetic corpora.
+
+For every corpus size, a fresh engine ingests generated text documents
+through ``process_document`` (streaming, chunking, indexing), then answers
+random queries with ``find_relevant_chunks``. Reports ingest throughput,
+query latency percentiles and memory per chunk, and writes them to a JSON
+result file that ``--compare`` checks a later run against.
+
+Usage (from ``backend/``):
+    python -m benchmarks.bench_rag --sizes 1000 10000 100000
+    python -m benchmarks.bench_rag --sizes 1000 10000 --compare benchmarks/results/rag-abc1234.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from room_rag.engine import RoomRAG
+from room_rag.ingest import CHUNK_SIZE, IngestPool, prepare_text
+from room_rag.metrics import process_memory
+
+from .report import finish, percentiles
+
+
+class Upload:
+    """In-memory stand-in for an uploaded file."""
+
+    def __init__(self, filename: str, data: bytes):
+        self.filename = filename
+        self._data = data
+
+    async def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = len(self._data)
+        block, self._data = self._data[:size], self._data[size:]
+        return block
+
+
+class SyntheticCorpus:
+    """
+    Random documents over a Zipf-distributed vocabulary.
+
+    Documents are assembled from a pool of generated sentences into
+    paragraphs a little shorter than a chunk, so every paragraph becomes one
+    chunk and the number of chunks is easy to aim for.
+    """
+
+    def __init__(self, rng: random.Random, vocab_size: int = 50_000, sentences: int = 20_000):
+        self.rng = rng
+        self.vocab = [f"w{rank}" for rank in range(vocab_size)]
+        self.weights = [1.0 / rank for rank in range(1, vocab_size + 1)]
+        self.sentences = [
+            " ".join(rng.choices(self.vocab, weights=self.weights, k=rng.randint(6, 18))).capitalize() + "."
+            for _ in range(sentences)
+        ]
+
+    def paragraph(self, chars: int) -> str:
+        parts: List[str] = []
+        size = 0
+        while True:
+            sentence = self.rng.choice(self.sentences)
+            if parts and size + 1 + len(sentence) > chars:
+                return " ".join(parts)
+            parts.append(sentence)
+            size += len(sentence) + 1
+
+    def document(self, paragraphs: int, chars: int = int(CHUNK_SIZE * 0.85)) -> str:
+        return "\n\n".join(self.paragraph(chars) for _ in range(paragraphs))
+
+    def query(self) -> str:
+        # Skip the most frequent words, which act like stop words
+        return " ".join(self.rng.choices(self.vocab[50:], weights=self.weights[50:], k=self.rng.randint(2, 4)))
+
+
+async def run_size(corpus: SyntheticCorpus, size: int, pool: IngestPool, args) -> Dict[str, float]:
+    """Ingest about ``size`` chunks into a fresh engine and query it."""
+    with tempfile.TemporaryDirectory(prefix="bench_rag_") as storage:
+        engine = RoomRAG(storage_path=storage, ingest_pool=pool)
+        try:
+            rss_before = process_memory()
+            ingest_time = 0.0
+            ingested_bytes = 0
+            doc = 0
+            while len(engine.store) < size:
+                paragraphs = min(args.chunks_per_doc, size - len(engine.store))
+                data = corpus.document(paragraphs).encode("utf-8")
+                start = time.perf_counter()
+                message = await engine.process_document(Upload(f"doc{doc}.txt", data))
+                ingest_time += time.perf_counter() - start
+                if "successfully" not in message:
+                    raise RuntimeError(message)
+                ingested_bytes += len(data)
+                doc += 1
+            chunks = len(engine.store)
+            memory = engine.memory_usage()
+            rss_growth = max(process_memory() - rss_before, 0)
+
+            queries = [corpus.query() for _ in range(args.queries)]
+            for query in queries[:20]:
+                engine.find_relevant_chunks(query, args.top_k)
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                engine.find_relevant_chunks(query, args.top_k)
+                latencies.append(time.perf_counter() - start)
+        finally:
+            engine.close()
+
+    metrics = {
+        "chunks": chunks,
+        "ingest_chunks_per_s": round(chunks / ingest_time, 1),
+        "ingest_mb_per_s": round(ingested_bytes / ingest_time / 1e6, 3),
+        "index_bytes_per_chunk": round(memory / chunks, 1),
+        "rss_bytes_per_chunk": round(rss_growth / chunks, 1),
+        **percentiles(latencies, "query"),
+    }
+    return metrics
+
+
+async def run(args) -> Dict[str, float]:
+    corpus = SyntheticCorpus(random.Random(args.seed))
+    metrics: Dict[str, float] = {}
+    # One pool for every size, started before anything is timed
+    pool = IngestPool()
+    await pool.run(prepare_text, "warm up")
+
+    print(f"{'chunks':>9} {'chunks/s':>10} {'MB/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'index B/chunk':>14} {'RSS B/chunk':>12}")
+    for size in args.sizes:
+        # The engine logs every document it processes
+        with open(os.devnull, "w") as devnull, \
+                contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            result = await run_size(corpus, size, pool, args)
+        print(f"{result['chunks']:>9} {result['ingest_chunks_per_s']:>10.0f} {result['ingest_mb_per_s']:>7.2f} "
+              f"{result['query_p50_ms']:>8.3f} {result['query_p95_ms']:>8.3f} {result['query_p99_ms']:>8.3f} "
+              f"{result['index_bytes_per_chunk']:>14.0f} {result['rss_bytes_per_chunk']:>12.0f}")
+        metrics.update({f"{size}_{name}": value for name, value in result.items() if name != "chunks"})
+    pool.shutdown()
+
+    # Least-squares slope of log(p50 latency) against log(size)
+    if len(args.sizes) > 1:
+        xs = [math.log(size) for size in args.sizes]
+        ys = [math.log(max(metrics[f"{size}_query_p50_ms"], 1e-6)) for size in args.sizes]
+        mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / sum((x - mean_x) ** 2 for x in xs)
+        print(f"\nquery latency ~ O(n^{slope:.2f})")
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="corpus sizes in chunks (up to 1000000)")
+    parser.add_argument("--chunks-per-doc", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--retriever", choices=["lexical", "dense", "hybrid"], default="lexical")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--verbose", action="store_true", help="show the engine's log")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/rag-<commit>.json)")
+    parser.add_argument("--compare", help="earlier result file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative change that counts as a regression")
+    args = parser.parse_args()
+
+    # Retrieval only: no answers are generated, so no API calls are made
+    os.environ.pop("OPENAI_API_KEY", None)
+    os.environ["RAG_RETRIEVER"] = args.retriever
+
+    metrics = asyncio.run(run(args))
+    params = {key: value for key, value in vars(args).items()
+              if key not in ("output", "compare", "threshold", "verbose")}
+    sys.exit(finish("rag", {**params, "chunk_size": CHUNK_SIZE}, metrics, args.output, args.compare, args.threshold))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Load test of the HTTP API against a stub OpenAI server.
+
+Starts ``stub_openai`` and the FastAPI app (``main:app`` under uvicorn, in a
+scratch directory so its storage is thrown away afterwards), seeds the
+default collection with synthetic documents, then runs concurrent ``/chat``
+clients and ``/upload`` clients for a fixed time. Reports request latency
+percentiles, throughput and errors per endpoint, and writes them to a JSON
+result file that ``--compare`` checks a later run against.
+
+Usage (from ``backend/``):
+    python -m benchmarks.load_test --chat-clients 16 --upload-clients 2 --duration 30
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+from .bench_rag import SyntheticCorpus
+from .report import finish, percentiles
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args: List[str], cwd: Path, env: Dict[str, str], quiet: bool) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, *args], cwd=cwd, env=env,
+                            stdout=subprocess.DEVNULL if quiet else None)
+
+
+def stop_server(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+async def wait_ready(client: httpx.AsyncClient, url: str, process: subprocess.Popen, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server for {url} exited with status {process.returncode}")
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server for {url} did not start within {timeout:.0f}s")
+
+
+async def wait_job(client: httpx.AsyncClient, job_id: str) -> dict:
+    while True:
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        await asyncio.sleep(0.05)
+
+
+class Recorder:
+    """Latencies and errors per operation."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, name: str, seconds: float):
+        self.latencies.setdefault(name, []).append(seconds)
+
+    def fail(self, name: str):
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+
+async def upload(client: httpx.AsyncClient, corpus: SyntheticCorpus, name: str, args,
+                 recorder: Recorder) -> int:
+    """Upload one document and wait for its job; returns the bytes ingested (0 on failure)."""
+    data = corpus.document(args.chunks_per_doc).encode("utf-8")
+    start = time.perf_counter()
+    try:
+        response = await client.post("/upload", files={"file": (name, data, "text/plain")})
+        recorder.record("upload_accept", time.perf_counter() - start)
+        if response.status_code != 202:
+            recorder.fail("upload")
+            if response.status_code == 503:
+                await asyncio.sleep(0.5)  # Ingestion is saturated; back off as a client would
+            return 0
+        job = await wait_job(client, response.json()["job_id"])
+    except httpx.HTTPError:
+        recorder.fail("upload")
+        return 0
+    if job["status"] != "done":
+        recorder.fail("upload")
+        return 0
+    recorder.record("upload_job", time.perf_counter() - start)
+    return len(data)
+
+
+async def chat_client(client: httpx.AsyncClient, corpus: SyntheticCorpus, deadline: float, recorder: Recorder):
+    while time.perf_counter() < deadline:
+        question = f"What do the documents say about {corpus.query()}?"
+        start = time.perf_counter()
+        try:
+            response = await client.post("/chat", json={"message": question})
+        except httpx.HTTPError:
+            recorder.fail("chat")
+            continue
+        if response.status_code == 200:
+            recorder.record("chat", time.perf_counter() - start)
+        else:
+            recorder.fail("chat")
+
+
+async def upload_client(client: httpx.AsyncClient, corpus: SyntheticCorpus, deadline: float, args,
+                        recorder: Recorder, number: int):
+    sequence = 0
+    while time.perf_counter() < deadline:
+        await upload(client, corpus, f"load-{number}-{sequence}.txt", args, recorder)
+        sequence += 1
+
+
+async def run(args, app_url: str, stub_url: str, app: subprocess.Popen, stub: subprocess.Popen) -> Dict[str, float]:
+    corpus = SyntheticCorpus(random.Random(args.seed))
+    limits = httpx.Limits(max_connections=args.chat_clients + 2 * args.upload_clients + 8)
+    async with httpx.AsyncClient(base_url=app_url, timeout=args.timeout, limits=limits) as client:
+        await wait_ready(client, f"{stub_url}/stats", stub)
+        await wait_ready(client, "/health", app)
+
+        # Seed the collection, all uploads at once
+        recorder = Recorder()
+        start = time.perf_counter()
+        sizes = await asyncio.gather(*(upload(client, corpus, f"seed-{i}.txt", args, recorder)
+                                       for i in range(args.seed_docs)))
+        seed_time = time.perf_counter() - start
+        metrics = {
+            "seed_docs_per_s": round(sum(1 for size in sizes if size) / seed_time, 2),
+            "seed_mb_per_s": round(sum(sizes) / seed_time / 1e6, 3),
+            "seed_errors": recorder.errors.get("upload", 0),
+        }
+
+        # Mixed load
+        recorder = Recorder()
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(
+            *(chat_client(client, corpus, deadline, recorder) for _ in range(args.chat_clients)),
+            *(upload_client(client, corpus, deadline, args, recorder, i) for i in range(args.upload_clients)),
+        )
+        elapsed = time.perf_counter() - start
+
+        chats = len(recorder.latencies.get("chat", []))
+        uploads = len(recorder.latencies.get("upload_job", []))
+        metrics.update({
+            "chat_per_s": round(chats / elapsed, 2),
+            "chat_errors": recorder.errors.get("chat", 0),
+            **percentiles(recorder.latencies.get("chat", []), "chat"),
+            "uploads_per_s": round(uploads / elapsed, 3),
+            "upload_errors": recorder.errors.get("upload", 0),
+            **percentiles(recorder.latencies.get("upload_accept", []), "upload_accept"),
+            **percentiles(recorder.latencies.get("upload_job", []), "upload_job"),
+        })
+        llm_stats = (await client.get(f"{stub_url}/stats")).json()
+
+    print(f"seed: {args.seed_docs} documents, {metrics['seed_docs_per_s']} docs/s, "
+          f"{metrics['seed_mb_per_s']} MB/s, {metrics['seed_errors']} errors")
+    print(f"\n{'endpoint':>14} {'done':>6} {'per s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, label, errors in (("chat", "/chat", "chat_errors"), ("upload_accept", "/upload", "upload_errors"),
+                                ("upload_job", "upload job", "upload_errors")):
+        samples = recorder.latencies.get(name, [])
+        if not samples:
+            print(f"{label:>14} {0:>6}")
+            continue
+        print(f"{label:>14} {len(samples):>6} {len(samples) / elapsed:>8.2f} {metrics[name + '_p50_ms']:>9.1f} "
+              f"{metrics[name + '_p95_ms']:>9.1f} {metrics[name + '_p99_ms']:>9.1f} {metrics[errors]:>7}")
+    print(f"\nstub OpenAI: {llm_stats['requests']} requests, at most {llm_stats['max_in_flight']} at once")
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chat-clients", type=int, default=16, help="concurrent /chat clients")
+    parser.add_argument("--upload-clients", type=int, default=2, help="concurrent /upload clients")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of mixed load")
+    parser.add_argument("--seed-docs", type=int, default=20, help="documents uploaded before the mixed load")
+    parser.add_argument("--chunks-per-doc", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes for the app")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="stub seconds before the first token")
+    parser.add_argument("--llm-tokens", type=int, default=60, help="stub tokens per answer")
+    parser.add_argument("--timeout", type=float, default=120, help="client timeout per request, in seconds")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--verbose", action="store_true", help="show the app's log")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/load-<commit>.json)")
+    parser.add_argument("--compare", help="earlier result file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative change that counts as a regression")
+    args = parser.parse_args()
+
+    stub_port, app_port = free_port(), free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(BACKEND), os.getenv("PYTHONPATH")]))}
+
+    with tempfile.TemporaryDirectory(prefix="room_load_") as workdir:
+        # The app keeps its storage relative to the working directory
+        (Path(workdir) / "static").symlink_to(BACKEND / "static")
+        stub = start_server(["-m", "benchmarks.stub_openai", "--port", str(stub_port),
+                             "--latency", str(args.llm_latency), "--tokens", str(args.llm_tokens)], BACKEND, env, quiet=True)
+        app = start_server(["-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(app_port),
+                            "--workers", str(args.workers), "--log-level", "warning"], Path(workdir), {
+            **env,
+            "OPENAI_API_KEY": "stub-key",
+            "OPENAI_BASE_URL": f"{stub_url}/v1",
+            "WEB_CONCURRENCY": str(args.workers),
+        }, quiet=not args.verbose)
+        try:
+            metrics = asyncio.run(run(args, app_url, stub_url, app, stub))
+        finally:
+            stop_server(app)
+            stop_server(stub)
+
+    params = {key: value for key, value in vars(args).items() if key not in ("output", "compare", "threshold", "verbose")}
+    sys.exit(finish("load", params, metrics, args.output, args.compare, args.threshold))
+
+
+if __name__ == "__main__":
+    main()
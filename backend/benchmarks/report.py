@@ -0,0 +1,101 @@
+"""
+Result files for the benchmarks, so runs can be compared between commits.
+
+A result file is JSON: the benchmark name, the commit and machine it ran on,
+its parameters and a flat mapping of metrics. Metric names say which way is
+better: ``*_per_s`` is a throughput (higher is better), anything else (``*_ms``,
+``*_bytes``, ``*_errors``, ...) is a cost (lower is better).
+"""
+
+import json
+import os
+import platform
+import subprocess
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def percentiles(samples: Iterable[float], prefix: str, scale: float = 1000.0) -> Dict[str, float]:
+    """``{prefix}_p50_ms``, ``_p95_ms``, ``_p99_ms`` and ``_mean_ms`` of samples in seconds."""
+    values = np.asarray(list(samples), dtype=np.float64) * scale
+    if not len(values):
+        return {}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        f"{prefix}_p50_ms": round(float(p50), 3),
+        f"{prefix}_p95_ms": round(float(p95), 3),
+        f"{prefix}_p99_ms": round(float(p99), 3),
+        f"{prefix}_mean_ms": round(float(values.mean()), 3),
+    }
+
+
+def environment() -> Dict[str, Any]:
+    """Commit, interpreter and machine the benchmark ran on."""
+    def git(*args: str) -> str:
+        try:
+            return subprocess.run(["git", *args], capture_output=True, text=True, timeout=10,
+                                  cwd=Path(__file__).parent).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+
+    return {
+        "commit": git("rev-parse", "--short", "HEAD") or "unknown",
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def write_results(name: str, params: Dict[str, Any], metrics: Dict[str, float],
+                  path: Optional[str] = None) -> Path:
+    """Write a result file; by default ``results/{name}-{commit}.json``."""
+    env = environment()
+    target = Path(path) if path else RESULTS_DIR / f"{name}-{env['commit']}.json"
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_text(json.dumps({"benchmark": name, **env, "params": params, "metrics": metrics}, indent=2))
+    print(f"\nresults written to {target}")
+    return target
+
+
+def higher_is_better(metric: str) -> bool:
+    return metric.endswith("_per_s")
+
+
+def compare(baseline_path: str, metrics: Dict[str, float], threshold: float = 0.1) -> List[str]:
+    """
+    Print every metric next to the baseline's and return the ones that got worse.
+
+    A metric regresses when it moved the wrong way by more than ``threshold``
+    (a fraction of the baseline value).
+    """
+    baseline = json.loads(Path(baseline_path).read_text())
+    old_metrics = baseline["metrics"]
+    print(f"\ncompared with {baseline.get('commit', '?')} ({baseline_path}):")
+    print(f"{'metric':>36} {'baseline':>12} {'now':>12} {'change':>8}")
+
+    regressions = []
+    for metric in sorted(set(old_metrics) & set(metrics)):
+        old, new = old_metrics[metric], metrics[metric]
+        change = (new - old) / old if old else 0.0
+        worse = -change if higher_is_better(metric) else change
+        flag = "  REGRESSION" if worse > threshold else ""
+        if flag:
+            regressions.append(metric)
+        print(f"{metric:>36} {old:12.3f} {new:12.3f} {change:+8.1%}{flag}")
+    return regressions
+
+
+def finish(name: str, params: Dict[str, Any], metrics: Dict[str, float], output: Optional[str],
+           baseline: Optional[str], threshold: float) -> int:
+    """Write the results, compare them with a baseline if given; returns the exit status."""
+    write_results(name, params, metrics, output)
+    if baseline and compare(baseline, metrics, threshold):
+        return 1
+    return 0
@@ -0,0 +1,109 @@
+"""
+Stand-in for the OpenAI chat completions API, for load tests.
+
+Answers every ``POST /v1/chat/completions`` with a canned reply after a
+configurable delay, streamed or not, so the backend can be load tested
+without network access or API costs. ``GET /stats`` reports how many
+requests it served and the most it had in flight at once.
+
+Usage (from ``backend/``):
+    python -m benchmarks.stub_openai --port 9100 --latency 0.3
+    OPENAI_API_KEY=stub OPENAI_BASE_URL=http://127.0.0.1:9100/v1 python main.py
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI(title="OpenAI stub")
+app.state.latency = 0.3  # Seconds before the first token
+app.state.tokens = 60  # Tokens per answer
+app.state.token_interval = 0.005  # Seconds between streamed tokens
+app.state.requests = 0
+app.state.in_flight = 0
+app.state.max_in_flight = 0
+
+ANSWER_WORDS = ("Based on the documents, Room answers questions about your files in several languages "
+                "and cites the passages it used.").split()
+
+
+def answer(tokens: int) -> list:
+    return [ANSWER_WORDS[i % len(ANSWER_WORDS)] + " " for i in range(tokens)]
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    state = app.state
+    state.requests += 1
+    state.in_flight += 1
+    state.max_in_flight = max(state.max_in_flight, state.in_flight)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    model = body.get("model", "stub")
+    pieces = answer(state.tokens)
+    prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in body.get("messages", []))
+
+    if body.get("stream"):
+        async def events():
+            try:
+                await asyncio.sleep(state.latency)
+                for piece in pieces:
+                    chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                             "model": model,
+                             "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    await asyncio.sleep(state.token_interval)
+                done = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                yield f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n"
+            finally:
+                state.in_flight -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    try:
+        await asyncio.sleep(state.latency + state.token_interval * len(pieces))
+    finally:
+        state.in_flight -= 1
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(pieces).strip()},
+                     "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(pieces),
+                  "total_tokens": prompt_tokens + len(pieces)},
+    }
+
+
+@app.get("/stats")
+async def stats():
+    return {"requests": app.state.requests, "in_flight": app.state.in_flight,
+            "max_in_flight": app.state.max_in_flight}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--tokens", type=int, default=60, help="tokens per answer")
+    parser.add_argument("--token-interval", type=float, default=0.005, help="seconds between streamed tokens")
+    args = parser.parse_args()
+
+    app.state.latency = args.latency
+    app.state.tokens = args.tokens
+    app.state.token_interval = args.token_interval
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,24 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import Depends, FastAPI, UploadFile, File, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import Optional
+from pathlib import Path
+from typing import Dict, Optional
+import asyncio
+import json
+import re
 import uvicorn
 
 # Import our custom modules
-from room_rag.engine import RoomRAG
+from room_rag.collection import DEFAULT_COLLECTION, CollectionFullError, CollectionManager, CollectionNotFoundError
+from room_rag.ingest import IngestBusyError
+from room_rag.jobs import JobQueue
+from room_rag import dense, llm, metrics, pipeline
 from room_translate.translator import RoomTranslator
 
 # Import voice processor (simplified version)
-from room_voice.processor import RoomVoice
+from room_voice.processor import RoomVoice, VoiceBusyError
 
 app = FastAPI(
     title="NEXUS - Intelligent Document Analysis Platform",
@@ -31,7 +39,36 @@ app.add_middleware(
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Initialize components
-rag_engine = RoomRAG()
+# Every collection has its own documents, index and storage directory. With
+# several server workers, one process (the job queue's writer) changes the
+# corpus and the others serve queries from the shared storage read-only.
+collections = CollectionManager(Path("room_rag/storage"), readonly=True)
+
+async def run_job(upload, progress, collection: str = DEFAULT_COLLECTION,
+                  action: str = "ingest", doc_id: Optional[str] = None):
+    """Job handler: every change to a collection runs here, in the writer process."""
+    if action == "clear":
+        await collections.drop(collection)
+        return f"Collection '{collection}' cleared successfully!"
+    # Only an upload creates a collection
+    async with collections.use(collection, create=action == "ingest") as rag_engine:
+        if action == "delete":
+            return rag_engine.delete_document(doc_id)
+        with metrics.request("upload"):
+            # An upload's doc_id is the document it is a new version of
+            return await rag_engine.process_document(upload, progress, replace=doc_id)
+
+job_queue = JobQueue(run_job, collections.root / "jobs", on_writer=collections.become_writer)
+
+async def run_change(collection: str, action: str, **params) -> str:
+    """Apply a corpus change here if this is the writer process, else hand it over and wait."""
+    if job_queue.is_writer:
+        return await run_job(None, None, collection=collection, action=action, **params)
+    job = await job_queue.submit(collection=collection, action=action, **params)
+    job = await job_queue.wait(job["id"])
+    if job["status"] != "done":
+        raise RuntimeError(job["error"] or "The writer process did not finish the change in time")
+    return job["message"]
 translator = RoomTranslator()
 voice_processor = RoomVoice()
 
@@ -45,15 +82,31 @@ class ChatResponse(BaseModel):
     response: str
     language: str
     voice_url: Optional[str] = None
+    # Tokens the answer took, by kind (none when it came from the answer cache)
+    usage: Optional[Dict[str, int]] = None
 
 class UploadResponse(BaseModel):
     message: str
     filename: str
+    job_id: Optional[str] = None
 
 class ApiKeyRequest(BaseModel):
     api_key: str
     base_url: Optional[str] = None
 
+@app.on_event("startup")
+async def startup():
+    """Start the ingestion workers."""
+    await job_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop ingestion and persist the search index so the next start is a warm boot."""
+    await job_queue.stop()
+    collections.close()
+    translator.close()
+    await llm.close_clients()
+
 @app.get("/")
 async def root():
     """Root endpoint."""
@@ -68,16 +121,38 @@ async def health_check():
         "services": {
             "rag": "available",
             "translation": "available", 
-            "voice": "basic" if voice_processor.is_available() else "coming_soon",
-            "openai": "available" if rag_engine.openai_client else "not_configured"
-        }
+            "voice": "available" if voice_processor.is_available() else "coming_soon",
+            "speech_to_text": "available" if voice_processor.stt_available() else "not_installed",
+            "openai": "available" if collections.openai_configured else "not_configured"
+        },
+        "ingestion": collections.ingest_pool.get_stats(),
+        "llm": llm.get_stats(),
+        "batching": {"embeddings": dense.get_batcher_stats(), "rerank": pipeline.get_batcher_stats()},
+        "collections": collections.get_stats(),
+        "translation": translator.get_stats(),
+        "voice": voice_processor.get_stats(),
+        "latency": metrics.get_stats()
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Request and stage latency histograms, corpus and memory gauges, in the Prometheus text format.
+    
+    Figures are per server process; with several workers a scrape sees the
+    one that answered it (uploads are processed by the writer process).
+    """
+    gauges = collections.get_gauges() + [
+        metrics.Gauge("room_process_resident_memory_bytes", "Resident memory of this server process.",
+                      [({}, metrics.process_memory())]),
+        metrics.Gauge("room_voice_sessions", "Open speech-to-text sessions.", [({}, voice_processor.sessions)]),
+    ]
+    return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
 @app.post("/set-openai-key")
 async def set_openai_api_key(request: ApiKeyRequest):
     """Set OpenAI API key for enhanced AI capabilities."""
     try:
-        success = rag_engine.set_openai_api_key(request.api_key, request.base_url)
+        success = collections.set_openai_api_key(request.api_key, request.base_url)
         if success:
             return {"message": "OpenAI API key set successfully! AI capabilities are now enhanced."}
         else:
@@ -85,43 +160,251 @@ async def set_openai_api_key(request: ApiKeyRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/upload", response_model=UploadResponse)
-async def upload_document(file: UploadFile = File(...)):
-    """Upload a document for processing."""
+def collection_id(collection: str = Query(DEFAULT_COLLECTION, description="Collection to work in")) -> str:
+    """Validate the ``collection`` query parameter."""
     try:
-        # Process the uploaded file
-        result = await rag_engine.process_document(file)
+        return CollectionManager.validate(collection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def existing_collection_id(collection: str = Depends(collection_id)) -> str:
+    """Validate the ``collection`` query parameter of a request that does not create it."""
+    if not collections.exists(collection):
+        raise HTTPException(status_code=404, detail=f"Collection '{collection}' not found")
+    return collection
+
+@app.post("/upload", response_model=UploadResponse, status_code=202)
+async def upload_document(file: UploadFile = File(...), collection: str = Depends(collection_id),
+                          replace: Optional[str] = Query(None, description="Id of the document this upload is a new version of")):
+    """Upload a document into a collection; it is processed in the background (see /jobs/{job_id})."""
+    if replace is not None:
+        if not collections.exists(collection):
+            raise HTTPException(status_code=404, detail=f"Document '{replace}' not found")
+        async with collections.use(collection) as rag_engine:
+            if replace not in rag_engine.store.documents:
+                raise HTTPException(status_code=404, detail=f"Document '{replace}' not found")
+    try:
+        await collections.check_budget(collection)
+        job = await job_queue.submit(file, collection=collection, doc_id=replace)
         return UploadResponse(
-            message="Document processed successfully!",
-            filename=file.filename
+            message="Document queued for processing!",
+            filename=file.filename,
+            job_id=job["id"]
         )
+    except IngestBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except CollectionFullError as e:
+        raise HTTPException(status_code=507, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/jobs")
+async def list_jobs():
+    """Ingestion queue depth and throughput."""
+    return job_queue.get_stats()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status and progress of an ingestion job."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat_with_documents(request: ChatRequest):
-    """Chat with the uploaded documents."""
+async def chat_with_documents(request: ChatRequest, http_response: Response, collection: str = Depends(existing_collection_id)):
+    """Chat with the documents of a collection.
+    
+    The ``Server-Timing`` header of the response says how long each stage took,
+    and ``usage`` how many tokens the answer took.
+    """
     try:
-        # Get response from RAG engine
-        response = await rag_engine.get_response(request.message, request.language)
-        
-        # Translate if needed
-        if request.language == "hi":
-            response = translator.translate(response, "en", "hi")
-        
-        # Generate voice if requested
-        voice_url = None
-        if request.use_voice and voice_processor.is_available():
-            voice_url = voice_processor.text_to_speech(response, request.language)
+        with metrics.request("chat") as timings:
+            # Get response from RAG engine
+            async with collections.use(collection) as rag_engine:
+                response = await rag_engine.get_response(request.message, request.language)
+            
+            # Translate if needed
+            if request.language == "hi":
+                with metrics.stage("translation"):
+                    response = await translator.translate_async(response, "en", "hi")
+            
+            # Generate voice if requested
+            voice_url = None
+            if request.use_voice and voice_processor.is_available():
+                with metrics.stage("tts"):
+                    # Cache lookups and writes touch the disk: keep them off the event loop
+                    voice_url = await asyncio.to_thread(voice_processor.text_to_speech, response, request.language)
+            usage = metrics.usage()
         
+        http_response.headers["Server-Timing"] = metrics.server_timing(timings)
         return ChatResponse(
             response=response,
             language=request.language,
-            voice_url=voice_url
+            voice_url=voice_url,
+            usage=usage or None
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, collection: str = Depends(existing_collection_id)):
+    """Chat with the documents of a collection, streaming the answer as Server-Sent Events.
+    
+    Events: ``citations`` (retrieved chunks) first, then ``token`` pieces of the
+    answer, then ``done`` with the full (translated, if requested) response,
+    the milliseconds each stage took and the tokens the answer took.
+    """
+    async def events():
+        pieces = []
+        try:
+            with metrics.request("chat_stream") as timings:
+                async with collections.use(collection) as rag_engine:
+                    async for event in rag_engine.stream_response(request.message, request.language):
+                        if event["event"] == "token":
+                            pieces.append(event["data"])
+                        yield sse_event(event["event"], event["data"])
+                
+                response = "".join(pieces)
+                if request.language == "hi":
+                    with metrics.stage("translation"):
+                        response = await translator.translate_async(response, "en", "hi")
+                done = {"response": response, "language": request.language}
+                if request.use_voice:
+                    with metrics.stage("tts"):
+                        done["voice_url"] = await asyncio.to_thread(
+                            voice_processor.text_to_speech, response, request.language
+                        )
+                done["usage"] = metrics.usage()
+            done["timings_ms"] = {name: round(seconds * 1000, 1) for name, seconds in timings.items()}
+            yield sse_event("done", done)
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Keep proxies (nginx) from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/voice/stream")
+async def voice_stream(websocket: WebSocket, language: str = "en", collection: str = DEFAULT_COLLECTION):
+    """Dictate a question and get the answer, over a WebSocket.
+    
+    The client sends 16 kHz 16-bit mono little-endian PCM as binary messages,
+    then ``{"type": "stop"}``. The server replies with ``partial`` transcripts
+    while audio arrives, the ``final`` transcript, and the ``response`` of the
+    collection's documents to it (translated, if ``language`` is ``hi``).
+    """
+    await websocket.accept()
+    try:
+        collection = CollectionManager.validate(collection)
+        if not collections.exists(collection):
+            raise ValueError(f"Collection '{collection}' not found")
+    except ValueError as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1008)
+        return
+    
+    async def send_partial(text: str):
+        await websocket.send_json({"type": "partial", "text": text})
+    
+    try:
+        with voice_processor.transcription_session(language, send_partial) as session:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                if message.get("bytes"):
+                    session.feed(message["bytes"])
+                elif message.get("text") and json.loads(message["text"]).get("type") == "stop":
+                    break
+            # From the end of speech to the answer
+            with metrics.request("voice"):
+                with metrics.stage("transcription"):
+                    transcript = await session.finish()
+                
+                await websocket.send_json({"type": "final", "text": transcript})
+                if transcript:
+                    async with collections.use(collection) as rag_engine:
+                        response = await rag_engine.get_response(transcript, language)
+                    if language == "hi":
+                        with metrics.stage("translation"):
+                            response = await translator.translate_async(response, "en", "hi")
+                    await websocket.send_json({"type": "response", "response": response, "language": language})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except VoiceBusyError as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1013)  # Try again later
+    except Exception as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1011)
+
+@app.get("/voice/speech/{key}")
+async def voice_speech(key: str):
+    """Audio of an answer (the ``voice_url`` of a chat), streamed as it is synthesized.
+    
+    Answers voiced before are redirected to their cached file under ``/static/audio``.
+    """
+    if not re.fullmatch(r"[0-9a-f]{64}", key):
+        raise HTTPException(status_code=404, detail="Unknown audio")
+    url = voice_processor.speech_url(key)
+    if url is not None:
+        return RedirectResponse(url)
+    stream = voice_processor.speech_stream(key)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Unknown audio")
+    
+    async def audio():
+        with metrics.request("speech"):
+            async for chunk in stream:
+                yield chunk
+    
+    return StreamingResponse(audio(), media_type="audio/wav", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/documents")
+async def list_documents(collection: str = Depends(existing_collection_id)):
+    """List the documents stored in a collection."""
+    async with collections.use(collection) as rag_engine:
+        return {"documents": rag_engine.get_document_info()}
+
+@app.delete("/documents/{doc_id}")
+async def delete_document(doc_id: str, collection: str = Depends(existing_collection_id)):
+    """Delete a stored document."""
+    async with collections.use(collection) as rag_engine:
+        if doc_id not in rag_engine.store.documents:
+            raise HTTPException(status_code=404, detail=f"Document '{doc_id}' not found")
+    try:
+        return {"message": await run_change(collection, "delete", doc_id=doc_id)}
+    except (KeyError, CollectionNotFoundError):
+        raise HTTPException(status_code=404, detail=f"Document '{doc_id}' not found")
+    except IngestBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/clear")
+async def clear_collection(collection: str = Depends(existing_collection_id)):
+    """Remove every document from a collection (other collections are untouched)."""
+    try:
+        return {"message": await run_change(collection, "clear")}
+    except IngestBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/collections")
+async def list_collections():
+    """List collection ids."""
+    return {"collections": collections.list_ids()}
+
 @app.get("/languages")
 async def get_supported_languages():
     """Get supported languages."""
@@ -5,7 +5,9 @@ This module provides document processing and question-answering capabilities
 using FAISS vector database and sentence transformers.
 """
 
+from .collection import CollectionManager
 from .engine import RoomRAG
+from .index import InvertedIndex
 
-__all__ = ['RoomRAG']
+__all__ = ['RoomRAG', 'InvertedIndex', 'CollectionManager']
 
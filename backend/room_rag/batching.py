@@ -0,0 +1,115 @@
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict, Generic, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Collects concurrent calls to a local model into batched forward passes.
+
+    ``submit`` queues one item and waits for its result. A batch runs as soon
+    as ``max_batch`` items are waiting, or ``max_wait`` seconds after the
+    first one arrived. One batch runs at a time, in a worker thread: items
+    that arrive meanwhile form the next batch, which starts the moment the
+    running one finishes. A lone request therefore waits at most
+    ``max_wait``, while under load batches grow by themselves. Identical
+    items in a batch are computed once.
+    """
+
+    def __init__(self, fn: Callable[[List[T]], Sequence[R]], max_batch: Optional[int] = None,
+                 max_wait: Optional[float] = None):
+        """
+        Args:
+            fn: Blocking function mapping a list of items to one result per item
+            max_batch: Most items per batch
+            max_wait: Seconds the first item of a batch waits for company
+        """
+        self.fn = fn
+        self.max_batch = max_batch or int(os.getenv("BATCH_MAX_SIZE", 32))
+        if max_wait is None:
+            max_wait = float(os.getenv("BATCH_MAX_WAIT_MS", 5)) / 1000
+        self.max_wait = max_wait
+
+        self._pending: List[Tuple[T, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running: Optional[asyncio.Task] = None
+        self._loop = None
+
+        self.batches = 0
+        self.items = 0
+        self.largest = 0
+        self._wait_seconds = 0.0
+        self._run_seconds = 0.0
+
+    async def submit(self, item: T) -> R:
+        """Queue one item and return its result once its batch has run."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Futures and timers belong to a loop; start afresh on a new one
+            self._pending, self._timer, self._running, self._loop = [], None, None, loop
+        future = loop.create_future()
+        self._pending.append((item, future, time.monotonic()))
+        if self._running is None:
+            if len(self._pending) >= self.max_batch:
+                self._start()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.max_wait, self._start)
+        return await future
+
+    def _start(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._running is not None or not self._pending:
+            return
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        self._running = self._loop.create_task(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[T, asyncio.Future, float]]):
+        started = time.monotonic()
+        self._wait_seconds += sum(started - queued_at for _, _, queued_at in batch)
+        try:
+            items = [item for item, _, _ in batch]
+            try:
+                unique = list(dict.fromkeys(items))
+            except TypeError:  # unhashable items
+                unique = items
+            try:
+                results = await asyncio.to_thread(self.fn, unique)
+                if unique is not items:
+                    by_item = dict(zip(unique, results))
+                    results = [by_item[item] for item in items]
+                for (_, future, _), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+        finally:
+            self.batches += 1
+            self.items += len(batch)
+            self.largest = max(self.largest, len(batch))
+            self._run_seconds += time.monotonic() - started
+            self._running = None
+            # Whatever queued up meanwhile goes next, without waiting again
+            if self._pending:
+                self._start()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Batch sizes and time spent waiting and running."""
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": round(1000 * self.max_wait, 3),
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else None,
+            "largest_batch": self.largest,
+            "avg_wait_ms": round(1000 * self._wait_seconds / self.items, 3) if self.items else None,
+            "avg_run_ms": round(1000 * self._run_seconds / self.batches, 3) if self.batches else None,
+        }
@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .index import tokenize
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase a query and reduce it to its word tokens."""
+    return " ".join(tokenize(query))
+
+
+class AnswerCache:
+    """
+    LRU + TTL cache of generated answers.
+
+    Answers are keyed by the normalized query, the ids of the chunks that were
+    retrieved for it, the corpus version and whatever produced the answer (a
+    model name or the fallback). Bumping the corpus version on every ingest or
+    deletion makes stale answers unreachable; they age out through LRU/TTL.
+
+    When an ``embed`` function is given, a miss on the exact key falls back to
+    a near-duplicate lookup: a cached answer for the same chunks and version
+    whose query embedding has cosine similarity >= ``similarity``.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None,
+                 embed: Optional[Callable[[Sequence[str]], np.ndarray]] = None,
+                 similarity: Optional[float] = None):
+        self.max_entries = max_entries or int(os.getenv("ANSWER_CACHE_SIZE", 512))
+        self.ttl = ttl or float(os.getenv("ANSWER_CACHE_TTL", 3600))
+        self.similarity = similarity or float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))
+        self.embed = embed
+
+        # key -> (answer, expires_at, query_vector)
+        self._entries: "OrderedDict[Tuple, Tuple[str, float, Optional[np.ndarray]]]" = OrderedDict()
+        # (chunk_ids, version, generator) -> keys, for near-duplicate lookups
+        self._by_context: Dict[Tuple, List[Tuple]] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(query: str, chunk_ids: Sequence[int], version: int, generator: Hashable) -> Tuple:
+        return normalize_query(query), tuple(chunk_ids), version, generator
+
+    def get(self, query: str, chunk_ids: Sequence[int], version: int, generator: Hashable,
+            vector: Optional[np.ndarray] = None) -> Optional[str]:
+        """
+        Return a cached answer, or ``None`` on a miss.
+
+        ``vector`` is the embedding of the normalized query, if the caller
+        already has it; otherwise ``embed`` is called when needed.
+        """
+        key = self.make_key(query, chunk_ids, version, generator)
+        now = time.monotonic()
+
+        with self._lock:
+            answer = self._lookup(key, now)
+            if answer is not None:
+                self.hits += 1
+                return answer
+            candidates = list(self._by_context.get(key[1:], ()))
+
+        if self.embed is not None and candidates:
+            if vector is None:
+                vector = self._embed(key[0])
+            with self._lock:
+                best_key, best_score = None, self.similarity
+                for candidate in candidates:
+                    entry = self._entries.get(candidate)
+                    if entry is None or entry[2] is None:
+                        continue
+                    score = float(np.dot(vector, entry[2]))
+                    if score >= best_score:
+                        best_key, best_score = candidate, score
+                if best_key is not None:
+                    answer = self._lookup(best_key, now)
+                    if answer is not None:
+                        self.near_hits += 1
+                        return answer
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, query: str, chunk_ids: Sequence[int], version: int, generator: Hashable, answer: str,
+            vector: Optional[np.ndarray] = None):
+        """Store an answer (``vector`` as for ``get``)."""
+        key = self.make_key(query, chunk_ids, version, generator)
+        if vector is None and self.embed is not None:
+            vector = self._embed(key[0])
+
+        with self._lock:
+            if key not in self._entries:
+                self._by_context.setdefault(key[1:], []).append(key)
+            self._entries[key] = (answer, time.monotonic() + self.ttl, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _lookup(self, key: Tuple, now: float) -> Optional[str]:
+        """Fetch a live entry and mark it recently used (caller holds the lock)."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] < now:
+            self._drop(key)
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _drop(self, key: Tuple):
+        del self._entries[key]
+        siblings = self._by_context.get(key[1:])
+        if siblings is not None:
+            siblings.remove(key)
+            if not siblings:
+                del self._by_context[key[1:]]
+
+    def _embed(self, normalized_query: str) -> np.ndarray:
+        return np.asarray(self.embed([normalized_query]), dtype=np.float32)[0]
+
+    def clear(self):
+        """Drop every entry (statistics are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._by_context.clear()
+
+    def get_stats(self) -> Dict[str, float]:
+        """Hit/miss counters and current size."""
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+        }
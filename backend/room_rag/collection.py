@@ -0,0 +1,338 @@
+import asyncio
+import os
+import re
+import shutil
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from . import metrics
+from .engine import RoomRAG
+from .ingest import IngestPool
+
+DEFAULT_COLLECTION = "default"
+
+_COLLECTION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+_MB = 1024 * 1024
+
+
+class CollectionFullError(Exception):
+    """Raised when a collection has used up its memory budget."""
+
+
+class CollectionNotFoundError(Exception):
+    """Raised when a collection that does not exist is used without asking to create it."""
+
+
+class _Loaded:
+    """A collection that is resident in memory."""
+
+    __slots__ = ("engine", "users", "idle", "dropped", "last_used", "memory", "measured_version")
+
+    def __init__(self, engine: RoomRAG):
+        self.engine = engine
+        self.users = 0
+        # Set while no lease is out; a refresh waits for it
+        self.idle = asyncio.Event()
+        self.idle.set()
+        # Dropped while in use: its storage is deleted when the last lease is returned
+        self.dropped = False
+        self.last_used = time.monotonic()
+        self.memory = engine.memory_usage()
+        self.measured_version = engine.corpus_version
+
+
+class CollectionManager:
+    """
+    Named, isolated document collections (per user, session or workspace).
+
+    Every collection is a separate ``RoomRAG`` with its own storage directory,
+    index and answer cache, so a query only touches its own corpus. The
+    parsing pool and the local models are shared. Collections are loaded on
+    first use and the least recently used idle ones are closed (their indexes
+    are snapshotted to disk) once more than ``max_loaded`` are resident or
+    their estimated memory exceeds ``memory_budget``. Each collection may use
+    at most ``collection_budget`` bytes before uploads to it are refused.
+
+    Only ``use(..., create=True)`` (uploads) creates a collection; other
+    requests for one that does not exist fail with
+    ``CollectionNotFoundError`` instead of leaving a directory behind.
+
+    When several server processes share the storage, only one of them writes
+    (see ``JobQueue``); the others open collections ``readonly`` and refresh
+    them from disk before every use, so new documents show up without a
+    restart.
+    """
+
+    def __init__(self, root: Path, max_loaded: Optional[int] = None,
+                 memory_budget: Optional[int] = None, collection_budget: Optional[int] = None,
+                 readonly: bool = False, refresh_wait: Optional[float] = None):
+        """
+        Args:
+            root: Storage root; the default collection lives here directly and
+                the others under ``root/collections/<id>``
+            max_loaded: Collections kept in memory at once
+            memory_budget: Bytes all resident collections may use together
+            collection_budget: Bytes a single collection may use
+            readonly: Open collections read-only (another process writes)
+            refresh_wait: Seconds a read-only collection waits for running
+                queries to finish before picking up the writer's changes
+        """
+        self.root = Path(root)
+        self.readonly = readonly
+        self.max_loaded = max_loaded or int(os.getenv("COLLECTIONS_MAX_LOADED", 8))
+        self.memory_budget = memory_budget or int(os.getenv("COLLECTIONS_MEMORY_BUDGET_MB", 2048)) * _MB
+        self.collection_budget = collection_budget or int(os.getenv("COLLECTION_MEMORY_BUDGET_MB", 512)) * _MB
+        self.refresh_wait = refresh_wait or float(os.getenv("COLLECTIONS_REFRESH_WAIT", 5))
+
+        self.ingest_pool = IngestPool()
+        self.evictions = 0
+        self._loaded: "OrderedDict[str, _Loaded]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._api_key: Optional[Dict[str, Optional[str]]] = None
+
+    # Naming
+
+    @staticmethod
+    def validate(collection_id: str) -> str:
+        """Return the id if it is a valid collection name, else raise ``ValueError``."""
+        if not _COLLECTION_ID_RE.match(collection_id or ""):
+            raise ValueError("Collection ids are 1-64 letters, digits, '-' or '_'")
+        return collection_id
+
+    def path_for(self, collection_id: str) -> Path:
+        if collection_id == DEFAULT_COLLECTION:
+            return self.root
+        return self.root / "collections" / collection_id
+
+    def exists(self, collection_id: str) -> bool:
+        """Whether a collection has storage (the default one always exists)."""
+        return (collection_id == DEFAULT_COLLECTION or collection_id in self._loaded
+                or self.path_for(collection_id).is_dir())
+
+    def list_ids(self) -> List[str]:
+        """Every collection that exists on disk or in memory."""
+        ids = {DEFAULT_COLLECTION, *self._loaded}
+        collections_dir = self.root / "collections"
+        if collections_dir.is_dir():
+            ids.update(entry.name for entry in collections_dir.iterdir() if entry.is_dir())
+        return sorted(ids - {collection_id for collection_id, loaded in self._loaded.items() if loaded.dropped})
+
+    # Leases
+
+    @asynccontextmanager
+    async def use(self, collection_id: str, create: bool = False) -> AsyncIterator[RoomRAG]:
+        """
+        Borrow a collection's engine, loading it if needed.
+
+        A collection is never evicted while it is borrowed. One that does not
+        exist is created if ``create`` is set, else ``CollectionNotFoundError``
+        is raised.
+        """
+        loaded = await self._acquire(self.validate(collection_id), create)
+        try:
+            yield loaded.engine
+        finally:
+            await self._release(loaded)
+            if loaded.dropped and loaded.users == 0:
+                async with self._lock(collection_id):
+                    await self._delete(collection_id, loaded)
+
+    def _lock(self, collection_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(collection_id, asyncio.Lock())
+
+    async def _acquire(self, collection_id: str, create: bool = False) -> _Loaded:
+        async with self._lock(collection_id):
+            loaded = self._loaded.get(collection_id)
+            if loaded is not None and loaded.dropped:
+                # Reopen it empty once the leases it was dropped under are returned
+                await loaded.idle.wait()
+                await self._delete(collection_id, loaded)
+                loaded = None
+            if loaded is not None and loaded.engine.readonly != self.readonly and loaded.users == 0:
+                # This process changed role: reopen with the right access mode
+                await asyncio.to_thread(self._loaded.pop(collection_id).engine.close)
+                loaded = None
+            if loaded is None:
+                if not create and not self.exists(collection_id):
+                    raise CollectionNotFoundError(f"Collection '{collection_id}' not found")
+                # Opening replays the log / loads snapshots: keep it off the event loop
+                engine = await asyncio.to_thread(
+                    RoomRAG, self.path_for(collection_id), self.ingest_pool, self.readonly
+                )
+                if self._api_key is not None:
+                    engine.set_openai_api_key(**self._api_key)
+                loaded = self._loaded[collection_id] = _Loaded(engine)
+            elif loaded.engine.readonly and await asyncio.to_thread(loaded.engine.needs_refresh):
+                await self._refresh(collection_id, loaded)
+        self._loaded.move_to_end(collection_id)
+        loaded.users += 1
+        loaded.idle.clear()
+        loaded.last_used = time.monotonic()
+        return loaded
+
+    async def _refresh(self, collection_id: str, loaded: _Loaded):
+        """
+        Replay the writer's changes into a read-only engine once its leases are returned.
+
+        Refreshing changes the indexes in place, so it waits (holding the
+        collection's lock, so no new lease starts) until running queries are
+        done; if they take longer than ``refresh_wait``, this lease is served
+        from the current indexes and a later one refreshes.
+        """
+        try:
+            await asyncio.wait_for(loaded.idle.wait(), self.refresh_wait)
+        except asyncio.TimeoutError:
+            print(f"⏳ Collection '{collection_id}' busy; refreshing on a later request")
+            return
+        await asyncio.to_thread(loaded.engine.refresh)
+
+    async def _release(self, loaded: _Loaded):
+        loaded.users -= 1
+        if loaded.users == 0:
+            loaded.idle.set()
+        loaded.last_used = time.monotonic()
+        self._measure(loaded)
+        await self._evict()
+
+    def _measure(self, loaded: _Loaded):
+        """Re-estimate a collection's memory if its corpus changed."""
+        if loaded.measured_version != loaded.engine.corpus_version:
+            loaded.memory = loaded.engine.memory_usage()
+            loaded.measured_version = loaded.engine.corpus_version
+
+    async def _evict(self):
+        """
+        Close least recently used idle collections until within limits.
+
+        Closing snapshots the index to disk, so it runs in a thread, holding
+        the collection's lock: a request for it meanwhile waits and reopens it.
+        """
+        while len(self._loaded) > 1 and (
+            len(self._loaded) > self.max_loaded or self.memory_usage() > self.memory_budget
+        ):
+            # The most recently used collection always stays resident; one being
+            # opened, refreshed or deleted (its lock is held) is left alone
+            candidates = list(self._loaded.items())[:-1]
+            victim = next((cid for cid, loaded in candidates
+                           if loaded.users == 0 and not loaded.dropped and not self._lock(cid).locked()), None)
+            if victim is None:
+                return
+            async with self._lock(victim):
+                await asyncio.to_thread(self._loaded.pop(victim).engine.close)
+            self.evictions += 1
+            print(f"💤 Evicted idle collection '{victim}' to disk")
+
+    async def check_budget(self, collection_id: str):
+        """Raise ``CollectionFullError`` if a collection is over its memory budget."""
+        if not self.exists(collection_id):
+            return
+        async with self.use(collection_id) as engine:
+            usage = engine.memory_usage()
+        if usage >= self.collection_budget:
+            raise CollectionFullError(
+                f"Collection '{collection_id}' is full "
+                f"({usage // _MB} MB of {self.collection_budget // _MB} MB); delete documents or use another collection"
+            )
+
+    # Administration
+
+    async def drop(self, collection_id: str):
+        """
+        Delete a collection and its storage. The default collection is only cleared.
+
+        A collection in use is emptied right away and deleted when its last
+        lease is returned; a new lease waits for that and gets it empty.
+        """
+        if collection_id == DEFAULT_COLLECTION:
+            async with self.use(collection_id) as engine:
+                engine.clear_documents()
+            return
+        if self.readonly:
+            raise PermissionError("Collections are read-only; changes are made by the writer process")
+        async with self._lock(self.validate(collection_id)):
+            loaded = self._loaded.get(collection_id)
+            if loaded is None:
+                await asyncio.to_thread(shutil.rmtree, self.path_for(collection_id), True)
+            elif loaded.users:
+                loaded.engine.clear_documents()
+                loaded.dropped = True
+            else:
+                await self._delete(collection_id, loaded)
+
+    async def _delete(self, collection_id: str, loaded: _Loaded):
+        """Close a resident collection and delete its storage, unless that was done already."""
+        if self._loaded.get(collection_id) is not loaded:
+            return
+        await asyncio.to_thread(self._loaded.pop(collection_id).engine.close)
+        await asyncio.to_thread(shutil.rmtree, self.path_for(collection_id), True)
+
+    def become_writer(self):
+        """Switch to read-write; collections are reopened writable as they go idle."""
+        self.readonly = False
+
+    def set_openai_api_key(self, api_key: str, base_url: Optional[str] = None) -> bool:
+        """Use an OpenAI key for every collection, including ones loaded later."""
+        self._api_key = {"api_key": api_key, "base_url": base_url}
+        return all([loaded.engine.set_openai_api_key(api_key, base_url) for loaded in self._loaded.values()])
+
+    @property
+    def openai_configured(self) -> bool:
+        return self._api_key is not None or bool(os.getenv("OPENAI_API_KEY"))
+
+    def memory_usage(self) -> int:
+        """Estimated bytes used by all resident collections."""
+        return sum(loaded.memory for loaded in self._loaded.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Resident collections, their size and cache/retrieval figures."""
+        return {
+            "readonly": self.readonly,
+            "loaded": len(self._loaded),
+            "max_loaded": self.max_loaded,
+            "memory_mb": round(self.memory_usage() / _MB, 1),
+            "memory_budget_mb": self.memory_budget // _MB,
+            "collection_budget_mb": self.collection_budget // _MB,
+            "evictions": self.evictions,
+            "collections": {
+                collection_id: {
+                    "documents": len(loaded.engine.documents),
+                    "chunks": len(loaded.engine.store),
+                    "memory_mb": round(loaded.memory / _MB, 1),
+                    "in_use": loaded.users,
+                    "idle_seconds": round(time.monotonic() - loaded.last_used, 1),
+                    "answer_cache": loaded.engine.answer_cache.get_stats(),
+                    "parse_cache": loaded.engine.parse_cache.get_stats(),
+                    "context": loaded.engine.context_packer.get_stats(),
+                    "retrieval": {
+                        "mode": loaded.engine.retriever,
+                        "stages": loaded.engine.pipeline.get_stats() if loaded.engine.pipeline else {},
+                    },
+                }
+                for collection_id, loaded in self._loaded.items()
+            },
+        }
+
+    def get_gauges(self) -> List[metrics.Gauge]:
+        """Corpus size, chunk count and memory of every resident collection, for ``/metrics``."""
+        resident = [({"collection": collection_id}, loaded) for collection_id, loaded in self._loaded.items()]
+        return [
+            metrics.Gauge("room_collections_loaded", "Collections resident in memory.", [({}, len(self._loaded))]),
+            metrics.Gauge("room_documents", "Documents in a collection.",
+                          [(labels, len(loaded.engine.documents)) for labels, loaded in resident]),
+            metrics.Gauge("room_corpus_bytes", "Uploaded bytes of a collection's documents.",
+                          [(labels, sum(doc.size for doc in loaded.engine.documents)) for labels, loaded in resident]),
+            metrics.Gauge("room_chunks", "Chunks stored for a collection.",
+                          [(labels, len(loaded.engine.store)) for labels, loaded in resident]),
+            metrics.Gauge("room_collection_memory_bytes", "Estimated memory held by a collection's indexes and metadata.",
+                          [(labels, loaded.memory) for labels, loaded in resident]),
+        ]
+
+    def close(self):
+        """Close every resident collection and stop the parsing pool."""
+        for loaded in self._loaded.values():
+            loaded.engine.close()
+        self._loaded.clear()
+        self.ingest_pool.shutdown()
@@ -0,0 +1,241 @@
+import importlib.util
+import math
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .index import query_terms, tokenize
+
+# Sentence boundaries: end punctuation followed by whitespace, or a line break
+_SENTENCE_BREAK_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+# Rough BPE approximation: words (long ones count per 4 characters) and punctuation
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+# Chat formatting overhead per message (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Shortest shared run of characters treated as overlap between two chunks
+MIN_OVERLAP_CHARS = 20
+
+_encoders: Dict[str, Optional[Callable[[str], List[int]]]] = {}
+_encoders_lock = threading.Lock()
+
+
+def _estimate_tokens(text: str) -> int:
+    return sum(math.ceil(len(piece) / 4) for piece in _PIECE_RE.findall(text))
+
+
+def get_token_counter(model: str = "gpt-4o-mini") -> Callable[[str], int]:
+    """
+    Return a function counting the tokens of a text for ``model``.
+
+    Uses tiktoken's encoding for the model when tiktoken is installed and its
+    vocabulary can be loaded; otherwise an estimate close to BPE token counts
+    for English text.
+    """
+    with _encoders_lock:
+        if model not in _encoders:
+            _encoders[model] = None
+            if importlib.util.find_spec("tiktoken") is not None:
+                import tiktoken
+                try:
+                    try:
+                        encoding = tiktoken.encoding_for_model(model.split("/")[-1])
+                    except KeyError:
+                        encoding = tiktoken.get_encoding("cl100k_base")
+                    _encoders[model] = encoding.encode
+                except Exception as e:  # vocabulary download failed (offline)
+                    print(f"⚠️  tiktoken unavailable for {model} ({e}). Estimating token counts.")
+        encode = _encoders[model]
+    if encode is None:
+        return _estimate_tokens
+    return lambda text: len(encode(text))
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences, dropping empty ones."""
+    return [sentence.strip() for sentence in _SENTENCE_BREAK_RE.split(text) if sentence.strip()]
+
+
+def strip_overlap(text: str, other: str) -> str:
+    """
+    Remove text that ``other`` already contains at the seam between them.
+
+    Neighbouring chunks of a document can share a run of text at their edges;
+    this cuts a prefix of ``text`` that ends ``other``, or a suffix of ``text``
+    that starts ``other``.
+    """
+    if len(text) < MIN_OVERLAP_CHARS or len(other) < MIN_OVERLAP_CHARS:
+        return text
+    # ``other`` ends where ``text`` begins
+    start = other.find(text[:MIN_OVERLAP_CHARS], max(0, len(other) - len(text)))
+    while start != -1:
+        if text.startswith(other[start:]):
+            return text[len(other) - start:]
+        start = other.find(text[:MIN_OVERLAP_CHARS], start + 1)
+    # ``text`` ends where ``other`` begins
+    end = text.rfind(other[:MIN_OVERLAP_CHARS], max(0, len(text) - len(other)))
+    while end != -1:
+        if other.startswith(text[end:]):
+            return text[:end]
+        end = text.rfind(other[:MIN_OVERLAP_CHARS], 0, end)
+    return text
+
+
+class ContextPacker:
+    """
+    Fit retrieved chunks into a token budget before they are sent to the model.
+
+    Chunks arrive best first. Text they share with a better chunk (overlapping
+    edges, repeated sentences) is removed, then sentences are picked until the
+    budget is used: those containing the most query terms first, ties going to
+    the better-ranked chunk. The picked sentences are put back in document
+    order, with "…" where text was left out, and chunks that contribute
+    nothing are dropped. With ``extract_sentences`` off, whole chunks are
+    taken in rank order and the last one that fits only partly is cut short.
+    """
+
+    def __init__(self, budget: Optional[int] = None, extract_sentences: Optional[bool] = None,
+                 count_tokens: Optional[Callable[[str], int]] = None):
+        """
+        Args:
+            budget: Tokens of document context sent per request
+            extract_sentences: Pick sentences by relevance instead of whole chunks
+            count_tokens: Token counting function; see ``get_token_counter``
+        """
+        self.budget = budget or int(os.getenv("CONTEXT_TOKEN_BUDGET", 1500))
+        if extract_sentences is None:
+            extract_sentences = os.getenv("CONTEXT_EXTRACT_SENTENCES", "true").lower() == "true"
+        self.extract_sentences = extract_sentences
+        self.count_tokens = count_tokens or get_token_counter()
+
+        self.requests = 0
+        self.raw_tokens = 0
+        self.packed_tokens = 0
+        self.prompt_tokens = 0
+        self.reported_requests = 0
+        self.reported_prompt_tokens = 0
+
+    def pack(self, query: str, chunks: Sequence[str]) -> Tuple[List[str], Dict[str, Any]]:
+        """
+        Pack ranked chunks for a query.
+
+        Returns:
+            ``(passages, usage)``: the text to send, one passage per chunk that
+            contributed, and token counts for the request.
+        """
+        raw_tokens = sum(self.count_tokens(chunk) for chunk in chunks)
+        kept = self._dedupe(chunks)
+        if self.extract_sentences:
+            passages = self._pick_sentences(query, kept)
+        else:
+            passages = self._pick_chunks(kept)
+
+        packed_tokens = sum(self.count_tokens(passage) for passage in passages)
+        self.requests += 1
+        self.raw_tokens += raw_tokens
+        self.packed_tokens += packed_tokens
+        return passages, {
+            "raw_context_tokens": raw_tokens,
+            "context_tokens": packed_tokens,
+            "budget": self.budget,
+            "chunks_retrieved": len(chunks),
+            "chunks_used": len(passages),
+        }
+
+    def count_messages(self, messages: List[Dict[str, str]]) -> int:
+        """Tokens of a chat request, including per-message formatting."""
+        tokens = sum(self.count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+        self.prompt_tokens += tokens
+        return tokens
+
+    def report_prompt_tokens(self, tokens: int):
+        """Record the prompt size the model reported for a request, to compare with ``count_messages``."""
+        self.reported_requests += 1
+        self.reported_prompt_tokens += tokens
+
+    def _dedupe(self, chunks: Sequence[str]) -> List[List[str]]:
+        """Sentences of each chunk, minus text a better-ranked chunk already has."""
+        seen = set()
+        kept_text: List[str] = []
+        result = []
+        for chunk in chunks:
+            for other in kept_text:
+                chunk = strip_overlap(chunk, other)
+            sentences = []
+            for sentence in split_sentences(chunk):
+                key = " ".join(tokenize(sentence))
+                if key and key not in seen:
+                    seen.add(key)
+                    sentences.append(sentence)
+            result.append(sentences)
+            kept_text.append(chunk)
+        return result
+
+    def _pick_sentences(self, query: str, chunks: List[List[str]]) -> List[str]:
+        terms = set(query_terms(query))
+        candidates = []
+        for rank, sentences in enumerate(chunks):
+            for position, sentence in enumerate(sentences):
+                matches = len(terms.intersection(tokenize(sentence)))
+                candidates.append((-matches, rank, position, sentence))
+        candidates.sort(key=lambda candidate: candidate[:3])
+
+        remaining = self.budget
+        picked: Dict[int, List[int]] = {}
+        for _, rank, position, sentence in candidates:
+            tokens = self.count_tokens(sentence)
+            if tokens <= remaining:
+                picked.setdefault(rank, []).append(position)
+                remaining -= tokens
+        if not picked and candidates:
+            # Not even the best sentence fits: send the start of it
+            return [self._truncate(candidates[0][3], self.budget)]
+
+        passages = []
+        for rank in sorted(picked):
+            positions = sorted(picked[rank])
+            parts = [chunks[rank][positions[0]]]
+            for previous, position in zip(positions, positions[1:]):
+                parts.append(chunks[rank][position] if position == previous + 1 else "… " + chunks[rank][position])
+            passages.append(" ".join(parts))
+        return passages
+
+    def _pick_chunks(self, chunks: List[List[str]]) -> List[str]:
+        remaining = self.budget
+        passages = []
+        for sentences in chunks:
+            if not sentences:
+                continue
+            text = " ".join(sentences)
+            tokens = self.count_tokens(text)
+            if tokens > remaining:
+                if remaining > 0:
+                    passages.append(self._truncate(text, remaining))
+                break
+            passages.append(text)
+            remaining -= tokens
+        return passages
+
+    def _truncate(self, text: str, budget: int) -> str:
+        """Cut text at a word boundary so it fits within ``budget`` tokens."""
+        words = text.split(" ")
+        low, high = 0, len(words)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(" ".join(words[:middle])) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        return " ".join(words[:low]) + " …"
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Token counts across all packed requests."""
+        return {
+            "budget": self.budget,
+            "requests": self.requests,
+            "avg_context_tokens": round(self.packed_tokens / self.requests, 1) if self.requests else None,
+            "avg_prompt_tokens": round(self.prompt_tokens / self.requests, 1) if self.requests else None,
+            "avg_reported_prompt_tokens": (round(self.reported_prompt_tokens / self.reported_requests, 1)
+                                           if self.reported_requests else None),
+            "context_tokens_saved": self.raw_tokens - self.packed_tokens,
+        }
@@ -0,0 +1,318 @@
+import asyncio
+import importlib.util
+import math
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .batching import MicroBatcher
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def dense_available() -> bool:
+    """Check whether faiss and sentence-transformers are installed."""
+    return all(importlib.util.find_spec(name) is not None for name in ("faiss", "sentence_transformers"))
+
+
+_models: Dict[str, object] = {}
+_models_lock = threading.Lock()
+
+
+def load_embedding_model(model_name: str):
+    """Load a sentence-transformers model once per process; every retriever shares it."""
+    with _models_lock:
+        if model_name not in _models:
+            from sentence_transformers import SentenceTransformer
+            _models[model_name] = SentenceTransformer(model_name, device="cpu")
+            print(f"✅ Loaded embedding model: {model_name}")
+        return _models[model_name]
+
+
+def encode(model, texts: Sequence[str], batch_size: int = 64) -> np.ndarray:
+    """Embed texts with a sentence-transformers model into L2-normalized float32 vectors."""
+    return model.encode(
+        list(texts),
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False
+    ).astype(np.float32)
+
+
+_query_batchers: Dict[str, MicroBatcher] = {}
+
+
+def query_batcher(model_name: str) -> MicroBatcher:
+    """The process-wide batcher for query embeddings with a model; concurrent requests share forward passes."""
+    with _models_lock:
+        if model_name not in _query_batchers:
+            _query_batchers[model_name] = MicroBatcher(
+                lambda texts: list(encode(load_embedding_model(model_name), texts)),
+                max_batch=int(os.getenv("EMBED_BATCH_MAX_SIZE", 32)),
+                max_wait=float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", 5)) / 1000,
+            )
+        return _query_batchers[model_name]
+
+
+def get_batcher_stats() -> Dict[str, Dict]:
+    """Figures of every query batcher, by model."""
+    with _models_lock:
+        return {name: batcher.get_stats() for name, batcher in _query_batchers.items()}
+
+
+class DenseRetriever:
+    """
+    Embedding-based retriever backed by a FAISS index.
+
+    Chunks are embedded in batches with a local sentence-transformers model and
+    searched by cosine similarity. Small corpora use an exact flat index; once
+    the corpus grows past ``flat_max`` vectors the index is rebuilt as HNSW or
+    IVF. Raw vectors are kept so the index can be rebuilt without re-embedding;
+    they live in a buffer that doubles when full, so adding a batch only
+    copies the batch.
+    Queries embedded through ``embed_query`` are micro-batched with other
+    concurrent queries for the same model.
+    """
+
+    def __init__(self, model_name: Optional[str] = None, index_type: Optional[str] = None,
+                 flat_max: Optional[int] = None, batch_size: int = 64,
+                 encoder: Optional[Callable[[List[str]], np.ndarray]] = None):
+        """
+        Initialize the retriever. The embedding model is loaded on first use.
+
+        Args:
+            model_name: sentence-transformers model name or path
+            index_type: Approximate index used above ``flat_max`` ("hnsw" or "ivf")
+            flat_max: Largest corpus served by the exact flat index
+            batch_size: Embedding batch size
+            encoder: Optional callable mapping texts to an (n, dim) array, used
+                instead of a sentence-transformers model
+        """
+        self.model_name = model_name or os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+        self.index_type = (index_type or os.getenv("DENSE_INDEX_TYPE", "hnsw")).lower()
+        self.flat_max = flat_max or int(os.getenv("DENSE_FLAT_MAX", 20000))
+        self.batch_size = batch_size
+        self.encoder = encoder
+
+        # Row buffers with room to grow; the first ``_size`` rows are in use
+        self._ids = np.empty(0, dtype=np.int64)
+        self._vectors: Optional[np.ndarray] = None
+        self._size = 0
+        self.deleted = set()
+
+        self._model = None
+        self._index = None
+        self._index_kind = None
+        self._lock = threading.Lock()
+        self._batcher: Optional[MicroBatcher] = None
+
+    def __len__(self) -> int:
+        return len(self.ids) - len(self.deleted)
+
+    def __getstate__(self):
+        # Snapshots keep the vectors only; the model and FAISS index are rebuilt on load
+        state = self.__dict__.copy()
+        del state["_ids"], state["_vectors"], state["_size"]
+        state.update(ids=self.ids, vectors=self.vectors,
+                     _model=None, _index=None, _index_kind=None, _lock=None, encoder=None, _batcher=None)
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        ids, vectors = state.pop("ids"), state.pop("vectors")
+        self.__dict__.update(state)
+        self._set_rows(ids, vectors)
+        self._lock = threading.Lock()
+        self._batcher = None
+
+    @property
+    def ids(self) -> np.ndarray:
+        """Chunk id of every stored vector, in increasing order."""
+        return self._ids[:self._size]
+
+    @property
+    def vectors(self) -> Optional[np.ndarray]:
+        """Every stored vector (a view of the buffer), or ``None`` before the first one."""
+        return None if self._vectors is None else self._vectors[:self._size]
+
+    def _set_rows(self, ids: np.ndarray, vectors: Optional[np.ndarray]):
+        self._ids = np.asarray(ids, dtype=np.int64)
+        self._vectors = vectors
+        self._size = len(self._ids)
+
+    def _append_rows(self, ids: np.ndarray, vectors: np.ndarray):
+        needed = self._size + len(ids)
+        if self._vectors is None or needed > len(self._vectors):
+            capacity = max(needed, 2 * self._size, 1024)
+            grown_ids = np.empty(capacity, dtype=np.int64)
+            grown = np.empty((capacity, vectors.shape[1]), dtype=np.float32)
+            grown_ids[:self._size] = self.ids
+            if self._vectors is not None:
+                grown[:self._size] = self.vectors
+            self._ids, self._vectors = grown_ids, grown
+        self._ids[self._size:needed] = ids
+        self._vectors[self._size:needed] = vectors
+        self._size = needed
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the vector buffer and the FAISS index's copy of the vectors."""
+        if self._vectors is None:
+            return 0
+        return self._vectors.nbytes + self._ids.nbytes + self.vectors.nbytes
+
+    @property
+    def model(self):
+        """The sentence-transformers model, loaded lazily."""
+        if self._model is None:
+            self._model = load_embedding_model(self.model_name)
+        return self._model
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed texts in batches into L2-normalized float32 vectors."""
+        if self.encoder is not None:
+            vectors = np.asarray(self.encoder(list(texts)), dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            return vectors / np.maximum(norms, 1e-12)
+
+        return encode(self.model, texts, self.batch_size)
+
+    @property
+    def batcher(self) -> MicroBatcher:
+        """Batcher for query embeddings; shared per model unless a custom encoder is set."""
+        if self._batcher is None:
+            if self.encoder is None:
+                self._batcher = query_batcher(self.model_name)
+            else:
+                self._batcher = MicroBatcher(lambda texts: list(self.embed(texts)))
+        return self._batcher
+
+    async def embed_query(self, query: str) -> np.ndarray:
+        """Embed one query, batched with whatever other queries arrive at the same time."""
+        return await self.batcher.submit(query)
+
+    def _wanted_kind(self, size: int) -> str:
+        return "flat" if size <= self.flat_max else self.index_type
+
+    def _build_index(self):
+        """(Re)build the FAISS index over all stored vectors."""
+        import faiss
+
+        dim = self.vectors.shape[1]
+        kind = self._wanted_kind(len(self.ids))
+        if kind == "flat":
+            base = faiss.IndexFlatIP(dim)
+        elif kind == "ivf":
+            nlist = max(1, int(4 * math.sqrt(len(self.ids))))
+            quantizer = faiss.IndexFlatIP(dim)
+            base = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            base.train(self.vectors)
+            base.nprobe = max(1, nlist // 16)
+        elif kind == "hnsw":
+            base = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+            base.hnsw.efSearch = 64
+        else:
+            raise ValueError(f"Unknown dense index type '{kind}'")
+
+        index = faiss.IndexIDMap2(base)
+        index.add_with_ids(self.vectors, self.ids)
+        self._index = index
+        self._index_kind = kind
+
+    def add_many(self, start_id: int, texts: Iterable[str], known: Optional[Dict[int, int]] = None):
+        """
+        Embed and index consecutive chunks, numbering them from ``start_id``.
+
+        ``known`` maps positions in ``texts`` to indexed chunks with the same
+        text, whose vectors are copied instead of embedding the text again.
+        """
+        texts = list(texts)
+        if not texts:
+            return
+        vectors = None
+        if known and self.vectors is not None and len(self.ids):
+            offsets = np.array(list(known), dtype=np.int64)
+            wanted = np.array(list(known.values()), dtype=np.int64)
+            with self._lock:
+                # Chunk ids are added in increasing order and remapping keeps it that way
+                rows = np.minimum(np.searchsorted(self.ids, wanted), len(self.ids) - 1)
+                found = self.ids[rows] == wanted
+                copied = self.vectors[rows[found]]
+            if found.any():
+                vectors = np.empty((len(texts), self.vectors.shape[1]), dtype=np.float32)
+                vectors[offsets[found]] = copied
+                missing = np.setdiff1d(np.arange(len(texts)), offsets[found])
+                if len(missing):
+                    vectors[missing] = self.embed([texts[offset] for offset in missing])
+        if vectors is None:
+            vectors = self.embed(texts)
+        ids = np.arange(start_id, start_id + len(texts), dtype=np.int64)
+
+        with self._lock:
+            self._append_rows(ids, vectors)
+            if self._index is None or self._index_kind != self._wanted_kind(len(self.ids)):
+                self._build_index()
+            else:
+                self._index.add_with_ids(vectors, ids)
+
+    def remove(self, chunk_id: int, text: Optional[str] = None):
+        """Hide a chunk from results; it is dropped for good on the next ``remap``."""
+        self.deleted.add(chunk_id)
+
+    def remap(self, id_map: Dict[int, int]):
+        """Keep only the chunks in ``id_map`` and renumber them, e.g. after compaction."""
+        with self._lock:
+            keep = np.array([chunk_id in id_map for chunk_id in self.ids.tolist()], dtype=bool)
+            self._set_rows([id_map[chunk_id] for chunk_id in self.ids[keep].tolist()],
+                           self.vectors[keep] if self.vectors is not None else None)
+            self.deleted.clear()
+            self._index = None
+            if len(self.ids):
+                self._build_index()
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """
+        Find the chunks closest to the query.
+
+        Returns:
+            List of ``(chunk_id, cosine_similarity)`` pairs, best first.
+        """
+        if not len(self):
+            return []
+        return self.search_vector(self.embed([query])[0], top_k)
+
+    async def search_async(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """``search`` with the query embedding micro-batched; the index lookup runs in a thread."""
+        if not len(self):
+            return []
+        vector = await self.embed_query(query)
+        return await asyncio.to_thread(self.search_vector, vector, top_k)
+
+    def search_vector(self, query_vector: np.ndarray, top_k: int = 5) -> List[Tuple[int, float]]:
+        """``search`` for an already embedded query."""
+        if not len(self):
+            return []
+        query_vector = np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+        with self._lock:
+            if self._index is None:
+                self._build_index()
+            # Over-fetch so deleted chunks don't leave the result short
+            k = min(top_k + len(self.deleted), len(self.ids))
+            scores, ids = self._index.search(query_vector, k)
+
+        hits = [
+            (int(chunk_id), float(score))
+            for chunk_id, score in zip(ids[0], scores[0])
+            if chunk_id != -1 and chunk_id not in self.deleted
+        ]
+        return hits[:top_k]
+
+    def clear(self):
+        """Remove all vectors."""
+        with self._lock:
+            self._set_rows(np.empty(0, dtype=np.int64), None)
+            self.deleted.clear()
+            self._index = None
+            self._index_kind = None
@@ -1,223 +1,601 @@
 import os
 import asyncio
+import codecs
+import hashlib
+import time
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 import numpy as np
-import PyPDF2
-import io
-import re
-import openai
-from openai import AsyncOpenAI
+
+from . import ingest, llm, metrics
+from .cache import AnswerCache, normalize_query
+from .context import ContextPacker
+from .dense import DenseRetriever, dense_available
+from .index import InvertedIndex, query_terms
+from .pipeline import CrossEncoderReranker, RetrievalPipeline, parse_budgets
+from .store import ChunkStore, DocumentRecord
 
 class RoomRAG:
     """
     Room's RAG (Retrieval-Augmented Generation) engine - OpenAI-powered version.
     """
     
-    def __init__(self):
-        """Initialize the RAG engine."""
-        self.storage_path = Path("room_rag/storage")
+    # Snapshot the index after this many chunks have been added since the last one
+    INDEX_SNAPSHOT_EVERY = 2000
+    # Compact the chunk store once this fraction of it belongs to deleted documents
+    COMPACT_THRESHOLD = 0.3
+    # Text uploads are read and chunked this many bytes at a time
+    READ_BLOCK_SIZE = 1024 * 1024
+    # Chunks tokenized and embedded per batch while indexing a document
+    INDEX_BATCH_SIZE = 256
+    
+    def __init__(self, storage_path: str = "room_rag/storage", ingest_pool: Optional[ingest.IngestPool] = None,
+                 readonly: bool = False):
+        """
+        Initialize the RAG engine.
+        
+        Args:
+            storage_path: Directory holding this engine's chunk store and index snapshots
+            ingest_pool: Parsing pool shared with other engines; one is created if omitted
+            readonly: Serve queries only, from storage another process writes to;
+                call ``refresh`` to pick up its changes
+        """
+        self.storage_path = Path(storage_path)
         self.storage_path.mkdir(parents=True, exist_ok=True)
         
-        # Document storage
-        self.documents = []
-        self.text_chunks = []
+        # Document storage (persisted and memory-mapped, survives restarts)
+        self.readonly = readonly
+        self.store = ChunkStore(self.storage_path, readonly=readonly)
+        self.text_chunks = self.store
+        self.index = self._restore_index("index", InvertedIndex)
+        self._chunks_since_snapshot = 0
+        # Set while the indexes may lag the store (a refresh failed part way)
+        self._stale = False
+        # Parsed PDFs by upload hash, so identical bytes are never parsed twice
+        self.parse_cache = ingest.ParseCache(self.storage_path / "parse_cache")
+        # Serializes appends to the chunk store; a streamed upload holds it until indexed.
+        # Created on first use so it belongs to the serving event loop.
+        self._write_lock: Optional[asyncio.Lock] = None
+        
+        # CPU-bound parsing runs in worker processes, off the event loop
+        self._owns_ingest_pool = ingest_pool is None
+        self.ingest_pool = ingest_pool or ingest.IngestPool()
+        
+        # Retrieval mode: "lexical" (BM25), "dense" (FAISS over local embeddings)
+        # or "hybrid" (both, fused and optionally reranked)
+        self.retriever = os.getenv("RAG_RETRIEVER", "lexical").lower()
+        self.dense = None
+        self.pipeline = None
+        # Retrieved chunks are packed into a token budget before they reach the model
+        self.context_packer = ContextPacker()
+        if self.retriever in ("dense", "hybrid"):
+            if dense_available():
+                self.dense = self._restore_index("dense", DenseRetriever)
+            else:
+                print("⚠️  faiss/sentence-transformers not installed. Falling back to lexical retrieval.")
+                self.retriever = "lexical"
+        if self.retriever == "hybrid":
+            self.pipeline = self._build_pipeline()
         
-        # OpenAI client
-        self.openai_client = None
+        # Answers are cached per corpus version; any change to the corpus bumps it
+        self.corpus_version = 0
+        semantic_cache = os.getenv("ANSWER_CACHE_SEMANTIC", "true").lower() == "true"
+        self.answer_cache = AnswerCache(
+            embed=self.dense.embed if self.dense is not None and semantic_cache else None
+        )
+        
+        # OpenAI client (shared with every engine using the same key)
+        self.llm: Optional[llm.LLMClient] = None
         self.model = "gpt-4o-mini"  # Default model
         self.base_url = None
         
         # Initialize OpenAI if API key is available
         self._init_openai()
         
-        print("RAG engine initialized (OpenAI-powered mode)")
+        print(f"RAG engine initialized (OpenAI-powered mode) with {len(self.documents)} stored documents")
+    
+    @property
+    def documents(self) -> List[DocumentRecord]:
+        """Metadata of all stored documents."""
+        return list(self.store.documents.values())
+    
+    def _build_pipeline(self) -> RetrievalPipeline:
+        """Build the hybrid lexical + dense retrieval pipeline."""
+        reranker = None
+        if os.getenv("RAG_RERANKER", "false").lower() == "true":
+            # Candidates of concurrent requests are scored in shared forward passes
+            reranker = CrossEncoderReranker().score
+        
+        return RetrievalPipeline(
+            retrievers={
+                "lexical": self._lexical_search,
+                "dense": self._dense_search
+            },
+            get_text=self.text_chunks.__getitem__,
+            reranker=reranker,
+            budgets=parse_budgets(os.getenv("RAG_STAGE_BUDGETS", "lexical=100,dense=250,rerank=400")),
+            candidates=int(os.getenv("RAG_CANDIDATES", 20))
+        )
+    
+    def _restore_index(self, name: str, factory):
+        """Load the last snapshot of an index and replay any log records written after it."""
+        index, applied = self.store.load_index(name)
+        if index is None:
+            index = factory()
+        
+        self._replay(index, self.store.records[applied:])
+        
+        if applied < len(self.store.records) and not self.readonly:
+            self.store.save_index(index, name)
+        return index
+    
+    def _replay(self, index, records):
+        """Apply logged document additions and deletions to an index."""
+        for op, doc in records:
+            if op == "add":
+                index.add_many(doc.first_chunk, self.store[doc.first_chunk:doc.first_chunk + doc.chunk_count])
+            else:
+                for chunk_id in doc.chunk_ids:
+                    index.remove(chunk_id, self.store[chunk_id])
+    
+    def needs_refresh(self) -> bool:
+        """Whether ``refresh`` has anything to pick up."""
+        return self._stale or self.store.changed()
+    
+    def refresh(self) -> bool:
+        """
+        Pick up documents another process committed to this engine's storage.
+        
+        New log records are replayed into the in-memory indexes; after a
+        compaction or clear by the writer, the indexes are rebuilt from its
+        snapshots. The indexes are changed in place, so callers make sure no
+        query is using the engine meanwhile. If replaying fails, the engine
+        is marked stale and the next refresh rebuilds both indexes from the
+        store. Returns whether anything changed.
+        """
+        if not self.needs_refresh():
+            return False
+        stale, self._stale = self._stale, True
+        applied = len(self.store.records)
+        if self.store.refresh() and not stale:
+            self._replay(self.index, self.store.records[applied:])
+            if self.dense is not None:
+                self._replay(self.dense, self.store.records[applied:])
+        else:
+            # Build both indexes before swapping either in
+            index = self._restore_index("index", InvertedIndex)
+            dense = self._restore_index("dense", DenseRetriever) if self.dense is not None else None
+            self.index, self.dense = index, dense
+        self._stale = False
+        self.corpus_version += 1
+        return True
+    
+    @property
+    def write_lock(self) -> asyncio.Lock:
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        return self._write_lock
+    
+    def _check_writable(self):
+        if self.readonly:
+            raise PermissionError("This engine is read-only; changes are made by the writer process")
     
     def _init_openai(self):
-        """Initialize OpenAI client if API key is available."""
+        """Use the shared OpenAI client if an API key is configured."""
         api_key = os.getenv("OPENAI_API_KEY")
-        base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
-        
         if api_key:
-            try:
-                # Create client with proper configuration
-                if base_url != "https://api.openai.com/v1":
-                    # For custom base URLs, use specific configuration
-                    self.openai_client = AsyncOpenAI(
-                        api_key=api_key,
-                        base_url=base_url,
-                        max_retries=3
-                    )
-                    self.base_url = base_url
-                    # Use provider prefix for a4f.co
-                    if "a4f.co" in base_url:
-                        self.model = "provider-3/gpt-4o-mini"
-                else:
-                    # For standard OpenAI, use default configuration
-                    self.openai_client = AsyncOpenAI(api_key=api_key)
-                    self.model = "gpt-4o-mini"
-                
-                print(f"✅ OpenAI client initialized successfully with base URL: {base_url}")
-                print(f"✅ Using model: {self.model}")
-            except Exception as e:
-                print(f"❌ Failed to initialize OpenAI client: {e}")
-                self.openai_client = None
+            self._configure_llm(api_key, os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"))
         else:
             print("⚠️  No OpenAI API key found. Using basic mode.")
-            self.openai_client = None
+            self.llm = None
     
-    def extract_text_from_pdf(self, content: bytes) -> str:
-        """Extract text content from PDF bytes."""
+    def _ensure_llm(self):
+        """Pick up an API key that was put in the environment after startup."""
+        if self.llm is None and os.getenv("OPENAI_API_KEY"):
+            self._init_openai()
+    
+    def _configure_llm(self, api_key: str, base_url: str) -> bool:
+        """Point this engine at the process-wide client for a key and base URL."""
         try:
-            pdf_file = io.BytesIO(content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            
-            text_content = []
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                page_text = page.extract_text()
-                if page_text.strip():
-                    text_content.append(f"Page {page_num + 1}: {page_text.strip()}")
+            # Engines share one client (and its connection pool and limits) per key and URL
+            self.llm = llm.shared_client(api_key, base_url)
+            if base_url != "https://api.openai.com/v1":
+                self.base_url = base_url
+                # Use provider prefix for a4f.co
+                if "a4f.co" in base_url:
+                    self.model = "provider-3/gpt-4o-mini"
+            else:
+                self.model = "gpt-4o-mini"
             
-            return "\n\n".join(text_content)
+            print(f"✅ OpenAI client initialized successfully with base URL: {base_url}")
+            print(f"✅ Using model: {self.model}")
+            return True
         except Exception as e:
-            print(f"Error extracting PDF text: {e}")
-            return ""
+            print(f"❌ Failed to initialize OpenAI client: {e}")
+            self.llm = None
+            return False
+    
+    def extract_text_from_pdf(self, content: bytes) -> str:
+        """Extract text content from PDF bytes."""
+        return ingest.extract_text_from_pdf(content)
     
     def clean_text(self, text: str) -> str:
         """Clean and normalize text content."""
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text)
-        # Remove PDF artifacts
-        text = re.sub(r'%PDF.*?endobj', '', text)
-        text = re.sub(r'obj.*?endobj', '', text)
-        # Clean up
-        text = text.strip()
-        return text
-    
-    def chunk_text(self, text: str, chunk_size: int = 2000) -> List[str]:
+        return ingest.clean_text(text)
+    
+    def chunk_text(self, text: str, chunk_size: Optional[int] = None) -> List[str]:
         """Split text into manageable chunks for better processing."""
-        words = text.split()
-        chunks = []
-        current_chunk = []
-        current_size = 0
-        
-        for word in words:
-            if current_size + len(word) + 1 > chunk_size and current_chunk:
-                chunks.append(' '.join(current_chunk))
-                current_chunk = [word]
-                current_size = len(word)
-            else:
-                current_chunk.append(word)
-                current_size += len(word) + 1
+        return ingest.chunk_text(text, chunk_size)
+
+    async def process_document(self, file, progress=None, replace: Optional[str] = None) -> str:
+        """
+        Process an uploaded document.
         
-        if current_chunk:
-            chunks.append(' '.join(current_chunk))
+        Uploads are identified by the SHA-256 of their bytes: a file that is
+        already stored is skipped. An upload is only a new version of a
+        stored document when ``replace`` names it; that document is deleted
+        once the upload is stored, and chunks the versions have in common
+        keep their embeddings instead of being embedded again. Otherwise the
+        upload is added next to any document with the same filename.
         
-        return chunks
-
-    async def process_document(self, file) -> str:
-        """Process an uploaded document."""
+        Args:
+            file: Upload with a ``filename`` and an async ``read(size)``
+            progress: Optional callback receiving ``pages_total``, ``pages_parsed``
+                and ``chunks`` keyword updates
+            replace: Id of the stored document this upload is a new version of
+        """
+        progress = progress or (lambda **fields: None)
+        self._check_writable()
+        if replace is not None and replace not in self.store.documents:
+            raise KeyError(f"Unknown document '{replace}'")
         try:
-            # Read file content
-            content = await file.read()
-            
             if hasattr(file, 'filename'):
                 filename = file.filename
             else:
                 filename = "unknown.txt"
             
-            # Extract text based on file type
-            if filename.lower().endswith('.pdf'):
-                raw_text = self.extract_text_from_pdf(content)
-                if not raw_text:
-                    return f"Error: Could not extract text from PDF '{filename}'. The file might be corrupted or image-based."
-            else:
-                # For text files
-                raw_text = content.decode('utf-8', errors='ignore')
+            async with self.ingest_pool.slot():
+                # Extract text based on file type
+                if filename.lower().endswith('.pdf'):
+                    result = await self._ingest_pdf(file, filename, progress, replace)
+                else:
+                    # Text files are streamed, never held in memory whole
+                    result = await self._ingest_text(file, filename, progress, replace)
             
-            # Clean the text
-            cleaned_text = self.clean_text(raw_text)
-            if not cleaned_text or len(cleaned_text) < 50:
+            if isinstance(result, str):
+                return result
+            if result is None:
                 return f"Warning: Document '{filename}' appears to contain very little readable text. It might be an image-based PDF or corrupted file."
             
-            # Create text chunks
-            chunks = self.chunk_text(cleaned_text)
+            doc_info, previous, reused = result
+            chunk_count = doc_info.chunk_count
+            progress(chunks=chunk_count)
+            self.corpus_version += 1
             
-            # Store document
-            doc_info = {
-                    "filename": filename,
-                "content": cleaned_text,
-                "chunks": chunks,
-                "size": len(content),
-                "chunk_count": len(chunks)
-            }
-            
-            self.documents.append(doc_info)
-            self.text_chunks.extend(chunks)
+            self._chunks_since_snapshot += chunk_count
+            if self._chunks_since_snapshot >= self.INDEX_SNAPSHOT_EVERY:
+                self.save_index()
             
-            return f"Document '{filename}' processed successfully! Extracted {len(chunks)} text chunks."
+            if previous is not None and previous.doc_id in self.store.documents:
+                self.delete_document(previous.doc_id)
+                return (f"Document '{filename}' updated successfully! "
+                        f"{chunk_count - reused} of {chunk_count} text chunks changed.")
+            return f"Document '{filename}' processed successfully! Extracted {chunk_count} text chunks."
             
+        except ingest.IngestBusyError:
+            raise
         except Exception as e:
             raise Exception(f"Error processing document: {str(e)}")
-
-    def find_relevant_chunks(self, query: str, top_k: int = 5) -> List[str]:
-        """Find the most relevant text chunks for a query using improved relevance scoring."""
-        query_lower = query.lower()
-        query_words = set(query_lower.split())
-        
-        # Remove common stop words for better matching
-        stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should', 'may', 'might', 'can', 'this', 'that', 'these', 'those', 'what', 'when', 'where', 'why', 'how', 'who', 'which'}
-        query_words = query_words - stop_words
-        
-        if not query_words:
-            return self.text_chunks[:top_k]
-        
-        # Calculate relevance scores
-        chunk_scores = []
-        for i, chunk in enumerate(self.text_chunks):
-            chunk_lower = chunk.lower()
-            chunk_words = set(chunk_lower.split())
-            
-            # Calculate multiple relevance factors
-            common_words = query_words.intersection(chunk_words)
-            word_overlap_score = len(common_words) / max(len(query_words), 1)
-            
-            # Phrase matching (exact phrase matches get higher scores)
-            phrase_score = 0
-            for word in query_words:
-                if word in chunk_lower:
-                    phrase_score += 1
-            
-            # Position bonus (chunks with query words near the beginning get higher scores)
-            position_bonus = 0
-            for word in query_words:
-                if word in chunk_lower:
-                    word_pos = chunk_lower.find(word)
-                    if word_pos < len(chunk) * 0.3:  # First 30% of chunk
-                        position_bonus += 0.2
+    
+    def _find_duplicate(self, content_hash: str) -> Optional[DocumentRecord]:
+        """A stored document whose upload had exactly these bytes."""
+        return next((doc for doc in self.documents if doc.extra.get("content_hash") == content_hash), None)
+    
+    @staticmethod
+    def _duplicate_message(filename: str, duplicate: DocumentRecord) -> str:
+        if duplicate.filename == filename:
+            return f"Document '{filename}' is already uploaded and unchanged. Skipped."
+        return f"Document '{filename}' is identical to '{duplicate.filename}', which is already uploaded. Skipped."
+    
+    async def _ingest_pdf(self, file, filename: str, progress, replace: Optional[str] = None):
+        """
+        Extract, chunk and index a PDF.
+        
+        Returns:
+            ``(record, replaced, reused_chunks)`` once stored, None if there is
+            too little text, or a message saying why nothing was stored.
+        """
+        with metrics.stage("read"):
+            content = await file.read()
+        content_hash = hashlib.sha256(content).hexdigest()
+        duplicate = self._find_duplicate(content_hash)
+        if duplicate is not None:
+            return self._duplicate_message(filename, duplicate)
+        
+        # The cache holds the extracted text, so chunking settings can change between uploads
+        with metrics.stage("extract"):
+            parsed = await asyncio.to_thread(self.parse_cache.get, content_hash)
+            if parsed is not None and "text" in parsed:
+                raw_text = parsed["text"]
+                progress(pages_total=parsed["pages_total"], pages_parsed=parsed["pages_total"])
+            else:
+                pages_total = 0
+                
+                def track(**fields):
+                    nonlocal pages_total
+                    pages_total = fields.get("pages_total", pages_total)
+                    progress(**fields)
+                
+                raw_text = await self.ingest_pool.extract_pdf(content, track)
+                if not raw_text:
+                    return f"Error: Could not extract text from PDF '{filename}'. The file might be corrupted or image-based."
+                await asyncio.to_thread(self.parse_cache.put, content_hash, {"text": raw_text, "pages_total": pages_total})
+        
+        # Clean, chunk and tokenize the text in a worker
+        chars, chunks, analyses, seconds = await self.ingest_pool.run(ingest.prepare_text, raw_text, True)
+        for name, elapsed in seconds.items():
+            metrics.observe(name, elapsed)
+        if chars < ingest.MIN_TEXT_CHARS:
+            return None
+        preview = chunks[0].text[:100] + "..." if chars > 100 else chunks[0].text
+        
+        async with self.write_lock:
+            # An identical upload may have been stored while this one was parsed
+            duplicate = self._find_duplicate(content_hash)
+            if duplicate is not None:
+                return self._duplicate_message(filename, duplicate)
+            # None if the document to replace was deleted while this upload was parsed
+            previous = self.store.documents.get(replace) if replace is not None else None
+            with metrics.stage("index"):
+                doc_info = self.store.add_document({
+                    "filename": filename,
+                    "size": len(content),
+                    "preview": preview,
+                    "content_hash": content_hash,
+                }, [chunk.text for chunk in chunks], [chunk.page for chunk in chunks],
+                    [chunk.char_start for chunk in chunks])
+                reused = await self._index_document(doc_info, analyses, previous)
+        return doc_info, previous, reused
+    
+    async def _ingest_text(self, file, filename: str, progress, replace: Optional[str] = None):
+        """
+        Stream a text upload into the store block by block.
+        
+        Blocks are decoded incrementally and cleaned/chunked in a worker, and
+        finished chunks go straight to the chunk store, so memory use is
+        bounded by the block size rather than the file size. The upload is
+        hashed on the way; a duplicate is discarded before it is committed.
+        
+        Returns:
+            Same as ``_ingest_pdf``.
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        stream = ingest.TextStream()
+        digest = hashlib.sha256()
+        size = 0
+        preview = None
+        # Reading, cleaning/chunking and storing interleave block by block; their times add up
+        read_seconds = store_seconds = 0.0
+        
+        async with self.write_lock:
+            writer = self.store.writer()
+            try:
+                final = False
+                while not final:
+                    start = time.perf_counter()
+                    block = await file.read(self.READ_BLOCK_SIZE)
+                    read_seconds += time.perf_counter() - start
+                    final = not block
+                    size += len(block)
+                    digest.update(block)
+                    text = decoder.decode(block, final=final)
+                    stream, chunks = await self.ingest_pool.run(ingest.prepare_block, stream, text, final)
+                    start = time.perf_counter()
+                    for chunk in chunks:
+                        writer.append(chunk.text, chunk.page, chunk.char_start)
+                    store_seconds += time.perf_counter() - start
+                    if preview is None and chunks:
+                        preview = chunks[0].text[:100] + "..." if stream.chars > 100 else chunks[0].text
+                    progress(chunks=len(writer))
+                progress(pages_total=1, pages_parsed=1)
+                metrics.observe("read", read_seconds)
+                for name, elapsed in stream.seconds.items():
+                    metrics.observe(name, elapsed)
+                
+                content_hash = digest.hexdigest()
+                duplicate = self._find_duplicate(content_hash)
+                if duplicate is not None:
+                    writer.abort()
+                    return self._duplicate_message(filename, duplicate)
+                if stream.chars < ingest.MIN_TEXT_CHARS:
+                    writer.abort()
+                    return None
+                previous = self.store.documents.get(replace) if replace is not None else None
+                start = time.perf_counter()
+                doc_info = writer.commit({
+                    "filename": filename,
+                    "size": size,
+                    "preview": preview,
+                    "content_hash": content_hash,
+                })
+            except BaseException:
+                writer.abort()
+                raise
             
-            # Combined score
-            total_score = word_overlap_score * 0.6 + phrase_score * 0.3 + position_bonus
+            reused = await self._index_document(doc_info, previous=previous)
+            metrics.observe("index", store_seconds + time.perf_counter() - start)
+        return doc_info, previous, reused
+    
+    @staticmethod
+    def _chunk_key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+    
+    async def _index_document(self, doc_info: DocumentRecord, analyses: Optional[List] = None,
+                              previous: Optional[DocumentRecord] = None) -> int:
+        """
+        Add a committed document to the search indexes in fixed-size batches.
+        
+        Chunks are read back from the store, so a large document's text is
+        never held in memory all at once. Pre-computed ``analyses`` skip the
+        tokenization step. Chunks whose text also occurs in ``previous`` (an
+        earlier version of the document) take their vector from it.
+        
+        Returns:
+            The number of chunks found in ``previous``.
+        """
+        previous_chunks = {}
+        if previous is not None:
+            previous_chunks = {self._chunk_key(self.store[chunk_id]): chunk_id for chunk_id in previous.chunk_ids}
+        reused = 0
+        
+        first_chunk, chunk_count = doc_info.first_chunk, doc_info.chunk_count
+        for start in range(0, chunk_count, self.INDEX_BATCH_SIZE):
+            end = min(start + self.INDEX_BATCH_SIZE, chunk_count)
+            texts = self.store[first_chunk + start:first_chunk + end]
+            if analyses is not None:
+                batch = analyses[start:end]
+            else:
+                batch = await self.ingest_pool.run(ingest.analyze_chunks, texts)
+            for offset, analysis in enumerate(batch):
+                self.index.add_analyzed(first_chunk + start + offset, analysis)
             
-            if total_score > 0:
-                chunk_scores.append((total_score, chunk, i))
+            known = {}
+            if previous_chunks:
+                for offset, text in enumerate(texts):
+                    chunk_id = previous_chunks.get(self._chunk_key(text))
+                    if chunk_id is not None:
+                        known[offset] = chunk_id
+                reused += len(known)
+            if self.dense is not None:
+                # Batched embedding is CPU-heavy, keep it off the event loop
+                await asyncio.to_thread(self.dense.add_many, first_chunk + start, texts, known)
+        return reused
+
+    def find_relevant_chunks(self, query: str, top_k: int = 5) -> List[str]:
+        """Find the most relevant text chunks for a query with the configured retriever."""
+        return [self.text_chunks[chunk_id] for chunk_id, score in self._find_hits(query, top_k)]
+    
+    def _find_hits(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """Run the configured single retriever; returns (chunk_id, score) pairs."""
+        if self.dense is not None and len(self.dense):
+            hits = self.dense.search(query, top_k)
+        else:
+            hits = self._lexical_search(query, top_k)
+        return self._or_first_chunks(query, hits, top_k)
+    
+    def _or_first_chunks(self, query: str, hits: List[Tuple[int, float]], top_k: int) -> List[Tuple[int, float]]:
+        """Fall back to the first chunks for queries made only of stop words."""
+        if not hits and not query_terms(query):
+            chunk_ids = self.store.live_chunk_ids()
+            return [(chunk_id, 0.0) for chunk_id, _ in zip(chunk_ids, range(top_k))]
+        return hits
+    
+    def _lexical_search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """BM25 search over the inverted index; returns (chunk_id, score) pairs."""
+        # Stop words are dropped so they don't dominate matching
+        terms = query_terms(query)
+        if not terms:
+            return []
+        # Only the postings for the query terms are scored
+        return self.index.search(terms, top_k)
+    
+    async def _dense_search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """Dense search with the query embedding batched across concurrent requests."""
+        return await self.dense.search_async(query, top_k)
+    
+    async def retrieve_hits(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """Find relevant (chunk_id, score) pairs, running the hybrid pipeline when it is enabled."""
+        if self.pipeline is None:
+            return await self._find_hits_async(query, top_k)
         
-        # Sort by score and return top chunks
-        chunk_scores.sort(key=lambda x: x[0], reverse=True)
-        return [chunk for score, chunk, idx in chunk_scores[:top_k]]
+        hits, timings = await self.pipeline.retrieve(query, top_k)
+        # Each stage is timed as part of the request that ran it
+        for stage, timing in timings.items():
+            metrics.observe(f"retrieval_{stage}", timing["ms"] / 1000)
+        return hits or await self._find_hits_async(query, top_k)
+    
+    async def _find_hits_async(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """Like ``_find_hits``, but never embeds the query on the event loop."""
+        if self.dense is not None and len(self.dense):
+            return self._or_first_chunks(query, await self._dense_search(query, top_k), top_k)
+        return self._find_hits(query, top_k)
+    
+    async def retrieve(self, query: str, top_k: int = 5) -> List[str]:
+        """Find relevant chunk texts for a query."""
+        return [self.text_chunks[chunk_id] for chunk_id, score in await self.retrieve_hits(query, top_k)]
+    
+    def get_citations(self, hits: List[Tuple[int, float]]) -> List[Dict]:
+        """Describe where each retrieved chunk came from."""
+        citations = []
+        for chunk_id, score in hits:
+            doc = self.store.document_for_chunk(chunk_id)
+            text = self.text_chunks[chunk_id]
+            page = int(self.store.pages[chunk_id])
+            char_start = int(self.store.char_starts[chunk_id])
+            citations.append({
+                "chunk_id": chunk_id,
+                "doc_id": doc.doc_id if doc else None,
+                "filename": doc.filename if doc else None,
+                "page": page or None,
+                "char_start": char_start if char_start >= 0 else None,
+                "char_end": char_start + len(text) if char_start >= 0 else None,
+                "score": round(score, 4),
+                "preview": text[:200] + "..." if len(text) > 200 else text
+            })
+        return citations
     
     async def generate_intelligent_response(self, query: str, relevant_chunks: List[str]) -> str:
         """Generate an intelligent response using OpenAI GPT."""
-        if not self.openai_client or not relevant_chunks:
+        if not self.llm or not relevant_chunks:
             return self._fallback_response(query, relevant_chunks)
         
         try:
-            # Prepare context from relevant chunks
-            context = "\n\n".join([f"Context {i+1}: {chunk}" for i, chunk in enumerate(relevant_chunks)])
-            
-            # Create a comprehensive prompt
-            system_prompt = """You are NEXUS, a sophisticated AI assistant that analyzes documents and provides clear, accurate answers. 
+            return await self._complete(query, relevant_chunks)
+        except Exception as e:
+            print(f"OpenAI API error: {e}")
+            return self._fallback_response(query, relevant_chunks)
+    
+    async def _complete(self, query: str, relevant_chunks: List[str]) -> str:
+        """Generate a response with OpenAI; errors are left to the caller."""
+        with metrics.stage("prompt"):
+            messages, usage = self._build_messages(query, relevant_chunks)
+        self._count_tokens(usage)
+        with metrics.stage("llm"):
+            response = await self.llm.complete(
+                model=self.model,
+                messages=messages,
+                max_tokens=500,
+                temperature=0.7
+            )
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.context_packer.report_prompt_tokens(usage.prompt_tokens)
+            metrics.count_tokens("reported_prompt", usage.prompt_tokens)
+            if getattr(usage, "completion_tokens", None) is not None:
+                metrics.count_tokens("completion", usage.completion_tokens)
+        return response.choices[0].message.content.strip()
+    
+    @staticmethod
+    def _count_tokens(usage: Dict[str, int]):
+        """Record a request's context and prompt size with its other figures (see ``metrics.usage``)."""
+        for kind in ("raw_context", "context", "prompt"):
+            metrics.count_tokens(kind, usage[f"{kind}_tokens"])
+    
+    def _build_messages(self, query: str, relevant_chunks: List[str]) -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+        """
+        Build the chat messages for a query and its retrieved context.
+        
+        Returns:
+            ``(messages, usage)``: the messages and this request's token counts
+            (see ``ContextPacker.pack``, plus ``prompt_tokens``). Totals across
+            requests are kept by ``context_packer``.
+        """
+        # Prepare context from the relevant chunks, trimmed to the token budget
+        passages, usage = self.context_packer.pack(query, relevant_chunks)
+        context = "\n\n".join([f"Context {i+1}: {passage}" for i, passage in enumerate(passages)])
+        
+        # Create a comprehensive prompt
+        system_prompt = """You are NEXUS, a sophisticated AI assistant that analyzes documents and provides clear, accurate answers. 
             
 Your task is to:
 1. Understand the user's question
@@ -228,34 +606,44 @@ Your task is to:
 
 Always base your answers on the document content provided. If you can't find specific information, acknowledge it and suggest what the user might ask instead."""
 
-            user_prompt = f"""User Question: {query}
+        user_prompt = f"""User Question: {query}
 
 Document Context:
 {context}
 
 Please provide a clear, helpful answer based on the document content above. If the specific information isn't available in the context, let the user know and suggest alternative questions they could ask."""
-
-            # Generate response using OpenAI
-            response = await self.openai_client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                max_tokens=500,
-                temperature=0.7
-            )
-            
-            return response.choices[0].message.content.strip()
-            
+        
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        usage["prompt_tokens"] = self.context_packer.count_messages(messages)
+        return messages, usage
+    
+    async def stream_intelligent_response(self, query: str, relevant_chunks: List[str]) -> AsyncIterator[str]:
+        """Stream response text from OpenAI as it is generated."""
+        if not self.llm or not relevant_chunks:
+            async for piece in self._stream_fallback_response(query, relevant_chunks):
+                yield piece
+            return
+        
+        started = False
+        try:
+            async for piece in self._stream_completion(query, relevant_chunks):
+                started = True
+                yield piece
         except Exception as e:
             print(f"OpenAI API error: {e}")
-            return self._fallback_response(query, relevant_chunks)
+            if started:
+                # Part of the answer is already on the wire; let the caller report it
+                raise
+            async for piece in self._stream_fallback_response(query, relevant_chunks):
+                yield piece
     
     def _fallback_response(self, query: str, relevant_chunks: List[str]) -> str:
         """Fallback response when OpenAI is not available."""
         if not relevant_chunks:
-            doc_names = [doc["filename"] for doc in self.documents]
+            doc_names = [doc.filename for doc in self.documents]
             return f"I couldn't find specific information about '{query}' in your documents. However, I have these documents available: {', '.join(doc_names)}. Try asking about specific topics, concepts, or content that might be in these documents."
         
         # Provide a basic but more helpful response
@@ -270,6 +658,107 @@ Please provide a clear, helpful answer based on the document content above. If t
         response += "For more detailed and intelligent answers, please ensure your OpenAI API key is configured."
         return response
     
+    async def _stream_completion(self, query: str, relevant_chunks: List[str]) -> AsyncIterator[str]:
+        """Stream a response from OpenAI; errors are left to the caller."""
+        with metrics.stage("prompt"):
+            messages, usage = self._build_messages(query, relevant_chunks)
+        self._count_tokens(usage)
+        stream = self.llm.stream(
+            model=self.model,
+            messages=messages,
+            max_tokens=500,
+            temperature=0.7
+        )
+        start = time.perf_counter()
+        first = True
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first:
+                        metrics.observe("llm_first_token", time.perf_counter() - start)
+                        first = False
+                    yield chunk.choices[0].delta.content
+        finally:
+            metrics.observe("llm", time.perf_counter() - start)
+    
+    async def _stream_fallback_response(self, query: str, relevant_chunks: List[str]) -> AsyncIterator[str]:
+        """Stream the fallback response line by line, like the model path."""
+        for line in self._fallback_response(query, relevant_chunks).splitlines(keepends=True):
+            yield line
+            # Hand control back so each piece is flushed separately
+            await asyncio.sleep(0)
+    
+    async def stream_response(self, query: str, language: str = "en") -> AsyncIterator[Dict]:
+        """
+        Stream a response as events.
+        
+        Yields ``{"event": "citations", "data": [...]}`` first, then one
+        ``{"event": "token", "data": "..."}`` per piece of generated text.
+        """
+        if not self.documents:
+            yield {"event": "citations", "data": []}
+            yield {"event": "token", "data": "I don't have any documents to work with yet. Please upload some documents first!"}
+            return
+        
+        version = self.corpus_version
+        hits, vector = await self._retrieve_for_cache(query)
+        yield {"event": "citations", "data": self.get_citations(hits)}
+        
+        self._ensure_llm()
+        
+        chunk_ids = [chunk_id for chunk_id, score in hits]
+        cached = self._cache_get(query, chunk_ids, version, vector)
+        if cached is not None:
+            yield {"event": "token", "data": cached}
+            return
+        
+        relevant_chunks = [self.text_chunks[chunk_id] for chunk_id in chunk_ids]
+        pieces = []
+        if self.llm and relevant_chunks:
+            try:
+                async for piece in self._stream_completion(query, relevant_chunks):
+                    pieces.append(piece)
+                    yield {"event": "token", "data": piece}
+            except Exception as e:
+                print(f"OpenAI API error: {e}")
+                if pieces:
+                    raise
+                # Nothing sent yet: fall back, but don't cache the degraded answer
+                async for piece in self._stream_fallback_response(query, relevant_chunks):
+                    yield {"event": "token", "data": piece}
+                return
+        else:
+            async for piece in self._stream_fallback_response(query, relevant_chunks):
+                pieces.append(piece)
+                yield {"event": "token", "data": piece}
+        
+        self._cache_put(query, chunk_ids, version, "".join(pieces).strip(), vector)
+    
+    def _generator(self) -> str:
+        """Identify what produces answers right now, so cached answers don't outlive a model change."""
+        return self.model if self.llm else "fallback"
+    
+    async def _retrieve_for_cache(self, query: str) -> Tuple[List[Tuple[int, float]], Optional[np.ndarray]]:
+        """
+        Retrieve hits and, for near-duplicate cache lookups, embed the query.
+        
+        Both run at once, so with dense retrieval the two query embeddings
+        share one batched forward pass.
+        """
+        with metrics.stage("retrieval"):
+            if self.answer_cache.embed is None:
+                return await self.retrieve_hits(query), None
+            hits, vector = await asyncio.gather(self.retrieve_hits(query), self.dense.embed_query(normalize_query(query)))
+        return hits, vector
+    
+    def _cache_get(self, query: str, chunk_ids: List[int], version: int,
+                   vector: Optional[np.ndarray] = None) -> Optional[str]:
+        return self.answer_cache.get(query, chunk_ids, version, self._generator(), vector)
+    
+    def _cache_put(self, query: str, chunk_ids: List[int], version: int, answer: str,
+                   vector: Optional[np.ndarray] = None):
+        self.answer_cache.put(query, chunk_ids, version, self._generator(), answer, vector)
+    
     async def get_response(self, query: str, language: str = "en") -> str:
         """Get an intelligent response based on the query and stored documents."""
         try:
@@ -277,25 +766,33 @@ Please provide a clear, helpful answer based on the document content above. If t
                 return "I don't have any documents to work with yet. Please upload some documents first!"
             
             # Find relevant content
-            relevant_chunks = self.find_relevant_chunks(query)
+            version = self.corpus_version
+            hits, vector = await self._retrieve_for_cache(query)
+            chunk_ids = [chunk_id for chunk_id, score in hits]
+            
+            # A key may have been configured since startup
+            self._ensure_llm()
             
-            # Check if OpenAI client is available (either from init or from manual setting)
-            if not self.openai_client:
-                # Try to reinitialize from environment variables
-                self._init_openai()
+            # Repeated questions against an unchanged corpus are answered from cache
+            cached = self._cache_get(query, chunk_ids, version, vector)
+            if cached is not None:
+                return cached
+            
+            relevant_chunks = [self.text_chunks[chunk_id] for chunk_id in chunk_ids]
             
             # Generate intelligent response
-            if self.openai_client:
+            if self.llm and relevant_chunks:
                 try:
-                    response = await self.generate_intelligent_response(query, relevant_chunks)
-                    return response
+                    response = await self._complete(query, relevant_chunks)
                 except Exception as e:
                     print(f"OpenAI API call failed: {e}")
-                    # Fall back to basic response if API fails
+                    # Fall back to basic response if API fails (not cached)
                     return self._fallback_response(query, relevant_chunks)
             else:
                 response = self._fallback_response(query, relevant_chunks)
-                return response
+            
+            self._cache_put(query, chunk_ids, version, response, vector)
+            return response
             
         except Exception as e:
             return f"Sorry, I encountered an error: {str(e)}"
@@ -308,46 +805,79 @@ Please provide a clear, helpful answer based on the document content above. If t
         """Get information about stored documents."""
         return [
             {
-                "filename": doc["filename"],
-                "size": doc["size"],
-                "chunk_count": doc["chunk_count"],
-                "preview": doc["content"][:100] + "..." if len(doc["content"]) > 100 else doc["content"]
+                "doc_id": doc.doc_id,
+                "filename": doc.filename,
+                "size": doc.size,
+                "chunk_count": doc.chunk_count,
+                "preview": doc.preview
             }
             for doc in self.documents
         ]
     
+    def delete_document(self, doc_id: str) -> str:
+        """Delete a stored document, compacting the store once enough space is dead."""
+        self._check_writable()
+        if doc_id not in self.store.documents:
+            raise KeyError(f"Unknown document '{doc_id}'")
+        
+        filename = self.store.documents[doc_id].filename
+        for chunk_id in self.store.document_chunk_ids(doc_id):
+            self.index.remove(chunk_id, self.store[chunk_id])
+            if self.dense is not None:
+                self.dense.remove(chunk_id)
+        self.store.delete_document(doc_id)
+        self.corpus_version += 1
+        
+        # Compaction renumbers chunks, so it waits while a document is being written
+        if not self.write_lock.locked() and self.store.dead_chunks > self.COMPACT_THRESHOLD * len(self.store):
+            self.compact()
+        return f"Document '{filename}' deleted successfully!"
+    
+    def compact(self):
+        """Rewrite the chunk store without deleted documents and rebuild the indexes."""
+        id_map = self.store.compact()
+        self.corpus_version += 1
+        self.index = InvertedIndex()
+        self.index.add_many(0, self.store)
+        if self.dense is not None:
+            # Vectors are renumbered, not re-embedded
+            self.dense.remap(id_map)
+        self.save_index()
+    
+    def save_index(self):
+        """Persist index snapshots so the next start doesn't re-index the corpus."""
+        self.store.save_index(self.index)
+        if self.dense is not None:
+            self.store.save_index(self.dense, "dense")
+        self._chunks_since_snapshot = 0
+    
+    def close(self):
+        """Flush the index and release storage handles."""
+        if self._chunks_since_snapshot:
+            self.save_index()
+        if self._owns_ingest_pool:
+            self.ingest_pool.shutdown()
+        self.store.close()
+    
+    def memory_usage(self) -> int:
+        """Approximate bytes of RAM held by this engine's indexes and metadata."""
+        usage = self.index.memory_usage() + self.store.memory_usage()
+        if self.dense is not None:
+            usage += self.dense.memory_usage()
+        return usage
+    
     def clear_documents(self):
         """Clear all stored documents."""
-        self.documents.clear()
-        self.text_chunks.clear()
+        self.store.clear()
+        self.index.clear()
+        self.corpus_version += 1
+        self.answer_cache.clear()
+        self.parse_cache.clear()
+        if self.dense is not None:
+            self.dense.clear()
+        self.save_index()
         return "All documents cleared successfully!"
     
     def set_openai_api_key(self, api_key: str, base_url: str = None):
         """Set OpenAI API key manually."""
-        try:
-            if base_url is None:
-                base_url = "https://api.openai.com/v1"
-            
-            # Create client with proper configuration
-            if base_url != "https://api.openai.com/v1":
-                # For custom base URLs, use specific configuration
-                self.openai_client = AsyncOpenAI(
-                    api_key=api_key,
-                    base_url=base_url,
-                    max_retries=3
-                )
-                self.base_url = base_url
-                # Use provider prefix for a4f.co
-                if "a4f.co" in base_url:
-                    self.model = "provider-3/gpt-4o-mini"
-                    print(f"✅ Using a4f.co model: {self.model}")
-            else:
-                # For standard OpenAI, use default configuration
-                self.openai_client = AsyncOpenAI(api_key=api_key)
-                self.model = "gpt-4o-mini"
-            
-            print(f"✅ OpenAI client initialized with provided API key and base URL: {base_url}")
-            return True
-        except Exception as e:
-            print(f"❌ Failed to initialize OpenAI client: {e}")
-            return False
\ No newline at end of file
+        return self._configure_llm(api_key, base_url or "https://api.openai.com/v1")
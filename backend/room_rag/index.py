@@ -0,0 +1,369 @@
+import functools
+import math
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Collection, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+# Common words that carry no retrieval signal
+STOP_WORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of',
+    'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had',
+    'do', 'does', 'did', 'will', 'would', 'could', 'should', 'may', 'might', 'can',
+    'this', 'that', 'these', 'those', 'what', 'when', 'where', 'why', 'how', 'who',
+    'which'
+})
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase text and split it into word tokens."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def analyze(text: str) -> Tuple[int, Dict[str, int]]:
+    """
+    Tokenize a chunk for indexing.
+
+    Returns:
+        ``(length, term_counts)``: the token count and the frequency of every
+        non-stop-word term. Picklable, so it can be computed in a worker process.
+    """
+    tokens = tokenize(text)
+    counts = {term: tf for term, tf in Counter(tokens).items() if term not in STOP_WORDS}
+    return len(tokens), counts
+
+
+def query_terms(query: str) -> List[str]:
+    """Return the distinct non-stop-word terms of a query, in order."""
+    seen = {}
+    for term in tokenize(query):
+        if term not in STOP_WORDS:
+            seen.setdefault(term, None)
+    return list(seen)
+
+
+def _locked(method):
+    """Run an ``InvertedIndex`` method holding the index lock."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class InvertedIndex:
+    """
+    Incremental inverted index over text chunks, scored with Okapi BM25.
+
+    Postings are kept in numpy arrays in CSR layout (terms x chunks): term
+    ``t`` occurs in chunks ``indices[indptr[t]:indptr[t + 1]]`` with the term
+    frequencies in the same slice of ``tfs``. Postings of newly added chunks
+    are appended to flat buffers, which are merged into the CSR arrays once
+    they outgrow a fraction of them (or exceed ``MERGE_MIN`` at query time);
+    removed chunks are masked out when scoring and dropped at the next merge.
+    Scoring a query is a few vectorized operations over the postings of its
+    terms, and the top k come from ``argpartition``.
+
+    Chunk ids are assigned by the caller and must be added in increasing order,
+    which keeps postings sorted without any extra work. Searches run in worker
+    threads while documents are added, so every public method holds the
+    index lock.
+    """
+
+    # Merge buffered postings once there are this many, or this fraction of the merged ones
+    MERGE_MIN = 65536
+    MERGE_FRACTION = 0.5
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """Initialize an empty index."""
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self.clear()
+
+    def __len__(self) -> int:
+        return self._count
+
+    @_locked
+    def __getstate__(self):
+        # Snapshots are saved merged
+        self.flush()
+        state = dict(self.__dict__)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        if "postings" in state:
+            # Snapshot from a version that kept dict postings: convert it
+            self.__init__(state["k1"], state["b"])
+            self._load_postings(state["postings"], state["doc_lengths"])
+        else:
+            self.__dict__.update(state)
+            self._lock = threading.RLock()
+
+    @property
+    def avg_length(self) -> float:
+        """Average chunk length in tokens."""
+        return self.total_length / self._count if self._count else 0.0
+
+    def _reserve(self, size: int):
+        """Grow the per-chunk arrays to hold ``size`` chunk ids."""
+        if size <= len(self.lengths):
+            return
+        capacity = max(size, 2 * len(self.lengths), 1024)
+        lengths = np.zeros(capacity, dtype=np.int32)
+        live = np.zeros(capacity, dtype=bool)
+        lengths[:len(self.lengths)] = self.lengths
+        live[:len(self.live)] = self.live
+        self.lengths, self.live = lengths, live
+
+    def _term_ids(self, terms: Collection[str]) -> List[int]:
+        """Ids of terms, adding the ones not seen before to the vocabulary."""
+        vocab = self.vocab
+        term_ids = list(map(vocab.get, terms))
+        if None in term_ids:
+            for position, term in enumerate(terms):
+                if term_ids[position] is None:
+                    term_ids[position] = vocab[term] = len(vocab)
+            if len(vocab) > len(self.df):
+                df = np.zeros(max(len(vocab), 2 * len(self.df), 1024), dtype=np.int32)
+                df[:len(self.df)] = self.df
+                self.df = df
+        return term_ids
+
+    def add(self, chunk_id: int, text: str):
+        """Index a single chunk."""
+        self.add_analyzed(chunk_id, analyze(text))
+
+    @_locked
+    def add_analyzed(self, chunk_id: int, analysis: Tuple[int, Dict[str, int]]):
+        """Index a chunk that was already tokenized by ``analyze``."""
+        length, counts = analysis
+        self._reserve(chunk_id + 1)
+        self.lengths[chunk_id] = length
+        self.live[chunk_id] = True
+        self._count += 1
+        self.total_length += length
+
+        term_ids = self._term_ids(counts)
+        self._pending_terms.extend(term_ids)
+        self._pending_chunks.extend(array("i", [chunk_id]) * len(term_ids))
+        self._pending_tfs.extend(counts.values())
+        self._pending_view = None
+
+        if len(self._pending_terms) > max(self.MERGE_MIN, self.MERGE_FRACTION * len(self.indices)):
+            self._merge()
+
+    def add_many(self, start_id: int, texts: Iterable[str]):
+        """Index consecutive chunks, numbering them from ``start_id``."""
+        for offset, text in enumerate(texts):
+            self.add(start_id + offset, text)
+
+    @_locked
+    def remove(self, chunk_id: int, text: str):
+        """Remove a chunk, given the same text it was indexed with."""
+        if chunk_id >= len(self.live) or not self.live[chunk_id]:
+            return
+        self.live[chunk_id] = False
+        self._count -= 1
+        self._removed += 1
+        self.total_length -= int(self.lengths[chunk_id])
+
+        self._count_pending()
+        term_ids = [self.vocab[term] for term in set(tokenize(text)) - STOP_WORDS if term in self.vocab]
+        self.df[term_ids] = np.maximum(self.df[term_ids] - 1, 0)
+
+    def _count_pending(self):
+        """Add buffered postings not yet counted to ``df`` (done lazily, in bulk)."""
+        if self._pending_counted < len(self._pending_terms):
+            uncounted = np.array(self._pending_terms[self._pending_counted:], dtype=np.int32)
+            self.df += np.bincount(uncounted, minlength=len(self.df)).astype(np.int32)
+            self._pending_counted = len(self._pending_terms)
+
+    def _buffered(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Buffered postings as ``(term ids, chunk ids, tfs)``, sorted by term and then chunk id."""
+        if self._pending_view is None:
+            # Copied, never viewed: an array.array exporting its buffer cannot grow
+            terms = np.array(self._pending_terms, dtype=np.int32)
+            order = np.argsort(terms, kind="stable")
+            self._pending_view = (
+                terms[order],
+                np.array(self._pending_chunks, dtype=np.int32)[order],
+                np.array(self._pending_tfs, dtype=np.int32)[order],
+            )
+        return self._pending_view
+
+    @_locked
+    def flush(self):
+        """Merge buffered postings into the CSR arrays now."""
+        if self._pending_terms or self._removed:
+            self._merge()
+
+    def _merge(self):
+        """Fold buffered postings into the CSR arrays, dropping removed chunks."""
+        self._count_pending()
+        n_terms = len(self.vocab)
+        pending_terms, pending_chunks, pending_tfs = self._buffered()
+        old_counts = np.zeros(n_terms, dtype=np.int64)
+        old_counts[:len(self.indptr) - 1] = np.diff(self.indptr)
+        pending_counts = np.bincount(pending_terms, minlength=n_terms)
+        new_counts = old_counts + pending_counts
+        indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(new_counts, out=indptr[1:])
+
+        indices = np.empty(indptr[-1], dtype=np.int32)
+        tfs = np.empty(indptr[-1], dtype=np.int32)
+        # Merged postings keep their place at the start of each term's row...
+        old_starts = np.full(n_terms, self.indptr[-1], dtype=np.int64)
+        old_starts[:len(self.indptr) - 1] = self.indptr[:-1]
+        shift = np.repeat(indptr[:-1] - old_starts, old_counts)
+        destination = np.arange(len(self.indices)) + shift
+        indices[destination] = self.indices
+        tfs[destination] = self.tfs
+        # ...and buffered ones (higher chunk ids) follow them
+        pending_starts = np.cumsum(pending_counts) - pending_counts
+        destination = (indptr[:-1] + old_counts - pending_starts)[pending_terms] + np.arange(len(pending_terms))
+        indices[destination] = pending_chunks
+        tfs[destination] = pending_tfs
+
+        if self._removed:
+            keep = self.live[indices]
+            rows = np.repeat(np.arange(n_terms), new_counts)
+            indices, tfs = indices[keep], tfs[keep]
+            np.cumsum(np.bincount(rows[keep], minlength=n_terms), out=indptr[1:])
+
+        self.indptr, self.indices, self.tfs = indptr, indices, tfs
+        self._pending_terms, self._pending_chunks, self._pending_tfs = array("i"), array("i"), array("i")
+        self._pending_view = None
+        self._pending_counted = 0
+        self._removed = 0
+
+    def _load_postings(self, postings: Dict[str, List[Tuple[int, int]]], doc_lengths: Dict[int, int]):
+        """Build the index from ``term -> [(chunk_id, tf), ...]`` postings."""
+        for chunk_id, length in doc_lengths.items():
+            self._reserve(chunk_id + 1)
+            self.lengths[chunk_id] = length
+            self.live[chunk_id] = True
+        self._count = len(doc_lengths)
+        self.total_length = sum(doc_lengths.values())
+        term_ids = self._term_ids(list(postings))
+        for term_id, term_postings in zip(term_ids, postings.values()):
+            self._pending_terms.extend([term_id] * len(term_postings))
+            self._pending_chunks.extend(chunk_id for chunk_id, _ in term_postings)
+            self._pending_tfs.extend(tf for _, tf in term_postings)
+        self._merge()
+
+    def _postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Chunk ids and term frequencies of a term, removed chunks included."""
+        if term_id + 1 < len(self.indptr):
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            chunk_ids, tfs = self.indices[start:end], self.tfs[start:end]
+        else:
+            chunk_ids = tfs = np.empty(0, dtype=np.int32)
+        if self._pending_terms:
+            pending_terms, pending_chunks, pending_tfs = self._buffered()
+            start, end = np.searchsorted(pending_terms, [term_id, term_id + 1])
+            if end > start:
+                chunk_ids = np.concatenate([chunk_ids, pending_chunks[start:end]])
+                tfs = np.concatenate([tfs, pending_tfs[start:end]])
+        return chunk_ids, tfs
+
+    @_locked
+    def memory_usage(self) -> int:
+        """
+        Rough resident size in bytes.
+
+        The CSR and per-chunk arrays are counted exactly; a buffered posting
+        takes 12 bytes, and a term about 120 for its str, dict entry and df.
+        """
+        arrays = (self.indptr, self.indices, self.tfs, self.lengths, self.live)
+        return sum(a.nbytes for a in arrays) + 12 * len(self._pending_terms) + 120 * len(self.vocab)
+
+    @_locked
+    def idf(self, term: str) -> float:
+        """Inverse document frequency of a term (BM25 variant, always positive)."""
+        self._count_pending()
+        term_id = self.vocab.get(term)
+        df = int(self.df[term_id]) if term_id is not None else 0
+        n = self._count
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    @_locked
+    def search(self, terms: List[str], top_k: int = 5) -> List[Tuple[int, float]]:
+        """
+        Score chunks against query terms.
+
+        Only the postings of the given terms are visited, so the cost depends on
+        how many chunks contain the query terms rather than on corpus size.
+
+        Returns:
+            List of ``(chunk_id, score)`` pairs, best first (ties by chunk id).
+        """
+        if not self._count or top_k <= 0:
+            return []
+        if len(self._pending_terms) > self.MERGE_MIN:
+            # Cheaper than sorting a large buffer for this and later queries
+            self.flush()
+        self._count_pending()
+
+        k1, b = self.k1, self.b
+        avg_length = self.avg_length or 1.0
+        chunk_parts, score_parts = [], []
+        for term in terms:
+            term_id = self.vocab.get(term)
+            if term_id is None or not self.df[term_id]:
+                continue
+            chunk_ids, tfs = self._postings(term_id)
+            if self._removed:
+                live = self.live[chunk_ids]
+                chunk_ids, tfs = chunk_ids[live], tfs[live]
+            tf = tfs.astype(np.float64)
+            norm = k1 * (1 - b + b * self.lengths[chunk_ids] / avg_length)
+            chunk_parts.append(chunk_ids)
+            score_parts.append(self.idf(term) * tf * (k1 + 1) / (tf + norm))
+        if not chunk_parts:
+            return []
+
+        if len(chunk_parts) == 1:
+            chunk_ids, scores = chunk_parts[0], score_parts[0]
+        else:
+            # Sum the contributions of every term per chunk
+            chunk_ids, inverse = np.unique(np.concatenate(chunk_parts), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+
+        if top_k < len(scores):
+            # Everything scoring at least the k-th best, so ties at the cut are broken by chunk id
+            kth = scores[np.argpartition(scores, -top_k)[-top_k]]
+            candidates = np.flatnonzero(scores >= kth)
+        else:
+            candidates = np.arange(len(scores))
+        order = candidates[np.lexsort((chunk_ids[candidates], -scores[candidates]))][:top_k]
+        return [(int(chunk_id), float(score)) for chunk_id, score in zip(chunk_ids[order], scores[order])]
+
+    @_locked
+    def clear(self):
+        """Remove everything from the index."""
+        self.vocab: Dict[str, int] = {}
+        # Live chunks containing each term, by term id (grown ahead of the vocabulary)
+        self.df = np.zeros(0, dtype=np.int32)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.empty(0, dtype=np.int32)
+        self.tfs = np.empty(0, dtype=np.int32)
+        # Postings added since the last merge, in insertion order
+        self._pending_terms = array("i")
+        self._pending_chunks = array("i")
+        self._pending_tfs = array("i")
+        self._pending_view = None
+        # Buffered postings already counted in df
+        self._pending_counted = 0
+        # Per chunk id: token count and whether it is still indexed
+        self.lengths = np.zeros(0, dtype=np.int32)
+        self.live = np.zeros(0, dtype=bool)
+        self._count = 0
+        self._removed = 0
+        self.total_length = 0
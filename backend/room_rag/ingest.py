@@ -0,0 +1,726 @@
+"""
+CPU-bound document ingestion, run in a bounded process pool.
+
+The functions at module level are what worker processes execute, so they
+must stay importable and take/return only picklable values.
+"""
+
+import asyncio
+import functools
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import PyPDF2
+
+from .index import analyze
+
+
+class IngestBusyError(Exception):
+    """Raised when the ingestion pool stays saturated for longer than the queue timeout."""
+
+
+def count_pdf_pages(content: bytes) -> int:
+    """Return the number of pages in a PDF."""
+    return len(PyPDF2.PdfReader(io.BytesIO(content)).pages)
+
+
+def extract_pdf_pages(content: bytes, start: int, end: int) -> List[str]:
+    """Extract text from pages ``[start, end)`` as ``"Page N: ..."`` blocks."""
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
+    text_content = []
+    for page_num in range(start, end):
+        page_text = pdf_reader.pages[page_num].extract_text()
+        if page_text.strip():
+            text_content.append(f"Page {page_num + 1}: {page_text.strip()}")
+    return text_content
+
+
+# The PDF this worker process opened last, as ((path, mtime, size), reader): the
+# page ranges of one upload that land on the same worker share one parse
+_open_pdf: Optional[Tuple[Tuple[str, int, int], PyPDF2.PdfReader]] = None
+
+
+def _pdf_reader(path: str) -> PyPDF2.PdfReader:
+    global _open_pdf
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if _open_pdf is None or _open_pdf[0] != key:
+        _open_pdf = None  # Let the previous upload's reader go before reading the next
+        _open_pdf = (key, PyPDF2.PdfReader(path))
+    return _open_pdf[1]
+
+
+def count_pdf_file_pages(path: str) -> int:
+    """``count_pdf_pages`` for a PDF on disk."""
+    return len(_pdf_reader(path).pages)
+
+
+def extract_pdf_file_pages(path: str, start: int, end: int) -> List[str]:
+    """``extract_pdf_pages`` for a PDF on disk."""
+    pdf_reader = _pdf_reader(path)
+    text_content = []
+    for page_num in range(start, end):
+        page_text = pdf_reader.pages[page_num].extract_text()
+        if page_text.strip():
+            text_content.append(f"Page {page_num + 1}: {page_text.strip()}")
+    return text_content
+
+
+def extract_text_from_pdf(content: bytes) -> str:
+    """Extract text content from PDF bytes."""
+    try:
+        return "\n\n".join(extract_pdf_pages(content, 0, count_pdf_pages(content)))
+    except Exception as e:
+        print(f"Error extracting PDF text: {e}")
+        return ""
+
+
+# Uploads with less clean text than this are rejected as empty
+MIN_TEXT_CHARS = 50
+
+# Longest PDF object a document may contain; an opening marker with no
+# "endobj" within this many characters is kept as ordinary text
+MAX_ARTIFACT_CHARS = 64 * 1024
+
+_HYPHENS = '-\u00ad\u2010'
+# Whitespace left after NFKC normalization, and the characters among it that break lines
+_WHITESPACE = ''.join(ch for ch in map(chr, range(0x3000 + 1))
+                      if ch.isspace() and unicodedata.normalize("NFKC", ch) == ch)
+_LINE_BREAKS = '\n\r\x0b\x0c\x85\u2028\u2029'
+_PARAGRAPH_BREAKS = '\x0c\u2029'  # Form feed (page break) and paragraph separator
+# One alternation for everything the cleaner rewrites. Every branch starts with
+# a literal character, which lets the regex engine skip plain text and single
+# spaces without trying the branches, so only line breaks, irregular
+# whitespace, hyphens and PDF syntax are visited.
+_CLEAN_RE = re.compile('|'.join(
+    # Whitespace runs (a single space is left alone), with the hyphen before them
+    [re.escape(ch) + (r'\s+' if ch == ' ' else r'\s*') for ch in _WHITESPACE]
+    + [r'-\s+', '\u2010\\s+', '\u00ad\\s*']
+    # A file header or an object header ("12 0 obj") opens a PDF artifact...
+    + ['%PDF']
+    + [digit + r'(?<![\w.].)\d{0,9}\s{1,4}\d{1,5}\s{1,4}obj\b' for digit in '0123456789']
+    # ...that an "endobj" closes
+    + [r'e(?<!\w.)ndobj\b']
+))
+# Longest match that may still grow or change when more text follows
+_MAX_TOKEN_CHARS = 32
+# Format and control characters that carry nothing once the text is extracted
+_INVISIBLE_RE = re.compile('[\x00-\x08\x0e-\x1b\x7f\u200b\u2060\ufeff]')
+
+
+class TextCleaner:
+    """
+    Single-pass, linear-time text normalizer.
+
+    The text is put in Unicode NFKC form (ligatures, full-width forms and
+    non-breaking spaces become plain characters) and then scanned once with
+    ``_CLEAN_RE``:
+
+    - whitespace runs collapse to a space, a line break (``"\\n"``) or a
+      paragraph break (``"\\n\\n"``);
+    - a word hyphenated across a line break is joined again when the next
+      line starts in lower case; soft hyphens are dropped;
+    - PDF syntax from ``%PDF`` or an ``"N G obj"`` header to the next
+      ``endobj`` is removed, if that ``endobj`` follows within
+      ``MAX_ARTIFACT_CHARS``. Prose such as "object ... endobj" is kept.
+
+    Text can be fed in pieces of any size: only a short tail (or an open PDF
+    object) is held back, and the output is the same as for the whole text.
+    """
+
+    __slots__ = ("_raw", "_pending", "_previous")
+
+    def __init__(self):
+        self._raw = ""  # Last character of the raw text, which may compose with the next
+        self._pending = ""  # Normalized text not scanned yet
+        self._previous = ""  # Last character already scanned, for look-behinds
+
+    def feed(self, text: str) -> str:
+        """Add a piece of raw text; returns the cleaned text that is final."""
+        text = self._raw + text
+        # Keep the last character and its combining marks until the next piece
+        cut = len(text) - 1
+        while cut > 0 and unicodedata.combining(text[cut]):
+            cut -= 1
+        self._raw = text[cut:] if cut >= 0 else ""
+        return self._scan(text[:max(cut, 0)], final=False)
+
+    def finish(self) -> str:
+        """Flush the held-back text; returns the rest of the cleaned text."""
+        text, self._raw = self._raw, ""
+        return self._scan(text, final=True)
+
+    def _scan(self, text: str, final: bool) -> str:
+        start = len(self._previous)
+        buffer = self._previous + self._pending + _INVISIBLE_RE.sub('', unicodedata.normalize("NFKC", text))
+        end = len(buffer)
+        out: List[str] = []
+        pos = start
+        # Artifact openers since the last one closed: (position, length of ``out``)
+        opened: List[Tuple[int, int]] = []
+        held = end
+
+        for match in _CLEAN_RE.finditer(buffer, start):
+            if not final and match.end() > end - _MAX_TOKEN_CHARS:
+                # May still grow into a longer match with the next piece
+                held = match.start()
+                break
+            first = match.group()[0]
+            if first == '%' or first.isdigit():
+                out.append(buffer[pos:match.start()])
+                opened.append((match.start(), len(out)))
+                pos = match.start()
+                continue
+            if first == 'e':
+                # Remove from the earliest opener close enough to this "endobj"
+                first = next((i for i, (at, _) in enumerate(opened)
+                              if match.end() - at <= MAX_ARTIFACT_CHARS), None)
+                if first is not None:
+                    del out[opened[first][1]:]
+                    pos = match.end()
+                # Openers it could not close are too far back for any later one
+                opened.clear()
+                continue
+
+            out.append(buffer[pos:match.start()])
+            out.append(self._space(buffer, match))
+            pos = match.end()
+
+        if not final:
+            # Also hold back anything that may begin a match with the next piece
+            held = max(pos, min(held, end - _MAX_TOKEN_CHARS))
+        live = [entry for entry in opened if held - entry[0] < MAX_ARTIFACT_CHARS]
+        if not final and live:
+            # The artifact may still be closed by text that is held back
+            held, opened_out = live[0]
+            del out[opened_out:]
+            pos = held
+        out.append(buffer[pos:held])
+        self._pending = buffer[held:]
+        if self._pending and self._pending[0].isspace():
+            # A held whitespace run only matters for the breaks it holds
+            space = _CLEAN_RE.match(self._pending)
+            if space is not None:
+                self._pending = _collapse_space(space.group()) + self._pending[space.end():]
+        self._previous = buffer[held - 1] if held > 0 else ""
+        return ''.join(out)
+
+    @staticmethod
+    def _space(buffer: str, match: re.Match) -> str:
+        piece = _collapse_space(match.group())
+        if piece in ('-\n', '\u2010\n') and 0 < match.start() and match.end() < len(buffer) \
+                and buffer[match.start() - 1].isalpha() and buffer[match.end()].islower():
+            # A word hyphenated across a line break
+            return ''
+        return piece
+
+
+@functools.lru_cache(maxsize=1024)
+def _collapse_space(run: str) -> str:
+    """Replacement for a whitespace run and the hyphen before it, if any."""
+    hyphen = run[0] if run[0] in _HYPHENS else ''
+    space = run[len(hyphen):].replace('\r\n', '\n')
+    breaks = sum(space.count(ch) for ch in _LINE_BREAKS) + sum(space.count(ch) for ch in _PARAGRAPH_BREAKS)
+    piece = '\n\n' if breaks > 1 else '\n' if breaks else ' ' if space else ''
+    if hyphen == '\u00ad':
+        # A soft hyphen only marks where a word may break, and a line break after it is that break
+        return '' if piece == '\n' else piece
+    return hyphen + piece
+
+
+def clean_text(text: str) -> str:
+    """Clean and normalize text content (see ``TextCleaner``)."""
+    cleaner = TextCleaner()
+    return (cleaner.feed(text) + cleaner.finish()).strip()
+
+
+# Characters per chunk and how much of a cut paragraph the next chunk repeats
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 1000))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 150))
+
+# A word ending a sentence: final punctuation, optionally followed by closing quotes/brackets
+_SENTENCE_END_RE = re.compile(r'[.!?][\'")\]]*$')
+_SPLIT_RE = re.compile(r'(\s+)')
+
+
+class Chunk(NamedTuple):
+    """A piece of a document and where it came from."""
+
+    text: str
+    page: int  # Source page, 0 when the document has no pages
+    char_start: int  # Offset in the document's cleaned text
+
+
+class Chunker:
+    """
+    Split text into chunks along its sentences and paragraphs.
+
+    Chunks are filled with whole sentences up to ``chunk_size`` characters;
+    once a chunk is half full it also ends at the next paragraph break (a
+    blank line), so a heading stays with the paragraph below it. A sentence
+    longer than a chunk is split between words. When a chunk ends inside a
+    paragraph, the next one starts with its last sentences, up to
+    ``overlap`` characters, so text on either side of the cut keeps its
+    context.
+
+    Chunk text is the document's words joined by single spaces, with blank
+    lines between paragraphs; ``Chunk.char_start`` is an offset into that
+    cleaned text. Text can be fed in pieces of any size: every word is looked
+    at once, and only the current sentence and chunk are kept in memory.
+    The state is plain data, so a chunker can be pickled to a worker process.
+    """
+
+    __slots__ = ("chunk_size", "overlap", "chars", "page", "_partial", "_newlines",
+                 "_words", "_sentence_size", "_sentence_page", "_sentence_paragraph",
+                 "_units", "_size", "_fresh")
+
+    def __init__(self, chunk_size: Optional[int] = None, overlap: Optional[int] = None):
+        """
+        Args:
+            chunk_size: Most characters per chunk (single words may exceed it)
+            overlap: Most characters a chunk repeats from the one before
+        """
+        self.chunk_size = chunk_size or CHUNK_SIZE
+        self.overlap = min(overlap if overlap is not None else CHUNK_OVERLAP, self.chunk_size // 2)
+        self.chars = 0  # Length of the cleaned text so far
+        self.page = 0
+        self._partial = ""  # Word cut off at the end of the last piece
+        self._newlines = 0  # Line breaks since the last word
+        # Sentence being read
+        self._words: List[str] = []
+        self._sentence_size = 0
+        self._sentence_page = 0
+        self._sentence_paragraph = False
+        # Chunk being filled: (text, page, char_start, starts_paragraph) per sentence
+        self._units: List[Tuple[str, int, int, bool]] = []
+        self._size = 0
+        self._fresh = 0  # Units not yet emitted with an earlier chunk
+
+    def feed(self, text: str, page: Optional[int] = None) -> List[Chunk]:
+        """Add a piece of text (from ``page``, if given); returns the chunks it completed."""
+        if page is not None:
+            self.page = page
+        chunks: List[Chunk] = []
+        parts = _SPLIT_RE.split(self._partial + text)
+        # The last word may continue in the next piece
+        self._partial = parts.pop()
+        for position, part in enumerate(parts):
+            if position % 2:
+                self._newlines += part.count('\n')
+            elif part:
+                self._add_word(part, chunks)
+        return chunks
+
+    def finish(self) -> List[Chunk]:
+        """Flush the remaining text; returns the last chunks."""
+        chunks: List[Chunk] = []
+        if self._partial:
+            self._add_word(self._partial, chunks)
+            self._partial = ""
+        self._end_sentence(chunks)
+        if self._fresh:
+            chunks.append(self._emit())
+        return chunks
+
+    def _add_word(self, word: str, chunks: List[Chunk]):
+        if self._newlines >= 2:
+            self._end_sentence(chunks)
+            self._sentence_paragraph = True
+        self._newlines = 0
+        if not self._words:
+            self._sentence_page = self.page
+        elif self._sentence_size + 1 + len(word) > self.chunk_size:
+            # A sentence too long for any chunk continues as a new unit
+            self._end_sentence(chunks)
+            self._sentence_page = self.page
+        self._sentence_size += len(word) + (1 if self._words else 0)
+        self._words.append(word)
+        if _SENTENCE_END_RE.search(word):
+            self._end_sentence(chunks)
+
+    def _end_sentence(self, chunks: List[Chunk]):
+        if not self._words:
+            return
+        text = ' '.join(self._words)
+        paragraph = self._sentence_paragraph and self.chars > 0
+        separator = (2 if paragraph else 1) if self.chars else 0
+        char_start = self.chars + separator
+        self.chars = char_start + len(text)
+        self._words = []
+        self._sentence_size = 0
+        self._sentence_paragraph = False
+        self._add_unit((text, self._sentence_page, char_start, paragraph), chunks)
+
+    def _add_unit(self, unit: Tuple[str, int, int, bool], chunks: List[Chunk]):
+        text, _, _, paragraph = unit
+        separator = 2 if paragraph else 1
+        if self._units and (self._size + separator + len(text) > self.chunk_size
+                            or (paragraph and 2 * self._size >= self.chunk_size)):
+            chunks.append(self._emit())
+            # Repeat the end of a paragraph that was cut; a new paragraph starts afresh
+            self._units = [] if paragraph else self._overlap(len(text))
+            self._size = self._measure(self._units)
+        self._size += (separator if self._units else 0) + len(text)
+        self._units.append(unit)
+        self._fresh += 1
+
+    def _overlap(self, incoming: int) -> List[Tuple[str, int, int, bool]]:
+        """Trailing units of the emitted chunk that fit in ``overlap`` and leave room for the next unit."""
+        carried: List[Tuple[str, int, int, bool]] = []
+        size = 0
+        for unit in reversed(self._units[1:]):
+            grown = size + len(unit[0]) + (1 if carried else 0)
+            if grown > self.overlap or grown + 1 + incoming > self.chunk_size:
+                break
+            carried.insert(0, unit)
+            size = grown
+        return carried
+
+    @staticmethod
+    def _measure(units: List[Tuple[str, int, int, bool]]) -> int:
+        return sum(len(text) for text, _, _, _ in units) + \
+            sum(2 if paragraph else 1 for _, _, _, paragraph in units[1:])
+
+    def _emit(self) -> Chunk:
+        parts = [self._units[0][0]]
+        for text, _, _, paragraph in self._units[1:]:
+            parts.append('\n\n' if paragraph else ' ')
+            parts.append(text)
+        _, page, char_start, _ = self._units[0]
+        self._fresh = 0
+        return Chunk(''.join(parts), page, char_start)
+
+
+def chunk_document(text: str, chunk_size: Optional[int] = None, overlap: Optional[int] = None,
+                   pages: bool = False) -> List[Chunk]:
+    """
+    Chunk a whole document.
+
+    With ``pages`` set, the text is extracted PDF text whose pages start with
+    the ``"Page N:"`` markers ``extract_pdf_pages`` puts in front of them; the
+    markers are dropped and every chunk records the page it starts on.
+    """
+    chunker = Chunker(chunk_size, overlap)
+    chunks: List[Chunk] = []
+    if pages:
+        for page, page_text in split_pages(text):
+            chunks += chunker.feed(page_text + ' ', page)
+    else:
+        chunks += chunker.feed(text)
+    return chunks + chunker.finish()
+
+
+def chunk_text(text: str, chunk_size: Optional[int] = None, overlap: Optional[int] = None) -> List[str]:
+    """Split text into manageable chunks for better processing."""
+    return [chunk.text for chunk in chunk_document(text, chunk_size, overlap)]
+
+
+_PAGE_MARKER_RE = re.compile(r'(?:^|\n\n)Page (\d+): ?')
+
+
+def split_pages(text: str) -> List[Tuple[int, str]]:
+    """Split extracted PDF text into ``(page_number, text)`` at its ``"Page N:"`` markers."""
+    parts = _PAGE_MARKER_RE.split(text)
+    pages = [(0, parts[0])] if parts[0].strip() else []
+    pages += [(int(number), page_text) for number, page_text in zip(parts[1::2], parts[2::2])]
+    return pages
+
+
+def prepare_text(raw_text: str, pages: bool = False
+                 ) -> Tuple[int, List[Chunk], List[Tuple[int, Dict[str, int]]], Dict[str, float]]:
+    """
+    Clean, chunk and tokenize raw document text in one worker call.
+
+    Returns:
+        ``(chars, chunks, analyses, seconds)``: the length of the cleaned
+        text, its chunks, the pre-tokenized ``(length, term_counts)`` of
+        every chunk for the index, and the time each step took.
+    """
+    start = time.perf_counter()
+    text = clean_text(raw_text)
+    cleaned = time.perf_counter()
+    chunks = chunk_document(text, pages=pages)
+    chunked = time.perf_counter()
+    analyses = [analyze(chunk.text) for chunk in chunks]
+    seconds = {"clean": cleaned - start, "chunk": chunked - cleaned, "tokenize": time.perf_counter() - chunked}
+    chars = chunks[-1].char_start + len(chunks[-1].text) if chunks else 0
+    return chars, chunks, analyses, seconds
+
+
+class TextStream:
+    """
+    Incremental ``clean_text`` + ``chunk_document`` for documents read in blocks.
+
+    Text is fed in pieces of any size and complete chunks come out as soon as
+    they fill up, so a document never exists in memory as one string. The
+    carried-over state is small (the chunk being filled plus at most
+    ``MAX_ARTIFACT_CHARS`` of lookahead) and plain data: the stream is pickled
+    to a worker process with each piece and returned with its chunks.
+    ``seconds`` adds up the time spent cleaning and chunking.
+    """
+
+    __slots__ = ("cleaner", "chunker", "seconds")
+
+    def __init__(self, chunk_size: Optional[int] = None, overlap: Optional[int] = None):
+        self.cleaner = TextCleaner()
+        self.chunker = Chunker(chunk_size, overlap)
+        self.seconds = {"clean": 0.0, "chunk": 0.0}
+
+    @property
+    def chars(self) -> int:
+        """Length of the cleaned text emitted so far."""
+        return self.chunker.chars
+
+    def feed(self, text: str) -> List[Chunk]:
+        """Add a piece of raw text; returns the chunks it completed."""
+        start = time.perf_counter()
+        text = self.cleaner.feed(text)
+        cleaned = time.perf_counter()
+        chunks = self.chunker.feed(text)
+        self._count(start, cleaned)
+        return chunks
+
+    def finish(self) -> List[Chunk]:
+        """Flush the remaining text; returns the last chunks."""
+        start = time.perf_counter()
+        text = self.cleaner.finish()
+        cleaned = time.perf_counter()
+        chunks = self.chunker.feed(text) + self.chunker.finish()
+        self._count(start, cleaned)
+        return chunks
+
+    def _count(self, start: float, cleaned: float):
+        self.seconds["clean"] += cleaned - start
+        self.seconds["chunk"] += time.perf_counter() - cleaned
+
+
+def prepare_block(stream: TextStream, text: str, final: bool) -> Tuple[TextStream, List[Chunk]]:
+    """Feed one decoded block to a ``TextStream`` in a worker; returns the updated stream and new chunks."""
+    chunks = stream.feed(text)
+    if final:
+        chunks += stream.finish()
+    return stream, chunks
+
+
+def analyze_chunks(chunks: List[str]) -> List[Tuple[int, Dict[str, int]]]:
+    """Tokenize a batch of chunks for the index."""
+    return [analyze(chunk) for chunk in chunks]
+
+
+class IngestPool:
+    """
+    Bounded process pool for CPU-bound ingestion work.
+
+    At most ``max_pending`` documents are in flight at once; further uploads
+    wait for a slot and fail with ``IngestBusyError`` after ``queue_timeout``
+    seconds instead of piling up unbounded work. Large PDFs are split into
+    page ranges that are extracted in parallel across workers; the upload is
+    written to a temporary file once and workers are only sent its path and
+    their page range, each reading and parsing it at most once.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None,
+                 queue_timeout: Optional[float] = None, pages_per_task: int = 16):
+        """Initialize the pool. Worker processes are started on first use."""
+        self.max_workers = max_workers or int(os.getenv("MAX_WORKERS", 4))
+        self.max_pending = max_pending or int(os.getenv("INGEST_MAX_PENDING", 2 * self.max_workers))
+        self.queue_timeout = queue_timeout or float(os.getenv("INGEST_QUEUE_TIMEOUT", 30))
+        self.pages_per_task = pages_per_task
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.pending = 0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Fork where available: spawn/forkserver workers re-import __main__,
+            # which would build a second engine over the same storage in every
+            # worker. Workers only run the parsing functions above, so the parent's
+            # threads (FAISS, torch, uvicorn) are never touched after the fork.
+            context = None
+            if "fork" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("fork")
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+        return self._executor
+
+    async def run(self, fn: Callable, *args):
+        """Run a picklable function in a worker process."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def slot(self) -> "_Slot":
+        """Reserve a pending-document slot; use as ``async with pool.slot():``."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        return _Slot(self)
+
+    async def extract_pdf(self, content: bytes, progress: Optional[Callable[..., None]] = None) -> str:
+        """
+        Extract PDF text, fanning page ranges out across workers.
+
+        ``progress`` is called with ``pages_total`` once the page count is known
+        and with ``pages_parsed`` as each page range finishes.
+        """
+        progress = progress or (lambda **fields: None)
+        path = None
+        try:
+            path = await asyncio.to_thread(_spool_pdf, content)
+            page_count = await self.run(count_pdf_file_pages, path)
+            progress(pages_total=page_count)
+            ranges = [
+                (start, min(start + self.pages_per_task, page_count))
+                for start in range(0, page_count, self.pages_per_task)
+            ]
+
+            pages_parsed = 0
+
+            async def extract(start: int, end: int) -> List[str]:
+                nonlocal pages_parsed
+                pages = await self.run(extract_pdf_file_pages, path, start, end)
+                pages_parsed += end - start
+                progress(pages_parsed=pages_parsed)
+                return pages
+
+            parts = await asyncio.gather(*(extract(start, end) for start, end in ranges))
+        except Exception as e:
+            print(f"Error extracting PDF text: {e}")
+            return ""
+        finally:
+            if path is not None:
+                os.unlink(path)
+        return "\n\n".join(page for part in parts for page in part)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Pool size and current load."""
+        return {"workers": self.max_workers, "max_pending": self.max_pending, "pending": self.pending}
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _spool_pdf(content: bytes) -> str:
+    """Write an upload to a temporary file for the workers to read; returns its path."""
+    fd, path = tempfile.mkstemp(prefix="room-upload-", suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    return path
+
+
+class _Slot:
+    """Async context manager holding one pending-document slot of an ``IngestPool``."""
+
+    def __init__(self, pool: IngestPool):
+        self.pool = pool
+
+    async def __aenter__(self):
+        try:
+            await asyncio.wait_for(self.pool._slots.acquire(), self.pool.queue_timeout)
+        except asyncio.TimeoutError:
+            raise IngestBusyError(
+                f"Ingestion is busy ({self.pool.max_pending} documents in progress), try again shortly"
+            )
+        self.pool.pending += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.pool.pending -= 1
+        self.pool._slots.release()
+
+
+class ParseCache:
+    """
+    Parsed uploads on disk, keyed by the SHA-256 of the uploaded bytes.
+
+    Uploading a file that was parsed before (deleted and uploaded again, or
+    retried after a failed job) skips text extraction. Entries are gzipped
+    JSON; the least recently used are removed once the cache grows past
+    ``max_bytes``.
+
+    As in the TTS audio cache, writes are added to a running total of the
+    directory's size, so the directory is only listed when that total passes
+    ``max_bytes`` (and once at the first write).
+    """
+
+    def __init__(self, path: Path, max_bytes: Optional[int] = None):
+        """
+        Args:
+            path: Directory holding the entries (created on first write)
+            max_bytes: Disk space the entries may use
+        """
+        self.path = Path(path)
+        self.max_bytes = max_bytes or int(os.getenv("PARSE_CACHE_MAX_MB", 256)) * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        # Bytes on disk as of the last listing plus what was written since; None until listed
+        self._used: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _file(self, digest: str) -> Path:
+        return self.path / f"{digest}.json.gz"
+
+    def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        """The entry stored for an upload hash, if any."""
+        path = self._file(digest)
+        try:
+            entry = json.loads(gzip.decompress(path.read_bytes()))
+            os.utime(path)  # Recently used: evicted last
+        except (OSError, ValueError, EOFError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, digest: str, entry: Dict[str, Any]):
+        """Store the parse result of an upload, then trim the cache to its size."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        path = self._file(digest)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        data = gzip.compress(json.dumps(entry, ensure_ascii=False).encode("utf-8"), compresslevel=5)
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        with self._lock:
+            if self._used is not None:
+                self._used += len(data)
+            if self._used is None or self._used > self.max_bytes:
+                self._used = self._trim()
+
+    def _trim(self) -> int:
+        """Remove least recently used entries until within ``max_bytes``; returns the bytes left."""
+        entries = []
+        for path in self.path.glob("*.json.gz"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        return total
+
+    def clear(self):
+        """Remove every entry."""
+        for path in self.path.glob("*.json.gz"):
+            path.unlink(missing_ok=True)
+        with self._lock:
+            self._used = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit and miss counts."""
+        return {"hits": self.hits, "misses": self.misses, "max_mb": self.max_bytes // (1024 * 1024)}
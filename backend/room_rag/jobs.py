@@ -0,0 +1,380 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .ingest import IngestBusyError
+
+try:
+    import fcntl
+except ImportError:  # Windows: no multi-process serving, the one process writes
+    fcntl = None
+
+# Handler signature: (upload or None, progress, **params) -> result message
+JobHandler = Callable[..., Awaitable[str]]
+
+UNFINISHED = ("queued", "running")
+FINISHED = ("done", "failed")
+
+
+class SpooledUpload:
+    """File-like stand-in for an ``UploadFile`` whose bytes were spooled to disk."""
+
+    def __init__(self, path: Path, filename: str):
+        self.path = Path(path)
+        self.filename = filename
+        self._file = None
+
+    async def read(self, size: int = -1) -> bytes:
+        if self._file is None:
+            self._file = open(self.path, "rb")
+        return await asyncio.to_thread(self._file.read, size)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class JobQueue:
+    """
+    Background job queue shared by every server process.
+
+    Each job is a JSON file next to its spooled upload, so any process can
+    submit jobs and report on them. Unfinished jobs live in ``pending/``,
+    finished ones in ``state_path`` itself, so looking for work only reads
+    the few files still pending. Only the process holding the lock on
+    ``writer.lock`` runs jobs: a fixed number of asyncio workers take jobs
+    submitted locally straight away and poll ``pending/`` for jobs submitted
+    by other processes. The writer keeps the finished jobs' figures in memory
+    and publishes their totals in ``stats.json``. The other processes keep
+    retrying the lock and take over if the writer goes away; jobs that were
+    queued or running at that point are run again.
+    """
+
+    def __init__(self, handler: JobHandler, state_path: Path, workers: Optional[int] = None,
+                 max_queued: Optional[int] = None, max_history: int = 200, poll_interval: float = 0.5,
+                 on_writer: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            handler: Coroutine run for each job with ``(upload, progress, **params)``
+            state_path: Directory for job files, spooled uploads and the writer lock
+            workers: Number of concurrent jobs
+            max_queued: Queued jobs allowed before new ones are refused
+            max_history: Finished jobs kept for status queries
+            poll_interval: Seconds between scans for jobs from other processes
+            on_writer: Called when this process becomes the one that runs jobs
+        """
+        self.handler = handler
+        self.state_path = Path(state_path)
+        self.pending_path = self.state_path / "pending"
+        self.pending_path.mkdir(parents=True, exist_ok=True)
+        self.workers = workers or int(os.getenv("INGEST_JOB_WORKERS", 2))
+        self.max_queued = max_queued or int(os.getenv("INGEST_MAX_QUEUED", 100))
+        self.max_history = max_history
+        self.poll_interval = poll_interval
+        self.on_writer = on_writer
+
+        self.is_writer = False
+        # Unfinished jobs this process has queued, by id (the writer only)
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        # Figures of the finished jobs kept on disk, oldest first (the writer only)
+        self._history: List[Dict[str, Any]] = []
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._lock_file = None
+
+    # Job files
+
+    def _job_file(self, job_id: str, pending: bool = False) -> Path:
+        return (self.pending_path if pending else self.state_path) / f"{job_id}.json"
+
+    def _spool_file(self, job_id: str) -> Path:
+        return self.state_path / f"{job_id}.upload"
+
+    def _save(self, job: Dict[str, Any]):
+        pending = job["status"] in UNFINISHED
+        _write_json(self._job_file(job["id"], pending), job)
+        if not pending:
+            # Written before the pending file goes, so a reader always finds one of them
+            self._job_file(job["id"], pending=True).unlink(missing_ok=True)
+
+    def _read(self, job_id: str) -> Optional[Dict[str, Any]]:
+        for pending in (False, True):
+            try:
+                return json.loads(self._job_file(job_id, pending).read_text())
+            except (OSError, ValueError):
+                continue
+        return None
+
+    @staticmethod
+    def _read_dir(path: Path) -> List[Dict[str, Any]]:
+        """Every job file in a directory, oldest first."""
+        jobs = []
+        for job_file in path.glob("job_*.json"):
+            try:
+                jobs.append(json.loads(job_file.read_text()))
+            except (OSError, ValueError):
+                continue  # Finished (moved) or being replaced while listed
+        return sorted(jobs, key=lambda job: job["created_at"])
+
+    def _read_pending(self) -> List[Dict[str, Any]]:
+        """Queued and running jobs, oldest first."""
+        return self._read_dir(self.pending_path)
+
+    def _upgrade_state_file(self):
+        """Split the single ``jobs.json`` written by older versions into job files."""
+        legacy = self.state_path / "jobs.json"
+        try:
+            jobs = json.loads(legacy.read_text())
+        except (OSError, ValueError):
+            return
+        for job in jobs:
+            self._save(job)
+        legacy.unlink()
+
+    def _upgrade_pending_files(self):
+        """Move unfinished jobs that older versions kept next to the finished ones into ``pending/``."""
+        for job in self._read_dir(self.state_path):
+            if job["status"] in UNFINISHED:
+                self._save(job)
+                self._job_file(job["id"]).unlink(missing_ok=True)
+
+    # Writer election
+
+    def _try_lock(self) -> bool:
+        """Try to become the writer. POSIX record locks are per process, so forked children never hold it."""
+        if fcntl is None:
+            return True
+        if self._lock_file is None:
+            self._lock_file = open(self.state_path / "writer.lock", "a+")
+        try:
+            fcntl.lockf(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    async def start(self):
+        """Run jobs if no other process does; otherwise stand by to take over."""
+        self._queue = asyncio.Queue()
+        if self._try_lock():
+            self._become_writer()
+        else:
+            self._tasks = [asyncio.create_task(self._wait_for_lock())]
+
+    async def _wait_for_lock(self):
+        while not self._try_lock():
+            await asyncio.sleep(self.poll_interval * 10)
+        print("✅ Took over as the writer process")
+        self._become_writer()
+
+    def _become_writer(self):
+        self.is_writer = True
+        self._upgrade_state_file()
+        self._upgrade_pending_files()
+        self._history = [_figures(job) for job in self._read_dir(self.state_path)]
+        self._trim_history()
+        for job in self._read_pending():
+            # Whoever was running it is gone: run it again, if its upload survived
+            if job.get("upload", True) and not self._spool_file(job["id"]).exists():
+                job.update(status="failed", error="Upload was lost during a restart", finished_at=time.time())
+            else:
+                job.update(status="queued", started_at=None)
+                self._enqueue(job)
+            self._save(job)
+        if self.on_writer is not None:
+            self.on_writer()
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._poll()))
+
+    async def stop(self):
+        """Stop the workers and hand the writer role on. Unfinished jobs resume with the next writer."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        self.is_writer = False
+
+    # Submitting
+
+    async def submit(self, file=None, chunk_size: int = 1024 * 1024, **params) -> Dict[str, Any]:
+        """
+        Queue a job, spooling ``file`` (if any) to disk first; returns the new job.
+
+        ``params`` (JSON-serializable) are stored with the job and passed to the handler.
+        """
+        if self.is_writer:
+            queued = self._queue.qsize()
+        else:
+            queued = sum(job["status"] == "queued" for job in await asyncio.to_thread(self._read_pending))
+        if queued >= self.max_queued:
+            raise IngestBusyError(f"Ingestion queue is full ({self.max_queued} jobs waiting), try again shortly")
+        job_id = f"job_{uuid.uuid4().hex[:12]}"
+
+        size = 0
+        if file is not None:
+            # Disk writes run in a thread so a large upload never stalls the event loop
+            spool = await asyncio.to_thread(open, self._spool_file(job_id), "wb")
+            try:
+                while True:
+                    block = await file.read(chunk_size)
+                    if not block:
+                        break
+                    await asyncio.to_thread(spool.write, block)
+                    size += len(block)
+            finally:
+                await asyncio.to_thread(spool.close)
+
+        job = {
+            "id": job_id,
+            "filename": (getattr(file, "filename", None) or "unknown.txt") if file is not None else None,
+            "upload": file is not None,
+            "params": params,
+            "size": size,
+            "status": "queued",
+            "message": None,
+            "error": None,
+            "pages_total": None,
+            "pages_parsed": 0,
+            "chunks": 0,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        await asyncio.to_thread(self._save, job)
+        if self.is_writer:
+            self._enqueue(job)
+        return job
+
+    async def wait(self, job_id: str, timeout: float = 60.0) -> Optional[Dict[str, Any]]:
+        """Wait for a job to finish; returns its final state (or the current one on timeout)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] not in UNFINISHED or time.monotonic() >= deadline:
+                return job
+            await asyncio.sleep(0.05)
+
+    # Running (writer only)
+
+    def _enqueue(self, job: Dict[str, Any]):
+        self.jobs[job["id"]] = job
+        self._queue.put_nowait(job["id"])
+
+    async def _poll(self):
+        """Queue jobs that other processes submitted."""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for job in self._read_pending():
+                if job["status"] == "queued" and job["id"] not in self.jobs:
+                    self._enqueue(job)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(self.jobs[job_id])
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Dict[str, Any]):
+        job.update(status="running", started_at=time.time())
+        self._save(job)
+        last_saved = time.monotonic()
+
+        def progress(**fields):
+            nonlocal last_saved
+            job.update(fields)
+            # Other processes read progress from the job file; don't rewrite it on every update
+            if time.monotonic() - last_saved >= 1.0:
+                self._save(job)
+                last_saved = time.monotonic()
+
+        spool = self._spool_file(job["id"])
+        upload = SpooledUpload(spool, job["filename"]) if job.get("upload", True) else None
+        try:
+            job["message"] = await self.handler(upload, progress, **job.get("params", {}))
+            job["status"] = "done"
+        except asyncio.CancelledError:
+            # Shutting down: leave the job queued for the next writer
+            job.update(status="queued", started_at=None)
+            self._save(job)
+            raise
+        except Exception as e:
+            job.update(status="failed", error=str(e))
+        finally:
+            if upload is not None:
+                upload.close()
+
+        job["finished_at"] = time.time()
+        spool.unlink(missing_ok=True)
+        self._save(job)
+        # Finished jobs are served from their files from now on
+        del self.jobs[job["id"]]
+        self._history.append(_figures(job))
+        self._trim_history()
+
+    def _trim_history(self):
+        """Delete the oldest finished jobs beyond ``max_history`` and publish the figures of the rest."""
+        excess = max(0, len(self._history) - self.max_history)
+        for figures in self._history[:excess]:
+            self._job_file(figures["id"]).unlink(missing_ok=True)
+        del self._history[:excess]
+        done = [figures for figures in self._history if figures["status"] == "done" and figures["seconds"] is not None]
+        _write_json(self.state_path / "stats.json", {
+            "completed": len(done),
+            "failed": sum(figures["status"] == "failed" for figures in self._history),
+            "busy_seconds": sum(figures["seconds"] for figures in done),
+            "chunks": sum(figures["chunks"] for figures in done),
+        })
+
+    # Status
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status of one job."""
+        if job_id in self.jobs:
+            return self.jobs[job_id]
+        return self._read(job_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth, running jobs and recent throughput."""
+        pending = self._read_pending()
+        try:
+            finished = json.loads((self.state_path / "stats.json").read_text())
+        except (OSError, ValueError):
+            finished = {"completed": 0, "failed": 0, "busy_seconds": 0, "chunks": 0}
+        completed, busy_seconds = finished["completed"], finished["busy_seconds"]
+        return {
+            "queue_depth": sum(job["status"] == "queued" for job in pending),
+            "running": sum(job["status"] == "running" for job in pending),
+            "workers": self.workers,
+            "writer": self.is_writer,
+            "completed": completed,
+            "failed": finished["failed"],
+            "avg_seconds": round(busy_seconds / completed, 3) if completed else None,
+            "chunks_per_second": round(finished["chunks"] / busy_seconds, 1) if busy_seconds else None,
+        }
+
+
+def _write_json(path: Path, data: Dict[str, Any]):
+    """Replace a JSON file atomically; the temp name is per process, as several may write."""
+    tmp = path.with_name(f"{path.stem}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False))
+    os.replace(tmp, path)
+
+
+def _figures(job: Dict[str, Any]) -> Dict[str, Any]:
+    """What the throughput figures need of a finished job."""
+    ran = job["status"] == "done" and job.get("started_at") and job.get("finished_at")
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "seconds": job["finished_at"] - job["started_at"] if ran else None,
+        "chunks": job.get("chunks") or 0,
+    }
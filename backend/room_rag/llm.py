@@ -0,0 +1,294 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+# Failures worth another attempt; anything else (bad request, auth) is final
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,  # includes APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class LLMBusyError(Exception):
+    """Raised when too many LLM requests are already waiting for a slot."""
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait, if it sent a Retry-After header."""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class LLMClient:
+    """
+    Chat completions through one pooled connection to an OpenAI-compatible API.
+
+    At most ``max_concurrency`` requests are in flight; up to ``max_queued``
+    more wait for a slot and further ones fail fast with ``LLMBusyError``.
+    Every call has a deadline covering queueing, retries and the response.
+    Connection errors, rate limits and 5xx responses are retried with
+    full-jitter exponential backoff (honouring Retry-After) while the
+    deadline allows. With ``hedge_after`` set, a completion that has not
+    returned after that many seconds is sent a second time if a slot is free,
+    and whichever answer comes first wins. Streams are never hedged and only
+    retried before their first chunk.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, client: Any = None,
+                 max_concurrency: Optional[int] = None, max_queued: Optional[int] = None,
+                 timeout: Optional[float] = None, max_retries: Optional[int] = None,
+                 hedge_after: Optional[float] = None, pool_size: Optional[int] = None):
+        """
+        Args:
+            api_key: API key for a client created here
+            base_url: API base URL for a client created here
+            client: An existing ``AsyncOpenAI``-compatible client to use instead
+            max_concurrency: Requests in flight at once
+            max_queued: Requests allowed to wait for a slot
+            timeout: Deadline in seconds per call, including waiting and retries
+            max_retries: Retries after the first attempt
+            hedge_after: Seconds before a slow completion is hedged (0 disables)
+            pool_size: HTTP connections kept to the API
+        """
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+        self.max_queued = max_queued if max_queued is not None else int(os.getenv("LLM_MAX_QUEUED", 64))
+        self.timeout = timeout or float(os.getenv("LLM_TIMEOUT", 30))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("LLM_MAX_RETRIES", 2))
+        self.hedge_after = hedge_after if hedge_after is not None else float(os.getenv("LLM_HEDGE_AFTER", 0))
+        self.pool_size = pool_size or int(os.getenv("LLM_POOL_SIZE", 32))
+        self.base_url = base_url
+        self.backoff_base = 0.25
+        self.backoff_cap = 4.0
+
+        self._http_client = None
+        if client is None:
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                    keepalive_expiry=30,
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=min(5.0, self.timeout)),
+            )
+            # Retries are ours, so they respect the deadline
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0, http_client=self._http_client)
+        self.client = client
+
+        # Created on first use so it belongs to the serving event loop
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.requests = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._queue_seconds = 0.0
+        self._latency_seconds = 0.0
+
+    # Admission
+
+    def _limiter(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    @asynccontextmanager
+    async def _slot(self, deadline: float) -> AsyncIterator[None]:
+        """Hold one of the ``max_concurrency`` request slots, waiting until ``deadline`` at most."""
+        limiter = self._limiter()
+        self.requests += 1
+        if limiter.locked() and self.waiting >= self.max_queued:
+            self.rejected += 1
+            raise LLMBusyError(f"{self.waiting} LLM requests are already waiting, try again shortly")
+        self.waiting += 1
+        queued_at = time.monotonic()
+        try:
+            if limiter.locked():
+                await asyncio.wait_for(limiter.acquire(), max(0.0, deadline - queued_at))
+            else:
+                # Free slot: take it before yielding to the loop
+                await limiter.acquire()
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise asyncio.TimeoutError(f"No LLM request slot freed up within {self.timeout:g}s") from None
+        finally:
+            self.waiting -= 1
+            self._queue_seconds += time.monotonic() - queued_at
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            limiter.release()
+
+    # Calls
+
+    async def complete(self, **kwargs) -> Any:
+        """Create a chat completion (``chat.completions.create`` arguments)."""
+        deadline = time.monotonic() + self.timeout
+        async with self._slot(deadline):
+            started = time.monotonic()
+            try:
+                response = await self._with_retries(lambda: self._hedged(kwargs), deadline)
+            except Exception:
+                self.failed += 1
+                raise
+            self._finished(started)
+            return response
+
+    async def stream(self, **kwargs) -> AsyncIterator[Any]:
+        """Stream a chat completion, yielding the API's chunks."""
+        deadline = time.monotonic() + self.timeout
+        async with self._slot(deadline):
+            started = time.monotonic()
+            try:
+                stream = await self._with_retries(
+                    lambda: self.client.chat.completions.create(stream=True, **kwargs), deadline
+                )
+                async for chunk in stream:
+                    yield chunk
+            except Exception:
+                self.failed += 1
+                raise
+            self._finished(started)
+
+    async def _with_retries(self, call, deadline: float):
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                return await asyncio.wait_for(call(), remaining)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise asyncio.TimeoutError(f"LLM request exceeded its {self.timeout:g}s deadline") from None
+            except RETRYABLE_ERRORS as e:
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                delay = max(delay, _retry_after(e) or 0)
+                if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+                attempt += 1
+                self.retries += 1
+                print(f"🔁 LLM request failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def _hedged(self, kwargs: Dict[str, Any]) -> Any:
+        """Send a completion, and send it again if it is slow and a slot is free."""
+        first = asyncio.ensure_future(self.client.chat.completions.create(**kwargs))
+        tasks = {first}
+        try:
+            if not self.hedge_after:
+                return await first
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            limiter = self._limiter()
+            # Hedges only use spare capacity, so they never queue ahead of real requests
+            if done or limiter.locked():
+                return await first
+
+            await limiter.acquire()
+            self.hedges += 1
+            try:
+                second = asyncio.ensure_future(self.client.chat.completions.create(**kwargs))
+                tasks.add(second)
+                pending = set(tasks)
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            if task is second:
+                                self.hedge_wins += 1
+                            return task.result()
+                # Both attempts failed
+                return first.result()
+            finally:
+                limiter.release()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def close(self):
+        """Close the connection pool, if this client created it."""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+
+    def _finished(self, started: float):
+        self.completed += 1
+        self._latency_seconds += time.monotonic() - started
+
+    # Metrics
+
+    def _open_connections(self) -> Optional[int]:
+        # httpx has no public pool introspection; report it when the internals allow
+        pool = getattr(getattr(self._http_client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        return len(connections) if connections is not None else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Concurrency, queue, retry/hedge and latency figures."""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_queued": self.max_queued,
+            "requests": self.requests,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "avg_queue_ms": round(1000 * self._queue_seconds / self.requests, 1) if self.requests else None,
+            "avg_latency_ms": round(1000 * self._latency_seconds / self.completed, 1) if self.completed else None,
+            "pool": {"max_connections": self.pool_size, "open_connections": self._open_connections()},
+        }
+
+
+_clients: Dict[Tuple[str, Optional[str]], LLMClient] = {}
+_clients_lock = threading.Lock()
+
+
+def shared_client(api_key: str, base_url: Optional[str] = None) -> LLMClient:
+    """The process-wide client for an API key and base URL; every engine shares it."""
+    with _clients_lock:
+        key = (api_key, base_url)
+        if key not in _clients:
+            _clients[key] = LLMClient(api_key=api_key, base_url=base_url)
+        return _clients[key]
+
+
+def get_stats() -> Dict[str, Any]:
+    """Figures of every shared client, by base URL."""
+    with _clients_lock:
+        clients = list(_clients.values())
+    return {client.base_url or "https://api.openai.com/v1": client.get_stats() for client in clients}
+
+
+async def close_clients():
+    """Close every shared client's connections."""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        await client.close()
@@ -0,0 +1,219 @@
+import contextvars
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Upper bounds of the token count histogram buckets
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+Labels = Dict[str, str]
+
+
+class Histogram:
+    """Counts of observed values per bucket, with their sum, as Prometheus histograms keep them."""
+
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last one is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """``(le, count)`` pairs, each bucket counting every value up to its bound."""
+        pairs, running = [], 0
+        for bound, count in zip([*map(_number, self.buckets), "+Inf"], self.counts):
+            running += count
+            pairs.append((bound, running))
+        return pairs
+
+
+class Gauge(NamedTuple):
+    """A gauge family: its name, help text and one value per label set."""
+    name: str
+    help: str
+    samples: List[Tuple[Labels, float]]
+
+
+# What the current request is ("chat", "upload", ...), the time its stages took and the tokens it used so far
+_operation: contextvars.ContextVar = contextvars.ContextVar("room_operation", default=None)
+_timings: contextvars.ContextVar = contextvars.ContextVar("room_timings", default=None)
+_usage: contextvars.ContextVar = contextvars.ContextVar("room_usage", default=None)
+
+_lock = threading.Lock()
+_stages: Dict[Tuple[str, str], Histogram] = {}
+_requests: Dict[Tuple[str, str], Histogram] = {}
+_tokens: Dict[Tuple[str, str], Histogram] = {}
+
+
+def observe(stage: str, seconds: float, operation: Optional[str] = None):
+    """Record time spent in a stage of the current request (``operation`` overrides it)."""
+    operation = operation or _operation.get() or "background"
+    with _lock:
+        histogram = _stages.get((operation, stage))
+        if histogram is None:
+            histogram = _stages[(operation, stage)] = Histogram()
+        histogram.observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def count_tokens(kind: str, tokens: int, operation: Optional[str] = None):
+    """Record tokens of one kind (``"context"``, ``"prompt"``, ...) used by the current request."""
+    operation = operation or _operation.get() or "background"
+    with _lock:
+        histogram = _tokens.get((operation, kind))
+        if histogram is None:
+            histogram = _tokens[(operation, kind)] = Histogram(TOKEN_BUCKETS)
+        histogram.observe(tokens)
+    usage = _usage.get()
+    if usage is not None:
+        usage[kind] = usage.get(kind, 0) + tokens
+
+
+def usage() -> Dict[str, int]:
+    """Tokens the current request has used so far, by kind."""
+    return dict(_usage.get() or {})
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the enclosed block as stage ``name`` of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+@contextmanager
+def request(operation: str) -> Iterator[Dict[str, float]]:
+    """
+    Time a request and label the stages timed within it with ``operation``.
+
+    Yields the request's stage timings (seconds per stage), filled in as
+    its stages finish, including those run in worker threads.
+    """
+    timings: Dict[str, float] = {}
+    operation_token = _operation.set(operation)
+    timings_token = _timings.set(timings)
+    usage_token = _usage.set({})
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield timings
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            histogram = _requests.get((operation, status))
+            if histogram is None:
+                histogram = _requests[(operation, status)] = Histogram()
+            histogram.observe(elapsed)
+        try:
+            _usage.reset(usage_token)
+            _timings.reset(timings_token)
+            _operation.reset(operation_token)
+        except ValueError:
+            pass  # A streamed response may finish in another context
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """``Server-Timing`` header value for a request's stage timings."""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+
+def process_memory() -> int:
+    """Current resident set size of this process (peak size where that is all there is)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) or abs(value) >= 1e15 else str(int(value))
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+def _histogram_family(name: str, help: str, histograms: Dict[Tuple[str, ...], Histogram],
+                      label_names: Tuple[str, ...]) -> List[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+    for key, histogram in sorted(histograms.items()):
+        labels = dict(zip(label_names, key))
+        for bound, count in histogram.cumulative():
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {count}")
+        lines.append(f"{name}_sum{_labels(labels)} {histogram.total!r}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+    return lines
+
+
+def render(gauges: Sequence[Gauge] = ()) -> str:
+    """Every histogram, then ``gauges``, in the Prometheus text exposition format."""
+    with _lock:
+        stages = {key: _copy(histogram) for key, histogram in _stages.items()}
+        requests = {key: _copy(histogram) for key, histogram in _requests.items()}
+        tokens = {key: _copy(histogram) for key, histogram in _tokens.items()}
+    lines = _histogram_family("room_request_duration_seconds", "Time to serve a request, by operation and outcome.",
+                              requests, ("operation", "status"))
+    lines += _histogram_family("room_stage_duration_seconds", "Time spent in each stage of a request.",
+                               stages, ("operation", "stage"))
+    lines += _histogram_family("room_request_tokens", "Tokens a request sent to or got from the model, by kind.",
+                               tokens, ("operation", "kind"))
+    for gauge in gauges:
+        lines += [f"# HELP {gauge.name} {gauge.help}", f"# TYPE {gauge.name} gauge"]
+        lines += [f"{gauge.name}{_labels(labels)} {_number(value)}" for labels, value in gauge.samples]
+    return "\n".join(lines) + "\n"
+
+
+def _copy(histogram: Histogram) -> Histogram:
+    copy = Histogram(histogram.buckets)
+    copy.counts, copy.total, copy.count = list(histogram.counts), histogram.total, histogram.count
+    return copy
+
+
+def get_stats() -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Calls and mean latency per operation and stage, and mean tokens per operation and kind."""
+    with _lock:
+        return {
+            "requests": {f"{operation} {status}": _summary(h) for (operation, status), h in sorted(_requests.items())},
+            "stages": {f"{operation} {stage}": _summary(h) for (operation, stage), h in sorted(_stages.items())},
+            "tokens": {f"{operation} {kind}": {"calls": h.count, "avg": round(h.total / h.count, 1)}
+                       for (operation, kind), h in sorted(_tokens.items())},
+        }
+
+
+def _summary(histogram: Histogram) -> Dict[str, float]:
+    return {"calls": histogram.count, "avg_ms": round(1000 * histogram.total / histogram.count, 3)}
+
+
+def reset():
+    """Forget every observation."""
+    with _lock:
+        _stages.clear()
+        _requests.clear()
+        _tokens.clear()
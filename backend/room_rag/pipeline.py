@@ -0,0 +1,236 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .batching import MicroBatcher
+
+DEFAULT_RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# A retriever maps (query, top_k) to [(chunk_id, score), ...], best first
+Retriever = Callable[[str, int], List[Tuple[int, float]]]
+
+
+def parse_budgets(spec: str) -> Dict[str, float]:
+    """Parse ``"lexical=50,dense=200"`` (milliseconds) into seconds per stage."""
+    budgets = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            budgets[name.strip()] = float(value) / 1000
+    return budgets
+
+
+def reciprocal_rank_fusion(rankings: Sequence[List[Tuple[int, float]]], k: int = 60) -> List[Tuple[int, float]]:
+    """
+    Fuse ranked lists with reciprocal-rank fusion.
+
+    Each chunk scores ``sum(1 / (k + rank))`` over the lists it appears in,
+    so raw scores from different retrievers never need to be comparable.
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, (chunk_id, _) in enumerate(ranking, 1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+# Cross-encoders loaded in this process, shared by every reranker instance
+_models: Dict[str, object] = {}
+_batchers: Dict[str, MicroBatcher] = {}
+_models_lock = threading.Lock()
+
+# Synchronous stages run on a pool of their own. A thread cannot be cancelled,
+# so a stage that misses its budget keeps its worker until it returns; here
+# such stragglers can only delay other stages, never starve the default
+# executor that the rest of the server's asyncio.to_thread calls share.
+_stage_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_stage_executor() -> ThreadPoolExecutor:
+    global _stage_executor
+    with _models_lock:
+        if _stage_executor is None:
+            _stage_executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("PIPELINE_STAGE_WORKERS", 8)), thread_name_prefix="retrieval-stage"
+            )
+        return _stage_executor
+
+
+def load_cross_encoder(model_name: str):
+    """Load a cross-encoder once per process."""
+    with _models_lock:
+        if model_name not in _models:
+            from sentence_transformers import CrossEncoder
+            _models[model_name] = CrossEncoder(model_name, device="cpu")
+            print(f"✅ Loaded reranker model: {model_name}")
+        return _models[model_name]
+
+
+def _score_requests(model_name: str, requests: List[Tuple[str, Tuple[str, ...]]]) -> List[List[float]]:
+    """Score several requests' (query, texts) in one forward pass."""
+    pairs = [(query, text) for query, texts in requests for text in texts]
+    scores = [float(score) for score in load_cross_encoder(model_name).predict(pairs)] if pairs else []
+    results, start = [], 0
+    for _, texts in requests:
+        results.append(scores[start:start + len(texts)])
+        start += len(texts)
+    return results
+
+
+class CrossEncoderReranker:
+    """Local sentence-transformers cross-encoder, loaded on first use."""
+
+    def __init__(self, model_name: Optional[str] = None):
+        self.model_name = model_name or os.getenv("RERANKER_MODEL", DEFAULT_RERANKER_MODEL)
+
+    def __call__(self, query: str, texts: List[str]) -> List[float]:
+        """Score each text's relevance to the query."""
+        return _score_requests(self.model_name, [(query, tuple(texts))])[0]
+
+    async def score(self, query: str, texts: List[str]) -> List[float]:
+        """Like calling the reranker, but batched with other requests reranking at the same time."""
+        with _models_lock:
+            if self.model_name not in _batchers:
+                model_name = self.model_name
+                _batchers[model_name] = MicroBatcher(
+                    lambda requests: _score_requests(model_name, requests),
+                    max_batch=int(os.getenv("RERANK_BATCH_MAX_SIZE", 8)),
+                    max_wait=float(os.getenv("RERANK_BATCH_MAX_WAIT_MS", 5)) / 1000,
+                )
+            batcher = _batchers[self.model_name]
+        return await batcher.submit((query, tuple(texts)))
+
+
+def get_batcher_stats() -> Dict[str, Dict]:
+    """Figures of every reranking batcher, by model."""
+    with _models_lock:
+        return {name: batcher.get_stats() for name, batcher in _batchers.items()}
+
+
+class StageStats:
+    """Running latency figures for one pipeline stage."""
+
+    __slots__ = ("calls", "timeouts", "total", "max")
+
+    def __init__(self):
+        self.calls = 0
+        self.timeouts = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, elapsed: float, timed_out: bool):
+        self.calls += 1
+        self.timeouts += timed_out
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "avg_ms": round(1000 * self.total / self.calls, 3) if self.calls else 0.0,
+            "max_ms": round(1000 * self.max, 3),
+        }
+
+
+class RetrievalPipeline:
+    """
+    Staged retrieval: concurrent retrievers, reciprocal-rank fusion, optional reranking.
+
+    Every retriever runs under its own latency budget, on the pipeline's
+    bounded thread pool unless it is a coroutine function (which is awaited
+    directly, and cancelled when it runs out of time). A thread cannot be
+    cancelled, so a synchronous stage that misses its budget runs on in the
+    background until it returns. A stage that misses its budget is dropped
+    from fusion instead of delaying
+    the answer, and a reranker that misses its budget leaves the fused order
+    in place. Per-stage timings are returned with each result and aggregated
+    in ``stats``.
+    """
+
+    def __init__(self, retrievers: Dict[str, Retriever], get_text: Callable[[int], str],
+                 reranker: Optional[Callable[[str, List[str]], List[float]]] = None,
+                 budgets: Optional[Dict[str, float]] = None, candidates: int = 20, rrf_k: int = 60):
+        """
+        Args:
+            retrievers: Named retrieval stages, run concurrently
+            get_text: Resolves a chunk id to its text (for the reranker)
+            reranker: Optional ``(query, texts) -> scores`` callable
+            budgets: Seconds allowed per stage name ("rerank" for the reranker);
+                stages without a budget are not time-limited
+            candidates: How many results each retriever contributes, and how
+                many fused results are passed to the reranker
+            rrf_k: Reciprocal-rank fusion constant
+        """
+        self.retrievers = retrievers
+        self.get_text = get_text
+        self.reranker = reranker
+        self.budgets = budgets or {}
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.stats: Dict[str, StageStats] = {}
+
+    async def _run_stage(self, name: str, fn: Callable, *args):
+        """Run a stage under its budget; return (result, elapsed, timed_out)."""
+        start = time.perf_counter()
+        if asyncio.iscoroutinefunction(fn):
+            call = fn(*args)
+        else:
+            context = contextvars.copy_context()
+            call = asyncio.get_running_loop().run_in_executor(
+                _get_stage_executor(), functools.partial(context.run, fn, *args)
+            )
+        try:
+            result = await asyncio.wait_for(call, self.budgets.get(name))
+            timed_out = False
+        except asyncio.TimeoutError:
+            result, timed_out = None, True
+        elapsed = time.perf_counter() - start
+        self.stats.setdefault(name, StageStats()).record(elapsed, timed_out)
+        return result, elapsed, timed_out
+
+    async def retrieve(self, query: str, top_k: int = 5) -> Tuple[List[Tuple[int, float]], Dict[str, Dict]]:
+        """
+        Retrieve the best chunks for a query.
+
+        Returns:
+            ``(hits, timings)`` where hits are ``(chunk_id, score)`` pairs, best
+            first, and timings maps each stage to its latency and timeout flag.
+        """
+        timings: Dict[str, Dict] = {}
+        names = list(self.retrievers)
+        results = await asyncio.gather(*(
+            self._run_stage(name, self.retrievers[name], query, self.candidates) for name in names
+        ))
+
+        rankings = []
+        for name, (hits, elapsed, timed_out) in zip(names, results):
+            timings[name] = {"ms": round(elapsed * 1000, 3), "timed_out": timed_out}
+            if hits:
+                rankings.append(hits)
+
+        start = time.perf_counter()
+        fused = reciprocal_rank_fusion(rankings, self.rrf_k)
+        timings["fusion"] = {"ms": round((time.perf_counter() - start) * 1000, 3), "timed_out": False}
+
+        if self.reranker is not None and len(fused) > 1:
+            candidates = fused[:self.candidates]
+            texts = [self.get_text(chunk_id) for chunk_id, _ in candidates]
+            scores, elapsed, timed_out = await self._run_stage("rerank", self.reranker, query, texts)
+            timings["rerank"] = {"ms": round(elapsed * 1000, 3), "timed_out": timed_out}
+            if scores is not None:
+                fused = sorted(
+                    ((chunk_id, score) for (chunk_id, _), score in zip(candidates, scores)),
+                    key=lambda item: item[1], reverse=True
+                )
+
+        return fused[:top_k], timings
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Aggregated latency per stage."""
+        return {name: stats.to_dict() for name, stats in self.stats.items()}
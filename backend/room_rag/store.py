@@ -0,0 +1,635 @@
+import json
+import mmap
+import os
+import pickle
+import uuid
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+MANIFEST = "MANIFEST"
+
+# One on-disk row per chunk: end byte offset in the data file (the start is the
+# previous chunk's end), source page (0 when unknown) and the character offset
+# of the chunk within its document's cleaned text (-1 when unknown)
+CHUNK_DTYPE = np.dtype([("end", "<i8"), ("page", "<i4"), ("char_start", "<i8")])
+
+
+def _fsync_write(path: Path, data: bytes):
+    """Write a file durably: write to a temp file, fsync, then rename over."""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path.parent)
+
+
+def _fsync_dir(path: Path):
+    """Persist a rename by syncing the containing directory."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class DocumentRecord:
+    """Metadata of one stored document and the range of chunk ids it owns."""
+
+    __slots__ = ("doc_id", "filename", "size", "preview", "first_chunk", "chunk_count", "extra")
+
+    def __init__(self, doc_id: str, filename: str, size: int = 0, preview: str = "",
+                 first_chunk: int = 0, chunk_count: int = 0, extra: Optional[Dict[str, Any]] = None):
+        self.doc_id = doc_id
+        self.filename = filename
+        self.size = size
+        self.preview = preview
+        self.first_chunk = first_chunk
+        self.chunk_count = chunk_count
+        # Any other metadata the caller attached
+        self.extra = extra or {}
+
+    @classmethod
+    def from_dict(cls, record: Dict[str, Any]) -> "DocumentRecord":
+        fields = {name: record[name] for name in cls.__slots__ if name in record and name != "extra"}
+        extra = {key: value for key, value in record.items() if key not in cls.__slots__ and key != "op"}
+        return cls(**fields, extra=extra)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "doc_id": self.doc_id,
+            "filename": self.filename,
+            "size": self.size,
+            "preview": self.preview,
+            "first_chunk": self.first_chunk,
+            "chunk_count": self.chunk_count,
+            **self.extra,
+        }
+
+    @property
+    def chunk_ids(self) -> range:
+        return range(self.first_chunk, self.first_chunk + self.chunk_count)
+
+    def __repr__(self) -> str:
+        return f"DocumentRecord({self.doc_id!r}, {self.filename!r}, chunks={self.chunk_count})"
+
+
+class _Column:
+    """Growable numpy array with amortized O(1) appends."""
+
+    __slots__ = ("data", "size")
+
+    def __init__(self, dtype):
+        self.data = np.zeros(16, dtype=dtype)
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def values(self) -> np.ndarray:
+        """The filled part of the column (a view, not a copy)."""
+        return self.data[:self.size]
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.data.dtype)
+        needed = self.size + len(values)
+        if needed > len(self.data):
+            grown = np.zeros(max(needed, 2 * len(self.data)), dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:needed] = values
+        self.size = needed
+
+
+class ChunkStore:
+    """
+    Persistent, append-only columnar store for text chunks and document metadata.
+
+    Every generation ``<gen>`` of the store is a set of files:
+
+    - ``chunks.<gen>.dat``: UTF-8 chunk text, appended back to back
+    - ``chunks.<gen>.col``: one ``CHUNK_DTYPE`` row per chunk (end offset, page, char offset)
+    - ``docs.<gen>.log``: JSON lines, one ``add`` or ``delete`` record per event
+    - ``<name>.<gen>.pkl``: optional snapshots of the search indexes
+
+    In memory a chunk costs a few numpy array slots (end offset, owning
+    document, page, char offset); its text is memory-mapped and only decoded
+    when the chunk is read. ``MANIFEST`` names the live generation and is
+    swapped atomically, so a crash during compaction leaves the previous
+    generation untouched.
+    """
+
+    def __init__(self, path: Path, readonly: bool = False):
+        """
+        Open (or create) a store rooted at ``path``.
+
+        A ``readonly`` store never writes, truncates or deletes files, so any
+        number of processes can open it next to the single process that
+        writes; ``refresh`` picks up what the writer has committed since.
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.readonly = readonly
+
+        self.generation = self._read_manifest()
+        self._reset()
+        self._mm: Optional[mmap.mmap] = None
+        self._mm_size = 0
+
+        if not readonly:
+            self._remove_stale_generations()
+        self._load()
+
+    def _reset(self):
+        # Applied log events, in order, as ("add" | "delete", document)
+        self.records: List[Tuple[str, DocumentRecord]] = []
+        # Live documents by id
+        self.documents: Dict[str, DocumentRecord] = {}
+        self.dead_chunks = 0
+        # Bytes of the log consumed so far (complete lines only)
+        self._log_offset = 0
+
+        # Every document ever added in this generation; chunk -> row in this list
+        self._doc_table: List[DocumentRecord] = []
+        self._ends = _Column(np.int64)
+        self._docs = _Column(np.int32)
+        self._pages = _Column(np.int32)
+        self._char_starts = _Column(np.int64)
+
+    # Files of the live generation
+
+    def _file(self, kind: str, ext: str, generation: Optional[int] = None) -> Path:
+        gen = self.generation if generation is None else generation
+        return self.path / f"{kind}.{gen}.{ext}"
+
+    @property
+    def data_file(self) -> Path:
+        return self._file("chunks", "dat")
+
+    @property
+    def columns_file(self) -> Path:
+        return self._file("chunks", "col")
+
+    @property
+    def log_file(self) -> Path:
+        return self._file("docs", "log")
+
+    def _read_manifest(self) -> int:
+        try:
+            return json.loads((self.path / MANIFEST).read_text())["generation"]
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def _write_manifest(self, generation: int):
+        _fsync_write(self.path / MANIFEST, json.dumps({"generation": generation}).encode())
+
+    def _remove_stale_generations(self):
+        """Delete files left behind by older generations or an interrupted compaction."""
+        for entry in self.path.iterdir():
+            parts = entry.name.split(".")
+            if entry.name == MANIFEST or not entry.is_file():
+                continue
+            if len(parts) != 3 or parts[1] != str(self.generation):
+                entry.unlink()
+
+    # Loading
+
+    def _load(self):
+        """
+        Replay log records written since the last load.
+
+        A writable store then drops anything written after the last commit;
+        a read-only one leaves a half-written tail for the writer to finish.
+        """
+        first_doc = len(self._doc_table)
+        loaded_chunks = committed_chunks = len(self)
+        if self.log_file.exists():
+            with open(self.log_file, "rb") as f:
+                f.seek(self._log_offset)
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("incomplete line")
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn (or in-progress) write at the tail; everything after it is uncommitted
+                        break
+                    self._apply(record)
+                    self._log_offset += len(line)
+                    if record["op"] == "add":
+                        committed_chunks = record["first_chunk"] + record["chunk_count"]
+
+        if not self.readonly:
+            self._upgrade_offsets_file()
+        if committed_chunks > loaded_chunks:
+            self._extend_columns(self._read_rows(loaded_chunks, committed_chunks), first_doc)
+
+        if not self.readonly:
+            self._truncate(self.log_file, self._log_offset)
+            self._truncate(self.columns_file, len(self) * CHUNK_DTYPE.itemsize)
+            self._truncate(self.data_file, self._data_end())
+
+    def _read_rows(self, start: int, end: int) -> np.ndarray:
+        """Column rows of chunks ``[start, end)``."""
+        if not self.columns_file.exists():
+            return self._legacy_rows()[start:end]
+        with open(self.columns_file, "rb") as f:
+            f.seek(start * CHUNK_DTYPE.itemsize)
+            return np.frombuffer(f.read((end - start) * CHUNK_DTYPE.itemsize), dtype=CHUNK_DTYPE)
+
+    def _legacy_rows(self) -> np.ndarray:
+        """Rows converted from a ``chunks.<gen>.off`` file of (start, end) pairs written by older versions."""
+        legacy = self._file("chunks", "off")
+        pairs = np.fromfile(legacy, dtype="<i8") if legacy.exists() else np.empty(0, dtype="<i8")
+        rows = np.zeros(len(pairs) // 2, dtype=CHUNK_DTYPE)
+        rows["end"] = pairs[1::2]
+        rows["char_start"] = -1
+        return rows
+
+    def _upgrade_offsets_file(self):
+        """Rewrite an older version's offsets file as a columns file."""
+        legacy = self._file("chunks", "off")
+        if not legacy.exists() or self.columns_file.exists():
+            return
+        _fsync_write(self.columns_file, self._legacy_rows().tobytes())
+        legacy.unlink()
+
+    def changed(self) -> bool:
+        """Whether another process has committed to (or compacted) the store since the last load."""
+        if self._read_manifest() != self.generation:
+            return True
+        try:
+            return self.log_file.stat().st_size > self._log_offset
+        except FileNotFoundError:
+            return False
+
+    def refresh(self) -> bool:
+        """
+        Load what the writing process has committed since the last load.
+
+        Returns:
+            ``True`` if new records were appended to ``records``; ``False`` if
+            the store moved to a new generation and was reloaded from scratch.
+        """
+        generation = self._read_manifest()
+        if generation == self.generation:
+            self._load()
+            return True
+        self.close()
+        self.generation = generation
+        self._reset()
+        self._load()
+        return False
+
+    @staticmethod
+    def _truncate(path: Path, size: int):
+        with open(path, "ab") as f:
+            if f.tell() != size:
+                f.truncate(size)
+
+    def _apply(self, record: Dict[str, Any]):
+        if record["op"] == "add":
+            doc = DocumentRecord.from_dict(record)
+            self.documents[doc.doc_id] = doc
+            self._doc_table.append(doc)
+            self.records.append(("add", doc))
+        elif record["op"] == "delete":
+            doc = self.documents.pop(record["doc_id"], None)
+            if doc:
+                self.dead_chunks += doc.chunk_count
+                self.records.append(("delete", doc))
+
+    def _extend_columns(self, rows: np.ndarray, first_doc: int = 0):
+        """Append chunk rows owned by the documents from row ``first_doc`` of ``_doc_table`` on."""
+        docs = self._doc_table[first_doc:]
+        owners = np.repeat(np.arange(first_doc, len(self._doc_table), dtype=np.int32),
+                           [doc.chunk_count for doc in docs])
+        self._ends.extend(rows["end"])
+        self._pages.extend(rows["page"])
+        self._char_starts.extend(rows["char_start"])
+        self._docs.extend(owners[:len(rows)])
+
+    def _data_end(self) -> int:
+        return int(self._ends.data[self._ends.size - 1]) if len(self) else 0
+
+    # Chunk access
+
+    def __len__(self) -> int:
+        return len(self._ends)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("chunk id out of range")
+        start, end = self._span(key)
+        if start == end:
+            return ""
+        return bytes(self._map(end)[start:end]).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def _span(self, chunk_id: int) -> Tuple[int, int]:
+        """Byte range of a chunk in the data file."""
+        ends = self._ends.data
+        return (int(ends[chunk_id - 1]) if chunk_id else 0), int(ends[chunk_id])
+
+    def _map(self, needed: int) -> mmap.mmap:
+        """Return a mapping of the data file that covers at least ``needed`` bytes."""
+        if self._mm is None or self._mm_size < needed:
+            if self._mm is not None:
+                self._mm.close()
+            with open(self.data_file, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mm_size = len(self._mm)
+        return self._mm
+
+    @property
+    def pages(self) -> np.ndarray:
+        """Source page of every chunk (0 when the document has no pages)."""
+        return self._pages.values
+
+    @property
+    def char_starts(self) -> np.ndarray:
+        """Character offset of every chunk within its document (-1 when unknown)."""
+        return self._char_starts.values
+
+    def memory_usage(self) -> int:
+        """Approximate bytes of RAM held for metadata (chunk text is memory-mapped)."""
+        columns = self._ends, self._docs, self._pages, self._char_starts
+        return sum(column.data.nbytes for column in columns) + 400 * len(self._doc_table)
+
+    def document_chunk_ids(self, doc_id: str) -> range:
+        """Chunk ids belonging to a document."""
+        return self.documents[doc_id].chunk_ids
+
+    def document_for_chunk(self, chunk_id: int) -> Optional[DocumentRecord]:
+        """The live document a chunk belongs to, if any."""
+        if not 0 <= chunk_id < len(self):
+            return None
+        doc = self._doc_table[self._docs.data[chunk_id]]
+        return doc if doc.doc_id in self.documents else None
+
+    def live_chunk_ids(self) -> Iterator[int]:
+        """Iterate chunk ids of documents that have not been deleted."""
+        for doc in self.documents.values():
+            yield from doc.chunk_ids
+
+    # Writing
+
+    def add_document(self, metadata: Dict[str, Any], chunks: Iterable[str],
+                     pages: Optional[Iterable[int]] = None,
+                     char_starts: Optional[Iterable[int]] = None) -> DocumentRecord:
+        """
+        Append a document and its chunks.
+
+        Chunk data is made durable before the log record that references it,
+        so the log line is the commit point.
+
+        Args:
+            metadata: Document fields (``filename``, ``size``, ``preview``, ...)
+            chunks: Chunk texts, in document order
+            pages: Optional source page of each chunk
+            char_starts: Optional offset of each chunk in the cleaned text;
+                by default chunks are taken to be joined by single spaces
+
+        Returns:
+            The committed document record.
+        """
+        writer = self.writer()
+        try:
+            chunks = list(chunks)
+            pages = [0] * len(chunks) if pages is None else pages
+            char_starts = [None] * len(chunks) if char_starts is None else char_starts
+            for chunk, page, char_start in zip(chunks, pages, char_starts):
+                writer.append(chunk, page, char_start)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit(metadata)
+
+    def writer(self) -> "ChunkWriter":
+        """
+        Start appending a document whose chunks arrive incrementally.
+
+        Only one writer may be open at a time; ``add_document`` uses one too.
+        """
+        if self.readonly:
+            raise PermissionError("Chunk store is open read-only")
+        return ChunkWriter(self)
+
+    def delete_document(self, doc_id: str) -> DocumentRecord:
+        """Tombstone a document. Its chunks stay on disk until compaction."""
+        doc = self.documents[doc_id]
+        record = {
+            "op": "delete",
+            "doc_id": doc_id,
+            "first_chunk": doc.first_chunk,
+            "chunk_count": doc.chunk_count,
+        }
+        self._append_log(record)
+        self._apply(record)
+        return doc
+
+    def _append_log(self, record: Dict[str, Any]):
+        if self.readonly:
+            raise PermissionError("Chunk store is open read-only")
+        line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+        with open(self.log_file, "ab") as log:
+            log.write(line)
+            log.flush()
+            os.fsync(log.fileno())
+        self._log_offset += len(line)
+
+    def compact(self) -> Dict[int, int]:
+        """
+        Rewrite live chunks into a new generation and drop deleted ones.
+
+        The new generation is fully written and synced before the manifest is
+        switched, so an interrupted compaction is simply discarded on reopen.
+
+        Returns:
+            Mapping of old chunk id to new chunk id for every live chunk.
+        """
+        if self.readonly:
+            raise PermissionError("Chunk store is open read-only")
+        new_gen = self.generation + 1
+        remap: Dict[int, int] = {}
+        keep = np.fromiter(self.live_chunk_ids(), dtype=np.int64)
+        rows = np.zeros(len(keep), dtype=CHUNK_DTYPE)
+        records = []
+        position = 0
+
+        with open(self._file("chunks", "dat", new_gen), "wb") as data:
+            for doc in self.documents.values():
+                first_chunk = len(remap)
+                for old_id in doc.chunk_ids:
+                    start, end = self._span(old_id)
+                    data.write(self._map(end)[start:end])
+                    position += end - start
+                    rows["end"][len(remap)] = position
+                    remap[old_id] = first_chunk + old_id - doc.first_chunk
+                records.append({"op": "add", **doc.to_dict(), "first_chunk": first_chunk})
+            data.flush()
+            os.fsync(data.fileno())
+
+        rows["page"] = self.pages[keep]
+        rows["char_start"] = self.char_starts[keep]
+
+        for kind, ext, payload in (
+            ("chunks", "col", rows.tobytes()),
+            ("docs", "log", b"".join(
+                json.dumps(r, ensure_ascii=False).encode("utf-8") + b"\n" for r in records
+            )),
+        ):
+            with open(self._file(kind, ext, new_gen), "wb") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+
+        self._write_manifest(new_gen)
+        self._reopen(new_gen)
+        return remap
+
+    def clear(self):
+        """Drop every document by switching to a fresh, empty generation."""
+        if self.readonly:
+            raise PermissionError("Chunk store is open read-only")
+        new_gen = self.generation + 1
+        self._write_manifest(new_gen)
+        self._reopen(new_gen)
+
+    def _reopen(self, generation: int):
+        # Readers may still be mapping the old generation; unlinking is safe for them
+        self.close()
+        self.generation = generation
+        self._reset()
+        self._remove_stale_generations()
+        self._load()
+
+    # Index snapshots
+
+    def save_index(self, index: Any, name: str = "index"):
+        """Persist an index snapshot covering every log record applied so far."""
+        if self.readonly:
+            raise PermissionError("Chunk store is open read-only")
+        payload = {"records": len(self.records), "index": index}
+        _fsync_write(self._file(name, "pkl"), pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def load_index(self, name: str = "index") -> Tuple[Optional[Any], int]:
+        """
+        Load the latest snapshot of the named index.
+
+        Returns:
+            ``(index, records_applied)``; ``(None, 0)`` if there is no usable snapshot.
+        """
+        try:
+            with open(self._file(name, "pkl"), "rb") as f:
+                payload = pickle.load(f)
+        except Exception:
+            # Missing, torn or written by an incompatible version: rebuild instead
+            return None, 0
+        if payload["records"] > len(self.records):
+            return None, 0
+        return payload["index"], payload["records"]
+
+    def close(self):
+        """Release the memory map."""
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+            self._mm_size = 0
+
+
+class ChunkWriter:
+    """
+    Streams one document's chunks into a ``ChunkStore``.
+
+    Chunks are written to the data file as they are appended, while only
+    their column values are kept in memory. Nothing is visible to readers
+    until ``commit``; ``abort`` cuts the data file back to where it started.
+    """
+
+    def __init__(self, store: ChunkStore):
+        self.store = store
+        self.generation = store.generation
+        self.first_chunk = len(store)
+        self.start = store._data_end()
+        self.position = self.start
+        self.chars = 0
+        self.ends = array("q")
+        self.pages = array("i")
+        self.char_starts = array("q")
+        self._data = open(store.data_file, "ab")
+
+    def __len__(self) -> int:
+        return len(self.ends)
+
+    def append(self, chunk: str, page: int = 0, char_start: Optional[int] = None):
+        """
+        Write one chunk.
+
+        ``page`` is its source page, if the document has pages, and
+        ``char_start`` its offset in the document's cleaned text; without
+        one, chunks are taken to be joined by a single space.
+        """
+        encoded = chunk.encode("utf-8")
+        self._data.write(encoded)
+        self.position += len(encoded)
+        self.ends.append(self.position)
+        self.pages.append(page)
+        if char_start is None:
+            char_start = self.chars
+        self.char_starts.append(char_start)
+        self.chars = char_start + len(chunk) + 1
+
+    def commit(self, metadata: Dict[str, Any]) -> DocumentRecord:
+        """Make the chunks durable, then log the document record that references them."""
+        if self.store.generation != self.generation:
+            self.abort()
+            raise RuntimeError("Chunk store was compacted or cleared while a document was being written")
+        self._data.flush()
+        os.fsync(self._data.fileno())
+        self._data.close()
+
+        rows = np.zeros(len(self), dtype=CHUNK_DTYPE)
+        rows["end"] = self.ends
+        rows["page"] = self.pages
+        rows["char_start"] = self.char_starts
+        with open(self.store.columns_file, "ab") as col:
+            col.write(rows.tobytes())
+            col.flush()
+            os.fsync(col.fileno())
+
+        record = {
+            "op": "add",
+            "doc_id": f"doc_{uuid.uuid4().hex[:12]}",
+            **metadata,
+            "first_chunk": self.first_chunk,
+            "chunk_count": len(self),
+        }
+        self.store._append_log(record)
+        self.store._apply(record)
+        self.store._extend_columns(rows, len(self.store._doc_table) - 1)
+        return self.store.documents[record["doc_id"]]
+
+    def abort(self):
+        """Discard everything written so far."""
+        if not self._data.closed:
+            self._data.close()
+        if self.store.generation == self.generation:
+            ChunkStore._truncate(self.store.data_file, self.start)
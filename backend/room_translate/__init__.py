@@ -5,9 +5,12 @@ This module provides multilingual translation capabilities
 using IndicTrans2 models for English-Hindi translation.
 """
 
+from .memory import TranslationMemory
+from .neural import NeuralBackend
+from .phrases import PhraseTable
 from .translator import RoomTranslator
 
-__all__ = ['RoomTranslator']
+__all__ = ['RoomTranslator', 'PhraseTable', 'NeuralBackend', 'TranslationMemory']
 
 
 
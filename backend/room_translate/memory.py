@@ -0,0 +1,89 @@
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+
+class TranslationMemory:
+    """
+    Persistent store of model translations, one row per source sentence.
+
+    Rows are keyed by (model, source language, target language, sentence),
+    so changing the model never serves its predecessor's output. The
+    database is SQLite in WAL mode: lookups are cheap, writes from several
+    server processes sharing the file do not corrupt it, and what one
+    process translated is found by the others.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS memory ("
+            " model TEXT NOT NULL, source TEXT NOT NULL, target TEXT NOT NULL,"
+            " sentence TEXT NOT NULL, translation TEXT NOT NULL,"
+            " PRIMARY KEY (model, source, target, sentence))"
+        )
+        self._db.commit()
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM memory").fetchone()[0]
+
+    def lookup(self, model: str, source: str, target: str, sentences: Sequence[str]) -> List[Optional[str]]:
+        """The stored translation of each sentence, ``None`` where there is none."""
+        found: Dict[str, str] = {}
+        unique = list(dict.fromkeys(sentences))
+        with self._lock:
+            # Stay well under SQLite's limit on bound parameters
+            for i in range(0, len(unique), 500):
+                batch = unique[i:i + 500]
+                rows = self._db.execute(
+                    "SELECT sentence, translation FROM memory WHERE model = ? AND source = ? AND target = ?"
+                    f" AND sentence IN ({','.join('?' * len(batch))})",
+                    (model, source, target, *batch),
+                ).fetchall()
+                found.update(rows)
+            results = [found.get(sentence) for sentence in sentences]
+            hits = sum(result is not None for result in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def store(self, model: str, source: str, target: str, pairs: Sequence[tuple]):
+        """Save ``(sentence, translation)`` pairs."""
+        if not pairs:
+            return
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO memory (model, source, target, sentence, translation) VALUES (?, ?, ?, ?, ?)",
+                [(model, source, target, sentence, translation) for sentence, translation in pairs],
+            )
+            self._db.commit()
+            self.writes += len(pairs)
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM memory")
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+        }
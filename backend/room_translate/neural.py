@@ -0,0 +1,185 @@
+import asyncio
+import importlib.util
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from room_rag.batching import MicroBatcher
+
+from .memory import TranslationMemory
+
+DEFAULT_TRANSLATION_MODELS = "en-hi=Helsinki-NLP/opus-mt-en-hi,hi-en=Helsinki-NLP/opus-mt-hi-en"
+
+
+def neural_available() -> bool:
+    """Check whether torch and transformers are installed."""
+    return all(importlib.util.find_spec(name) is not None for name in ("torch", "transformers"))
+
+
+def parse_models(spec: str) -> Dict[Tuple[str, str], str]:
+    """Parse ``"en-hi=model,hi-en=model"`` into a model name per (source, target)."""
+    models = {}
+    for item in spec.split(","):
+        if "=" in item and "-" in item.split("=", 1)[0]:
+            pair, name = item.split("=", 1)
+            source, target = pair.strip().split("-", 1)
+            models[(source, target)] = name.strip()
+    return models
+
+
+_models: Dict[str, Any] = {}
+_models_lock = threading.Lock()
+
+
+def load_translation_model(model_name: str):
+    """Load a seq2seq model and its tokenizer once per process, on the CPU."""
+    with _models_lock:
+        if model_name not in _models:
+            from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            model = AutoModelForSeq2SeqLM.from_pretrained(model_name).to("cpu").eval()
+            _models[model_name] = (tokenizer, model)
+            print(f"✅ Loaded translation model: {model_name}")
+        return _models[model_name]
+
+
+def generate(loaded, sentences: Sequence[str], beams: int = 1, max_length: int = 512) -> List[str]:
+    """Translate a batch of sentences with a loaded (tokenizer, model) pair."""
+    import torch
+
+    tokenizer, model = loaded
+    # Similar lengths side by side waste less work on padding
+    order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]))
+    with torch.no_grad():
+        inputs = tokenizer([sentences[i] for i in order], return_tensors="pt", padding=True,
+                           truncation=True, max_length=max_length)
+        outputs = model.generate(**inputs, num_beams=beams, max_length=max_length)
+    decoded = tokenizer.batch_decode(outputs, skip_special_tokens=True)
+    results = [""] * len(sentences)
+    for position, i in enumerate(order):
+        results[i] = decoded[position].strip()
+    return results
+
+
+class NeuralBackend:
+    """
+    Local seq2seq translation models (MarianMT by default), one per direction.
+
+    Sentences are first looked up in the translation memory; the rest go to
+    the model through a ``MicroBatcher`` per model, so sentences of
+    concurrent requests share forward passes in a worker thread while the
+    event loop keeps serving. Each model is loaded on its first batch, not
+    at startup; one that fails to load is switched off for the rest of the
+    process. Every new translation is saved to the memory.
+    """
+
+    name = "neural"
+
+    def __init__(self, models: Optional[str] = None, memory: Optional[TranslationMemory] = None,
+                 max_batch: Optional[int] = None, max_wait: Optional[float] = None,
+                 beams: Optional[int] = None,
+                 loader: Callable[[str], Any] = load_translation_model,
+                 generator: Callable[..., List[str]] = generate):
+        """
+        Args:
+            models: ``"en-hi=name,hi-en=name"``, Hugging Face model names or paths
+            memory: Translation memory to read from and save to
+            max_batch: Most sentences per forward pass
+            max_wait: Seconds the first sentence of a batch waits for company
+            beams: Beam width (1 is greedy decoding, the fastest)
+            loader: Callable loading a model by name
+            generator: Callable translating a batch with a loaded model
+        """
+        self.models = parse_models(models or os.getenv("TRANSLATION_MODELS", DEFAULT_TRANSLATION_MODELS))
+        self.memory = memory
+        self.max_batch = max_batch or int(os.getenv("TRANSLATION_BATCH_MAX_SIZE", 16))
+        if max_wait is None:
+            max_wait = float(os.getenv("TRANSLATION_BATCH_MAX_WAIT_MS", 10)) / 1000
+        self.max_wait = max_wait
+        self.beams = beams or int(os.getenv("TRANSLATION_BEAMS", 1))
+        self.loader = loader
+        self.generator = generator
+
+        self.failed: Dict[str, str] = {}  # model name -> load error
+        self.translated = 0
+        self._batchers: Dict[str, MicroBatcher] = {}
+        self._lock = threading.Lock()
+
+    def supports(self, source: str, target: str) -> bool:
+        model_name = self.models.get((source, target))
+        return model_name is not None and model_name not in self.failed
+
+    def _translate_batch(self, model_name: str, sentences: List[str]) -> List[str]:
+        try:
+            loaded = self.loader(model_name)
+        except Exception as e:
+            self.failed[model_name] = str(e)
+            print(f"⚠️ Translation model {model_name} failed to load: {e}")
+            raise
+        results = self.generator(loaded, sentences, beams=self.beams)
+        self.translated += len(sentences)
+        return results
+
+    def _batcher(self, model_name: str) -> MicroBatcher:
+        with self._lock:
+            if model_name not in self._batchers:
+                self._batchers[model_name] = MicroBatcher(
+                    lambda sentences: self._translate_batch(model_name, sentences),
+                    max_batch=self.max_batch,
+                    max_wait=self.max_wait,
+                )
+            return self._batchers[model_name]
+
+    async def translate(self, sentences: Sequence[str], source: str, target: str) -> List[str]:
+        """Translate sentences without blocking the event loop."""
+        model_name = self.models[(source, target)]
+        results = await asyncio.to_thread(self._recall, model_name, source, target, sentences)
+        missing = list(dict.fromkeys(s for s, result in zip(sentences, results) if result is None))
+        if missing:
+            batcher = self._batcher(model_name)
+            translations = await asyncio.gather(*(batcher.submit(sentence) for sentence in missing))
+            await asyncio.to_thread(self._remember, model_name, source, target, missing, translations)
+            results = self._merge(sentences, results, missing, translations)
+        return results
+
+    def translate_sync(self, sentences: Sequence[str], source: str, target: str) -> List[str]:
+        """Translate sentences in the calling thread, in batches of ``max_batch``."""
+        model_name = self.models[(source, target)]
+        results = self._recall(model_name, source, target, sentences)
+        missing = list(dict.fromkeys(s for s, result in zip(sentences, results) if result is None))
+        if missing:
+            translations = []
+            for i in range(0, len(missing), self.max_batch):
+                translations.extend(self._translate_batch(model_name, missing[i:i + self.max_batch]))
+            self._remember(model_name, source, target, missing, translations)
+            results = self._merge(sentences, results, missing, translations)
+        return results
+
+    def _recall(self, model_name: str, source: str, target: str, sentences: Sequence[str]) -> List[Optional[str]]:
+        if self.memory is None:
+            return [None] * len(sentences)
+        return self.memory.lookup(model_name, source, target, sentences)
+
+    def _remember(self, model_name: str, source: str, target: str, sentences: List[str], translations: List[str]):
+        if self.memory is not None:
+            self.memory.store(model_name, source, target, list(zip(sentences, translations)))
+
+    @staticmethod
+    def _merge(sentences: Sequence[str], results: List[Optional[str]], missing: List[str],
+               translations: List[str]) -> List[str]:
+        by_sentence = dict(zip(missing, translations))
+        return [result if result is not None else by_sentence[sentence]
+                for sentence, result in zip(sentences, results)]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Models, load failures, memory and batching figures."""
+        with self._lock:
+            batchers = {name: batcher.get_stats() for name, batcher in self._batchers.items()}
+        return {
+            "models": {f"{source}-{target}": name for (source, target), name in self.models.items()},
+            "loaded": [name for name in self.models.values() if name in _models],
+            "failed": dict(self.failed),
+            "translated": self.translated,
+            "memory": self.memory.get_stats() if self.memory is not None else None,
+            "batching": batchers,
+        }
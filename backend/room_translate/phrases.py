@@ -0,0 +1,177 @@
+import re
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+# Words, with apostrophes inside them ("don't", "user's")
+WORD_RE = re.compile(r"\w+(?:['’]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Casefolded word tokens, the unit phrases are matched in."""
+    return [match.group().casefold() for match in WORD_RE.finditer(text)]
+
+
+def load_phrase_table(path: Union[str, Path]) -> Dict[str, str]:
+    """
+    Read a phrase table file: one ``source<TAB>target`` pair per line.
+
+    Blank lines and lines starting with ``#`` are skipped; a source phrase
+    that appears twice keeps its last translation.
+    """
+    phrases: Dict[str, str] = {}
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            source, sep, target = line.partition("\t")
+            if not sep or not source.strip() or not target.strip():
+                raise ValueError(f"{path}:{number}: expected 'source<TAB>target'")
+            phrases[source.strip()] = target.strip()
+    return phrases
+
+
+class PhraseTable:
+    """
+    Aho-Corasick automaton over word tokens, for phrase-by-phrase translation.
+
+    Every phrase becomes a path of token ids in a trie; failure links turn
+    the trie into an automaton that finds all phrases in a text in one pass
+    over its tokens, however many phrases there are. Overlapping matches are
+    resolved leftmost-longest: "good morning" wins over "good" and
+    "morning", and a match never starts inside an earlier one.
+
+    Phrases only match across whitespace: punctuation between two words
+    ("hello, how are you") breaks a phrase, so that only "how are you"
+    matches there.
+    """
+
+    def __init__(self, phrases: Optional[Dict[str, str]] = None):
+        self._ids: Dict[str, int] = {}  # token -> id
+        self._goto: List[Dict[int, int]] = [{}]  # node -> token id -> child node
+        self._fail: List[int] = [0]
+        self._output: List[int] = [0]  # nearest node on the failure chain (itself included) ending a phrase
+        self._depth: List[int] = [0]  # tokens from the root
+        self._values: List[Optional[str]] = [None]  # translation of the phrase ending here
+        self._compiled = True
+        self.phrases = 0
+        if phrases:
+            self.update(phrases)
+
+    def __len__(self) -> int:
+        return self.phrases
+
+    def add(self, phrase: str, translation: str):
+        """Add or replace one phrase; the automaton is rebuilt on the next match."""
+        tokens = tokenize(phrase)
+        if not tokens:
+            return
+        node = 0
+        for token in tokens:
+            token_id = self._ids.setdefault(token, len(self._ids))
+            child = self._goto[node].get(token_id)
+            if child is None:
+                child = len(self._goto)
+                self._goto[node][token_id] = child
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(0)
+                self._depth.append(self._depth[node] + 1)
+                self._values.append(None)
+            node = child
+        if self._values[node] is None:
+            self.phrases += 1
+        self._values[node] = translation
+        self._compiled = False
+
+    def update(self, phrases: Dict[str, str]):
+        for phrase, translation in phrases.items():
+            self.add(phrase, translation)
+
+    def _compile(self):
+        """Compute failure and output links, breadth first."""
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            fail = self._fail[node]
+            self._output[node] = node if self._values[node] is not None else self._output[fail]
+            for token_id, child in self._goto[node].items():
+                # Longest proper suffix of child's path that is also in the trie
+                state = fail
+                while state and token_id not in self._goto[state]:
+                    state = self._fail[state]
+                self._fail[child] = self._goto[state].get(token_id, 0)
+                queue.append(child)
+        self._compiled = True
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """``(start, end, translation)`` character spans of the phrases found in ``text``."""
+        if not self._compiled:
+            self._compile()
+        words = list(WORD_RE.finditer(text))
+        if not words or not self.phrases:
+            return []
+
+        # Longest phrase starting at each word: (length in words, node)
+        longest: List[Tuple[int, int]] = [(0, 0)] * len(words)
+        goto, fail, output, depth, values = self._goto, self._fail, self._output, self._depth, self._values
+        state = 0
+        previous_end = 0
+        for position, word in enumerate(words):
+            if state and text[previous_end:word.start()].strip():
+                state = 0  # Punctuation between words ends every phrase
+            previous_end = word.end()
+            token_id = self._ids.get(word.group().casefold())
+            if token_id is None:
+                state = 0
+                continue
+            while state and token_id not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token_id, 0)
+
+            node = output[state]
+            while node:
+                length = depth[node]
+                start = position - length + 1
+                if length > longest[start][0]:
+                    longest[start] = (length, node)
+                node = output[fail[node]]
+
+        spans = []
+        position = 0
+        while position < len(words):
+            length, node = longest[position]
+            if length:
+                last = position + length - 1
+                spans.append((words[position].start(), words[last].end(), values[node]))
+                position += length
+            else:
+                position += 1
+        return spans
+
+    def translate(self, text: str) -> Tuple[str, int]:
+        """Replace every phrase found in ``text``; returns the text and the number of phrases replaced."""
+        spans = self.find(text)
+        if not spans:
+            return text, 0
+        parts = []
+        previous = 0
+        for start, end, translation in spans:
+            parts.append(text[previous:start])
+            parts.append(translation)
+            previous = end
+        parts.append(text[previous:])
+        return "".join(parts), len(spans)
+
+    @classmethod
+    def from_sources(cls, sources: Iterable[Union[Dict[str, str], str, Path]]) -> "PhraseTable":
+        """Build a table from mappings and phrase table files; later sources override earlier ones."""
+        table = cls()
+        for source in sources:
+            table.update(source if isinstance(source, dict) else load_phrase_table(source))
+        table._compile()
+        return table
@@ -1,28 +1,75 @@
-from typing import Dict, Optional
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from .cache import TranslationCache
+from .memory import TranslationMemory
+from .neural import NeuralBackend, neural_available
+from .phrases import PhraseTable
+
+# Built-in English -> Hindi phrases; TRANSLATION_PHRASES adds to and overrides them
+DEFAULT_PHRASES = {
+    "hello": "नमस्ते",
+    "how are you": "कैसे हो आप",
+    "thank you": "धन्यवाद",
+    "goodbye": "अलविदा",
+    "yes": "हाँ",
+    "no": "नहीं",
+    "please": "कृपया",
+    "sorry": "माफ़ कीजिए",
+    "welcome": "स्वागत है",
+    "good morning": "सुप्रभात",
+    "good night": "शुभ रात्रि"
+}
+
+# Sentence boundaries (Latin punctuation and the Devanagari danda) and line breaks, keeping the whitespace
+SENTENCE_SPLIT_RE = re.compile(r"((?<=[.!?।])\s+|\s*\n\s*)")
+
 
 class RoomTranslator:
     """
-    Room's translation engine - simplified version.
+    Room's translation engine.
+    
+    Text is translated sentence by sentence with one of two backends:
+    
+    - ``phrases`` (default): every phrase of the table found in the text is
+      replaced (longest match first) in one pass over its words.
+    - ``neural``: local seq2seq models, batched across concurrent requests
+      in a worker thread, with a persistent translation memory. Falls back
+      to the phrase table when a model is missing or fails.
+    
+    Translations are cached per sentence, so repeated sentences cost a
+    dictionary lookup.
     """
     
-    def __init__(self):
+    def __init__(self, phrase_file: Optional[str] = None, cache_size: Optional[int] = None,
+                 backend: Optional[str] = None, neural: Optional[NeuralBackend] = None):
         """Initialize the translator."""
-        # Simple translation dictionary for common phrases
-        self.translations = {
-            "hello": "नमस्ते",
-            "how are you": "कैसे हो आप",
-            "thank you": "धन्यवाद",
-            "goodbye": "अलविदा",
-            "yes": "हाँ",
-            "no": "नहीं",
-            "please": "कृपया",
-            "sorry": "माफ़ कीजिए",
-            "welcome": "स्वागत है",
-            "good morning": "सुप्रभात",
-            "good night": "शुभ रात्रि"
-        }
+        phrase_file = phrase_file if phrase_file is not None else os.getenv("TRANSLATION_PHRASES", "")
+        sources: List[Any] = [DEFAULT_PHRASES]
+        if phrase_file:
+            if os.path.exists(phrase_file):
+                sources.append(phrase_file)
+            else:
+                print(f"⚠️ Phrase table {phrase_file} not found, using the built-in phrases")
+        self.phrases = PhraseTable.from_sources(sources)
         
-        print("Translator initialized (basic mode)")
+        if cache_size is None:
+            cache_size = int(os.getenv("TRANSLATION_CACHE_SIZE", 4096))
+        self.cache = TranslationCache(cache_size)
+        
+        # Models are loaded on first use, so picking the neural backend keeps startup fast
+        self.neural = neural
+        backend = backend or os.getenv("TRANSLATION_BACKEND", "phrases")
+        if self.neural is None and backend == "neural":
+            if neural_available():
+                memory_path = os.getenv("TRANSLATION_MEMORY_PATH", "room_translate/storage/memory.sqlite3")
+                self.neural = NeuralBackend(memory=TranslationMemory(memory_path))
+            else:
+                print("⚠️ torch/transformers not installed, translating with the phrase table")
+        
+        mode = "neural mode" if self.neural is not None else "basic mode"
+        print(f"Translator initialized ({mode}, {len(self.phrases)} phrases)")
     
     def translate(self, text: str, source_lang: str = "en", target_lang: str = "hi") -> str:
         """
@@ -37,27 +84,104 @@ class RoomTranslator:
             str: Translated text
         """
         try:
-            if source_lang == "en" and target_lang == "hi":
-                return self._english_to_hindi(text)
-            elif source_lang == "hi" and target_lang == "en":
-                return self._hindi_to_english(text)
-            else:
-                return f"Translation from {source_lang} to {target_lang} not yet supported"
+            if self._use_neural(source_lang, target_lang):
+                try:
+                    parts, indexes = self._split(text)
+                    missing = self._from_cache("neural", parts, indexes, source_lang, target_lang)
+                    sentences = [parts[i] for i in missing]
+                    translations = self.neural.translate_sync(sentences, source_lang, target_lang) if sentences else []
+                    return self._join("neural", parts, missing, translations, source_lang, target_lang)
+                except Exception as e:
+                    print(f"⚠️ Neural translation failed, using the phrase table: {e}")
+            
+            return self._translate_basic(text, source_lang, target_lang)
                 
         except Exception as e:
             return f"Translation error: {str(e)}"
     
-    def _english_to_hindi(self, text: str) -> str:
-        """Translate English to Hindi (basic implementation)."""
-        text_lower = text.lower()
+    async def translate_async(self, text: str, source_lang: str = "en", target_lang: str = "hi") -> str:
+        """
+        Translate text without blocking the event loop.
         
-        # Check for exact matches
-        for english, hindi in self.translations.items():
-            if english in text_lower:
-                return f"{text} ({hindi})"
+        With the neural backend, sentences missing from the cache are
+        translated in a worker thread, batched with those of concurrent
+        requests. The phrase table is fast enough to run inline.
+        """
+        if self._use_neural(source_lang, target_lang):
+            try:
+                parts, indexes = self._split(text)
+                missing = self._from_cache("neural", parts, indexes, source_lang, target_lang)
+                sentences = [parts[i] for i in missing]
+                translations = await self.neural.translate(sentences, source_lang, target_lang) if sentences else []
+                return self._join("neural", parts, missing, translations, source_lang, target_lang)
+            except Exception as e:
+                print(f"⚠️ Neural translation failed, using the phrase table: {e}")
+        try:
+            return self._translate_basic(text, source_lang, target_lang)
+        except Exception as e:
+            return f"Translation error: {str(e)}"
+    
+    def _translate_basic(self, text: str, source_lang: str, target_lang: str) -> str:
+        """Translate with the phrase table."""
+        if source_lang == "en" and target_lang == "hi":
+            return self._english_to_hindi(text)
+        elif source_lang == "hi" and target_lang == "en":
+            return self._hindi_to_english(text)
+        else:
+            return f"Translation from {source_lang} to {target_lang} not yet supported"
+    
+    def _use_neural(self, source_lang: str, target_lang: str) -> bool:
+        return self.neural is not None and self.neural.supports(source_lang, target_lang)
+    
+    @staticmethod
+    def _split(text: str) -> Tuple[List[str], List[int]]:
+        """Sentences and the whitespace between them, and the indexes of sentences worth translating."""
+        parts = SENTENCE_SPLIT_RE.split(text)
+        # Even indexes are sentences, odd ones the whitespace between them
+        indexes = [i for i in range(0, len(parts), 2) if any(char.isalpha() for char in parts[i])]
+        return parts, indexes
+    
+    def _from_cache(self, backend: str, parts: List[str], indexes: List[int],
+                    source_lang: str, target_lang: str) -> List[int]:
+        """Fill in cached sentences; returns the indexes still to translate."""
+        missing = []
+        for i in indexes:
+            cached = self.cache.get((backend, source_lang, target_lang, parts[i]))
+            if cached is None:
+                missing.append(i)
+            else:
+                parts[i] = cached[0]
+        return missing
+    
+    def _join(self, backend: str, parts: List[str], missing: List[int], translations: List[str],
+              source_lang: str, target_lang: str) -> str:
+        for i, translation in zip(missing, translations):
+            self.cache.put((backend, source_lang, target_lang, parts[i]), (translation, 1))
+            parts[i] = translation
+        return "".join(parts)
+    
+    def _english_to_hindi(self, text: str) -> str:
+        """Translate English to Hindi, phrase by phrase."""
+        parts, indexes = self._split(text)
+        translated = 0
+        for i in indexes:
+            parts[i], matches = self._translate_sentence(parts[i], "en", "hi")
+            translated += matches
         
-        # For now, return the original text with a note
-        return f"{text} (Hindi translation coming soon!)"
+        if not translated:
+            # For now, return the original text with a note
+            return f"{text} (Hindi translation coming soon!)"
+        return "".join(parts)
+    
+    def _translate_sentence(self, sentence: str, source_lang: str, target_lang: str):
+        """One sentence through the cache; returns the translation and the number of phrases replaced."""
+        key = ("phrases", source_lang, target_lang, sentence)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        result = self.phrases.translate(sentence)
+        self.cache.put(key, result)
+        return result
     
     def _hindi_to_english(self, text: str) -> str:
         """Translate Hindi to English (basic implementation)."""
@@ -71,10 +195,24 @@ class RoomTranslator:
             "hi": "Hindi (basic support)"
         }
     
+    def get_stats(self) -> Dict[str, Any]:
+        """Backend, phrase table size, sentence cache and model figures."""
+        return {
+            "backend": "neural" if self.neural is not None else "phrases",
+            "phrases": len(self.phrases),
+            "cache": self.cache.get_stats(),
+            "neural": self.neural.get_stats() if self.neural is not None else None
+        }
+    
+    def close(self):
+        """Close the translation memory."""
+        if self.neural is not None and self.neural.memory is not None:
+            self.neural.memory.close()
+    
     def detect_language(self, text: str) -> str:
         """Detect the language of the text."""
         # Simple detection based on Devanagari script
         if any('\u0900' <= char <= '\u097F' for char in text):
             return "hi"
         else:
-            return "en"
\ No newline at end of file
+            return "en"
@@ -2,7 +2,7 @@
 Room Voice Processing module.
 
 This module provides speech-to-text and text-to-speech capabilities
-using Whisper for STT and Coqui TTS for voice generation.
+using Whisper for STT and espeak-ng for voice generation.
 """
 
 from .processor import RoomVoice
@@ -1,46 +1,146 @@
 import os
-import time
 import numpy as np
+from contextlib import contextmanager
 from pathlib import Path
-import tempfile
-from typing import Optional, Tuple, Dict
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Optional, Dict, Union
+
+from .stt import SpeechRecognizer, StreamingTranscriber, load_audio, stt_available
+from .tts import SpeechSynthesizer, tts_available
+
+
+class VoiceBusyError(Exception):
+    """Raised when every speech-to-text session slot is taken."""
 
 class RoomVoice:
     """
     Room's voice processing engine - simplified version.
     Voice features will be added incrementally.
+    
+    Speech-to-text runs locally with Whisper when openai-whisper is
+    installed: one model per process, shared by every session, with the
+    audio of concurrent sessions transcribed in batches.
+    
+    Text-to-speech runs locally with espeak-ng when it is installed;
+    synthesized answers are cached in ``audio_path``, which is served
+    under ``/static/audio``.
     """
     
-    def __init__(self):
+    def __init__(self, audio_path: Union[str, Path] = "static/audio",
+                 synthesizer: Optional[SpeechSynthesizer] = None):
         """Initialize voice processing components."""
         # Initialize paths
         self.models_path = Path("room_voice/models")
         self.models_path.mkdir(parents=True, exist_ok=True)
         
-        # Initialize components
-        self.whisper_model = None
-        self.tts_model = None
+        # Initialize components; the Whisper model itself is loaded on first use
+        self.recognizer = SpeechRecognizer(download_root=str(self.models_path)) if stt_available() else None
+        if synthesizer is None and tts_available():
+            synthesizer = SpeechSynthesizer(Path(audio_path))
+        self.synthesizer = synthesizer
+        self.max_sessions = int(os.getenv("STT_MAX_SESSIONS", 16))
+        self.sessions = 0
         
-        print("Voice processing initialized (basic mode)")
+        features = []
+        if self.recognizer:
+            features.append(f"speech-to-text with whisper {self.recognizer.model_name}")
+        if self.synthesizer:
+            features.append("text-to-speech")
+        mode = ", ".join(features) or "basic mode"
+        print(f"Voice processing initialized ({mode})")
     
-    def speech_to_text(self, audio_file: str) -> str:
-        """Convert speech to text (placeholder)."""
-        # For now, return a placeholder message
-        return "Voice-to-text feature coming soon! Please use text input for now."
+    def stt_available(self) -> bool:
+        """Check if speech-to-text is available."""
+        return self.recognizer is not None
+    
+    def speech_to_text(self, audio: Union[str, Path, bytes, np.ndarray], language: Optional[str] = None) -> str:
+        """
+        Convert speech to text.
+        
+        Args:
+            audio: Audio file path (any format ffmpeg reads), 16 kHz 16-bit
+                mono PCM bytes, or 16 kHz float samples
+            language: Language code ("en", "hi"); detected when omitted
+        
+        Returns:
+            str: Transcript
+        """
+        if self.recognizer is None:
+            # For now, return a placeholder message
+            return "Voice-to-text feature coming soon! Please use text input for now."
+        return self.recognizer.transcribe_sync(load_audio(audio), language)
+    
+    @contextmanager
+    def transcription_session(self, language: Optional[str] = None,
+                              on_partial: Optional[Callable[[str], Awaitable[None]]] = None
+                              ) -> Iterator[StreamingTranscriber]:
+        """
+        A streaming transcription, counted against ``STT_MAX_SESSIONS``.
+        
+        Raises:
+            VoiceBusyError: Every session slot is taken
+            RuntimeError: Speech-to-text is not installed
+        """
+        if self.recognizer is None:
+            raise RuntimeError("Speech-to-text is not available (openai-whisper is not installed)")
+        if self.sessions >= self.max_sessions:
+            raise VoiceBusyError(f"Too many voice sessions ({self.max_sessions}); try again shortly")
+        self.sessions += 1
+        transcriber = StreamingTranscriber(self.recognizer, language, on_partial)
+        try:
+            yield transcriber
+        finally:
+            transcriber.cancel()
+            self.sessions -= 1
     
     def text_to_speech(self, text: str, language: str = "en") -> Optional[str]:
-        """Convert text to speech (placeholder)."""
-        # For now, return None to indicate feature not available
-        print(f"Text-to-speech for '{text[:50]}...' not yet implemented")
-        return None
+        """
+        Convert text to speech.
+        
+        Args:
+            text: Text to voice
+            language: Language code ("en", "hi")
+        
+        Returns:
+            Optional[str]: URL of the audio (a WAV file under ``/static/audio``
+            when the text was voiced before, else a stream that voices it),
+            or None when text-to-speech is not available for the language
+        """
+        if self.synthesizer is None:
+            return None
+        return self.synthesizer.request(text, language)
+    
+    def speech_url(self, key: str) -> Optional[str]:
+        """URL of the cached audio of a text requested with ``text_to_speech``, once it is voiced."""
+        return self.synthesizer.cached_url(key) if self.synthesizer else None
+    
+    def speech_stream(self, key: str) -> Optional[AsyncIterator[bytes]]:
+        """WAV audio of a text requested with ``text_to_speech``, streamed sentence by sentence."""
+        if self.synthesizer is None:
+            return None
+        pending = self.synthesizer.pending(key)
+        if pending is None:
+            return None
+        return self.synthesizer.stream(*pending)
     
     def get_supported_languages(self) -> Dict[str, str]:
         """Get supported languages for voice processing."""
+        names = {"en": "English", "hi": "Hindi"}
+        return {
+            code: name if self.synthesizer and self.synthesizer.supports(code) else f"{name} (coming soon)"
+            for code, name in names.items()
+        }
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Speech-to-text sessions and model figures, text-to-speech cache figures."""
         return {
-            "en": "English (coming soon)",
-            "hi": "Hindi (coming soon)"
+            "speech_to_text": {
+                "sessions": self.sessions,
+                "max_sessions": self.max_sessions,
+                **(self.recognizer.get_stats() if self.recognizer else {"model": None})
+            },
+            "text_to_speech": self.synthesizer.get_stats() if self.synthesizer else None
         }
     
     def is_available(self) -> bool:
         """Check if voice processing is available."""
-        return False  # Will be True when fully implemented
\ No newline at end of file
+        return self.synthesizer is not None
\ No newline at end of file
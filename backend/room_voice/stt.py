@@ -0,0 +1,300 @@
+import asyncio
+import importlib.util
+import math
+import os
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from room_rag.batching import MicroBatcher
+
+SAMPLE_RATE = 16000  # Streams are 16-bit little-endian mono PCM at this rate
+WINDOW_SECONDS = 30  # Whisper decodes 30-second windows
+
+
+def stt_available() -> bool:
+    """Check whether openai-whisper (and torch) are installed."""
+    return all(importlib.util.find_spec(name) is not None for name in ("whisper", "torch"))
+
+
+def pcm16_to_float(data: bytes) -> np.ndarray:
+    """16-bit little-endian PCM to float32 samples in [-1, 1]."""
+    return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+
+
+_models: Dict[str, Any] = {}
+_models_lock = threading.Lock()
+
+
+def load_whisper_model(model_name: str, download_root: Optional[str] = None):
+    """Load a Whisper model once per process, on the CPU; every session shares it."""
+    with _models_lock:
+        if model_name not in _models:
+            import whisper
+            _models[model_name] = whisper.load_model(model_name, device="cpu", download_root=download_root)
+            print(f"✅ Loaded speech model: whisper {model_name}")
+        return _models[model_name]
+
+
+def decode(model, audios: Sequence[np.ndarray], language: Optional[str]) -> List[str]:
+    """Transcribe up to 30 seconds of audio per item, all items in one forward pass."""
+    import torch
+    import whisper
+
+    mels = torch.stack([
+        whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(audio)), n_mels=model.dims.n_mels)
+        for audio in audios
+    ])
+    options = whisper.DecodingOptions(task="transcribe", language=language, fp16=False, without_timestamps=True)
+    with torch.no_grad():
+        results = whisper.decode(model, mels, options)
+    return [result.text.strip() for result in results]
+
+
+class VoiceActivityDetector:
+    """
+    Energy-based voice activity detection over fixed-length frames.
+
+    A frame is speech when its level is above ``threshold_db`` (dBFS) and at
+    least ``margin_db`` above the noise floor, which follows the level of
+    non-speech frames so steady background noise does not count as speech.
+    """
+
+    def __init__(self, frame_samples: int, threshold_db: Optional[float] = None, margin_db: float = 10.0):
+        self.frame_samples = frame_samples
+        self.threshold_db = threshold_db if threshold_db is not None else float(os.getenv("STT_VAD_THRESHOLD_DB", -45))
+        self.margin_db = margin_db
+        self.noise_floor_db = -70.0
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        rms = math.sqrt(float(np.mean(np.square(frame, dtype=np.float64)))) if len(frame) else 0.0
+        level = 20 * math.log10(max(rms, 1e-10))
+        speech = level > self.threshold_db and level > self.noise_floor_db + self.margin_db
+        if not speech:
+            self.noise_floor_db += 0.05 * (level - self.noise_floor_db)
+        return speech
+
+
+class SpeechRecognizer:
+    """
+    Shared Whisper model transcribing the audio of every session.
+
+    Transcriptions of concurrent sessions go through one ``MicroBatcher``,
+    so several users dictating at once share forward passes (in a worker
+    thread) instead of queueing for the model one by one. The model is
+    loaded on the first batch.
+    """
+
+    def __init__(self, model_name: Optional[str] = None, download_root: Optional[str] = None,
+                 max_batch: Optional[int] = None, max_wait: Optional[float] = None,
+                 loader: Optional[Callable[[str], Any]] = None,
+                 decoder: Callable[[Any, Sequence[np.ndarray], Optional[str]], List[str]] = decode):
+        """
+        Args:
+            model_name: Whisper model name ("tiny", "base", "small", ...) or checkpoint path
+            download_root: Directory Whisper models are downloaded to
+            max_batch: Most audio windows per forward pass
+            max_wait: Seconds the first window of a batch waits for company
+            loader: Callable loading the model by name
+            decoder: Callable transcribing a batch of windows with a loaded model
+        """
+        self.model_name = model_name or os.getenv("STT_MODEL", "base")
+        self.max_batch = max_batch or int(os.getenv("STT_BATCH_MAX_SIZE", 8))
+        if max_wait is None:
+            max_wait = float(os.getenv("STT_BATCH_MAX_WAIT_MS", 20)) / 1000
+        self.loader = loader or (lambda name: load_whisper_model(name, download_root))
+        self.decoder = decoder
+        self.batcher = MicroBatcher(self._transcribe_batch, max_batch=self.max_batch, max_wait=max_wait)
+        self.windows = 0
+        self.audio_seconds = 0.0
+
+    def _transcribe_batch(self, items: List[Tuple[np.ndarray, Optional[str]]]) -> List[str]:
+        model = self.loader(self.model_name)
+        results: List[str] = [""] * len(items)
+        # One decoding language per forward pass
+        by_language: Dict[Optional[str], List[int]] = {}
+        for i, (_, language) in enumerate(items):
+            by_language.setdefault(language, []).append(i)
+        for language, indexes in by_language.items():
+            texts = self.decoder(model, [items[i][0] for i in indexes], language)
+            for i, text in zip(indexes, texts):
+                results[i] = text
+        self.windows += len(items)
+        self.audio_seconds += sum(len(audio) for audio, _ in items) / SAMPLE_RATE
+        return results
+
+    async def transcribe(self, audio: np.ndarray, language: Optional[str] = None) -> str:
+        """Transcribe up to 30 seconds of 16 kHz audio, batched with other sessions."""
+        return await self.batcher.submit((audio, language))
+
+    def transcribe_sync(self, audio: np.ndarray, language: Optional[str] = None) -> str:
+        """Transcribe audio of any length in the calling thread, its 30-second windows as batches."""
+        window = WINDOW_SECONDS * SAMPLE_RATE
+        items = [(audio[i:i + window], language) for i in range(0, len(audio), window)]
+        texts: List[str] = []
+        for i in range(0, len(items), self.max_batch):
+            texts.extend(self._transcribe_batch(items[i:i + self.max_batch]))
+        return " ".join(text for text in texts if text)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "loaded": self.model_name in _models,
+            "windows": self.windows,
+            "audio_seconds": round(self.audio_seconds, 1),
+            "batching": self.batcher.get_stats(),
+        }
+
+
+class StreamingTranscriber:
+    """
+    Incremental transcription of one audio stream.
+
+    Audio is cut into 30 ms frames and run through voice activity detection.
+    Speech (with a little audio before it) accumulates into an utterance; an
+    utterance ends after ``silence_ms`` without speech, or when it reaches
+    ``max_utterance_s``, and is then transcribed for good. While an utterance
+    grows, its audio so far is re-transcribed every ``partial_interval_ms``
+    and ``on_partial`` receives the transcript so far, so text appears while
+    the user is still speaking. Audio between utterances never reaches the
+    model.
+    """
+
+    FRAME_MS = 30
+
+    def __init__(self, recognizer: SpeechRecognizer, language: Optional[str] = None,
+                 on_partial: Optional[Callable[[str], Awaitable[None]]] = None,
+                 partial_interval_ms: Optional[float] = None, silence_ms: Optional[float] = None,
+                 max_utterance_s: Optional[float] = None, preroll_ms: float = 300,
+                 vad: Optional[VoiceActivityDetector] = None):
+        self.recognizer = recognizer
+        self.language = language
+        self.on_partial = on_partial
+        self.frame_samples = SAMPLE_RATE * self.FRAME_MS // 1000
+        self.vad = vad or VoiceActivityDetector(self.frame_samples)
+
+        def frames(ms: float) -> int:
+            return max(1, int(ms // self.FRAME_MS))
+
+        self.partial_frames = frames(partial_interval_ms or float(os.getenv("STT_PARTIAL_INTERVAL_MS", 1000)))
+        self.silence_frames = frames(silence_ms or float(os.getenv("STT_SILENCE_MS", 700)))
+        max_utterance_s = min(max_utterance_s or float(os.getenv("STT_MAX_UTTERANCE_S", 25)), WINDOW_SECONDS)
+        self.max_frames = frames(max_utterance_s * 1000)
+
+        self._carry = b""
+        self._preroll: deque = deque(maxlen=frames(preroll_ms))
+        self._utterance: List[np.ndarray] = []
+        self._in_speech = False
+        self._silent = 0
+        self._since_partial = 0
+        self._utterance_id = 0
+        self._segments: List[asyncio.Task] = []
+        self._texts: List[Optional[str]] = []  # Transcript of each utterance, once done
+        self._partial: Optional[asyncio.Task] = None
+        self.audio_seconds = 0.0
+
+    def feed(self, data: bytes):
+        """Add PCM audio; transcriptions it triggers run in the background."""
+        data = self._carry + data
+        usable = len(data) - len(data) % (2 * self.frame_samples)
+        self._carry = data[usable:]
+        samples = pcm16_to_float(data[:usable])
+        self.audio_seconds += len(samples) / SAMPLE_RATE
+        for start in range(0, len(samples), self.frame_samples):
+            self._frame(samples[start:start + self.frame_samples])
+
+    def _frame(self, frame: np.ndarray):
+        speech = self.vad.is_speech(frame)
+        if not self._in_speech:
+            self._preroll.append(frame)
+            if speech:
+                self._in_speech = True
+                self._utterance = list(self._preroll)
+                self._preroll.clear()
+                self._silent = 0
+                self._since_partial = 0
+            return
+
+        self._utterance.append(frame)
+        self._silent = 0 if speech else self._silent + 1
+        self._since_partial += 1
+        if self._silent >= self.silence_frames:
+            self._commit()
+            self._in_speech = False
+        elif len(self._utterance) >= self.max_frames:
+            self._commit()  # Keep listening: the next window starts here
+        elif self._since_partial >= self.partial_frames and (self._partial is None or self._partial.done()):
+            self._since_partial = 0
+            self._partial = asyncio.ensure_future(self._run_partial(np.concatenate(self._utterance), self._utterance_id))
+
+    def _commit(self):
+        audio = np.concatenate(self._utterance)
+        self._utterance = []
+        self._utterance_id += 1
+        self._since_partial = 0
+        self._texts.append(None)
+        self._segments.append(asyncio.ensure_future(self._run_segment(audio, len(self._texts) - 1)))
+
+    async def _run_segment(self, audio: np.ndarray, index: int) -> str:
+        text = await self.recognizer.transcribe(audio, self.language)
+        self._texts[index] = text
+        await self._notify()
+        return text
+
+    async def _run_partial(self, audio: np.ndarray, utterance_id: int):
+        try:
+            text = await self.recognizer.transcribe(audio, self.language)
+        except Exception as e:
+            print(f"⚠️ Partial transcription failed: {e}")
+            return
+        if utterance_id == self._utterance_id:  # Not overtaken by the utterance's final transcription
+            await self._notify(text)
+
+    def text(self, pending: str = "") -> str:
+        """Transcript so far: finished utterances, in order, then ``pending``."""
+        parts = []
+        for text in self._texts:
+            if text is None:
+                break
+            if text:
+                parts.append(text)
+        if pending:
+            parts.append(pending)
+        return " ".join(parts)
+
+    async def _notify(self, pending: str = ""):
+        if self.on_partial is None:
+            return
+        try:
+            await self.on_partial(self.text(pending))
+        except Exception as e:  # Partials are best effort; the transcript still completes
+            print(f"⚠️ Could not deliver a partial transcript: {e}")
+
+    async def finish(self) -> str:
+        """Transcribe what is left and return the whole transcript."""
+        if self._in_speech and self._utterance:
+            self._commit()
+        self._in_speech = False
+        if self._partial is not None and not self._partial.done():
+            self._partial.cancel()
+        texts = await asyncio.gather(*self._segments)
+        return " ".join(text for text in texts if text)
+
+    def cancel(self):
+        """Drop pending transcriptions (the client went away)."""
+        for task in [self._partial, *self._segments]:
+            if task is not None and not task.done():
+                task.cancel()
+
+
+def load_audio(audio: Union[str, Path, bytes, np.ndarray]) -> np.ndarray:
+    """16 kHz float32 samples from a file (decoded by ffmpeg), PCM16 bytes or an array."""
+    if isinstance(audio, np.ndarray):
+        return audio.astype(np.float32)
+    if isinstance(audio, (bytes, bytearray)):
+        return pcm16_to_float(bytes(audio[:len(audio) - len(audio) % 2]))
+    import whisper
+    return whisper.load_audio(str(audio), sr=SAMPLE_RATE)
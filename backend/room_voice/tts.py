@@ -0,0 +1,283 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import struct
+import subprocess
+import threading
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from room_rag import metrics
+
+DEFAULT_TTS_VOICES = "en=en-us,hi=hi"
+
+# Sentence boundaries (Latin punctuation and the Devanagari danda) and line breaks
+SENTENCE_RE = re.compile(r"(?<=[.!?।])\s+|\s*\n\s*")
+
+# Data size written in the header of a stream whose length is not known yet
+STREAM_DATA_SIZE = 0xFFFFFFFF - 36
+
+
+def espeak_binary() -> Optional[str]:
+    """Path of the espeak-ng (or espeak) executable, if installed."""
+    return shutil.which("espeak-ng") or shutil.which("espeak")
+
+
+def tts_available() -> bool:
+    """Check whether a speech synthesizer is installed."""
+    return espeak_binary() is not None
+
+
+def parse_voices(spec: str) -> Dict[str, str]:
+    """Parse ``"en=en-us,hi=hi"`` into a voice per language."""
+    voices = {}
+    for item in spec.split(","):
+        if "=" in item:
+            language, voice = item.split("=", 1)
+            voices[language.strip()] = voice.strip()
+    return voices
+
+
+def wav_header(sample_rate: int, data_size: int = STREAM_DATA_SIZE) -> bytes:
+    """Header of a 16-bit mono PCM WAV file; the default size suits a stream of unknown length."""
+    return struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + data_size, b"WAVE", b"fmt ", 16, 1, 1,
+                       sample_rate, sample_rate * 2, 2, 16, b"data", data_size)
+
+
+def read_wav(data: bytes) -> Tuple[bytes, int]:
+    """PCM samples and sample rate of a 16-bit mono WAV file (also one written as a stream)."""
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError("Not a WAV file")
+    sample_rate = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk, size = struct.unpack_from("<4sI", data, offset)
+        offset += 8
+        if chunk == b"fmt ":
+            audio_format, channels, sample_rate = struct.unpack_from("<HHI", data, offset)
+            bits = struct.unpack_from("<H", data, offset + 14)[0]
+            if (audio_format, channels, bits) != (1, 1, 16):
+                raise ValueError("Only 16-bit mono PCM is supported")
+        elif chunk == b"data":
+            if sample_rate is None:
+                raise ValueError("WAV data before its format")
+            pcm = data[offset:offset + size]
+            return pcm[:len(pcm) - len(pcm) % 2], sample_rate
+        offset += size + size % 2
+    raise ValueError("WAV file without data")
+
+
+def espeak_synthesize(text: str, voice: str) -> Tuple[bytes, int]:
+    """Synthesize text with espeak-ng; returns 16-bit mono PCM and its sample rate."""
+    result = subprocess.run(
+        [espeak_binary() or "espeak-ng", "-v", voice, "-b", "1", "--stdin", "--stdout"],
+        input=text.encode("utf-8"), capture_output=True, check=True, timeout=60,
+    )
+    return read_wav(result.stdout)
+
+
+class AudioCache:
+    """
+    Synthesized speech on disk, content-addressed: the file name is the
+    SHA-256 of (language, voice, text).
+
+    Files live in a directory served under ``/static``, so a cached answer
+    is played straight from there. The least recently used files are
+    removed once the cache grows past ``max_bytes``; recency is the file's
+    modification time, so every server worker shares one cache.
+
+    Writes are added to a running total of the directory's size, so the
+    directory is only listed when that total passes ``max_bytes`` (and once
+    at the first write). Files other workers write are picked up at the
+    next listing.
+    """
+
+    PATTERNS = ("*.wav", "*.json")
+
+    def __init__(self, path: Path, max_bytes: Optional[int] = None):
+        """
+        Args:
+            path: Directory holding the files (created on first write)
+            max_bytes: Disk space the files may use
+        """
+        self.path = Path(path)
+        self.max_bytes = max_bytes or int(os.getenv("TTS_CACHE_MAX_MB", 512)) * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bytes on disk as of the last listing plus what was written since; None until listed
+        self._used: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str, language: str, voice: str) -> str:
+        return hashlib.sha256(f"{language}\0{voice}\0{text}".encode("utf-8")).hexdigest()
+
+    def file(self, name: str) -> Path:
+        return self.path / name
+
+    def get(self, name: str) -> Optional[bytes]:
+        """A stored file's contents, if any."""
+        path = self.file(name)
+        try:
+            data = path.read_bytes()
+            os.utime(path)  # Recently used: evicted last
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def touch(self, name: str) -> bool:
+        """Mark a stored file as used; False when it is not stored."""
+        try:
+            os.utime(self.file(name))
+        except OSError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def put(self, name: str, data: bytes):
+        """Store a file, then trim the cache to its size."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        path = self.file(name)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        with self._lock:
+            if self._used is not None:
+                self._used += len(data)
+            if self._used is None or self._used > self.max_bytes:
+                self._used = self._trim()
+
+    def _trim(self) -> int:
+        """Remove least recently used files until within ``max_bytes``; returns the bytes left."""
+        entries = []
+        for pattern in self.PATTERNS:
+            for path in self.path.glob(pattern):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            self.evictions += 1
+        return total
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit, miss and eviction counts."""
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "max_mb": self.max_bytes // (1024 * 1024)}
+
+
+class SpeechSynthesizer:
+    """
+    Text-to-speech, sentence by sentence, with every result cached on disk.
+
+    ``request`` turns an answer into a URL right away: the cached file under
+    ``/static`` when the answer was voiced before, otherwise a stream that
+    ``stream`` produces. The stream sends a WAV header and then each
+    sentence's audio as soon as it is synthesized, so playback starts after
+    the first sentence rather than the whole answer; at its end the whole
+    answer is stored, and the next request for it costs a file lookup.
+    Sentences are cached too, so answers sharing sentences share the work.
+    """
+
+    def __init__(self, path: Path, url_prefix: str = "/static/audio", stream_prefix: str = "/voice/speech",
+                 voices: Optional[str] = None, max_bytes: Optional[int] = None,
+                 synthesize: Callable[[str, str], Tuple[bytes, int]] = espeak_synthesize):
+        """
+        Args:
+            path: Directory of the audio cache, served at ``url_prefix``
+            url_prefix: URL of the cache directory
+            stream_prefix: URL under which answers not voiced yet are streamed
+            voices: ``"en=voice,hi=voice"``, a synthesizer voice per language
+            max_bytes: Disk space the cache may use
+            synthesize: Callable turning (text, voice) into 16-bit mono PCM and its sample rate
+        """
+        self.cache = AudioCache(path, max_bytes)
+        self.url_prefix = url_prefix.rstrip("/")
+        self.stream_prefix = stream_prefix.rstrip("/")
+        self.voices = parse_voices(voices or os.getenv("TTS_VOICES", DEFAULT_TTS_VOICES))
+        self.synthesize = synthesize
+        self.sentences = 0
+        self.audio_seconds = 0.0
+
+    def supports(self, language: str) -> bool:
+        return language in self.voices
+
+    @staticmethod
+    def split(text: str) -> List[str]:
+        """Sentences worth voicing."""
+        return [s.strip() for s in SENTENCE_RE.split(text) if any(char.isalnum() for char in s)]
+
+    def request(self, text: str, language: str = "en") -> Optional[str]:
+        """URL of the answer's audio: the cached file, or a stream that voices and caches it."""
+        if not self.supports(language) or not self.split(text):
+            return None
+        key = self.cache.key(text, language, self.voices[language])
+        if self.cache.touch(f"{key}.wav"):
+            return f"{self.url_prefix}/{key}.wav"
+        # The stream may be served by another worker; the text waits for it on disk
+        self.cache.put(f"{key}.json", json.dumps({"text": text, "language": language}, ensure_ascii=False).encode("utf-8"))
+        return f"{self.stream_prefix}/{key}"
+
+    def cached_url(self, key: str) -> Optional[str]:
+        """URL of an answer's audio once it is stored whole."""
+        return f"{self.url_prefix}/{key}.wav" if self.cache.touch(f"{key}.wav") else None
+
+    def pending(self, key: str) -> Optional[Tuple[str, str]]:
+        """Text and language of a requested answer, if known."""
+        data = self.cache.get(f"{key}.json")
+        if data is None:
+            return None
+        entry = json.loads(data)
+        return entry["text"], entry["language"]
+
+    def _sentence(self, sentence: str, language: str) -> Tuple[bytes, int]:
+        voice = self.voices[language]
+        name = f"{self.cache.key(sentence, language, voice)}.wav"
+        cached = self.cache.get(name)
+        if cached is not None:
+            return read_wav(cached)
+        with metrics.stage("synthesis"):
+            pcm, sample_rate = self.synthesize(sentence, voice)
+        self.cache.put(name, wav_header(sample_rate, len(pcm)) + pcm)
+        self.sentences += 1
+        self.audio_seconds += len(pcm) / (2 * sample_rate)
+        return pcm, sample_rate
+
+    async def stream(self, text: str, language: str) -> AsyncIterator[bytes]:
+        """WAV audio of the text, a sentence at a time; the whole is cached at the end."""
+        pieces = []
+        sample_rate = None
+        for sentence in self.split(text):
+            pcm, rate = await asyncio.to_thread(self._sentence, sentence, language)
+            if sample_rate is None:
+                sample_rate = rate
+                yield wav_header(sample_rate)
+            elif rate != sample_rate:
+                raise ValueError(f"Sample rate changed from {sample_rate} to {rate} Hz mid-answer")
+            pieces.append(pcm)
+            yield pcm
+        if sample_rate is not None:
+            pcm = b"".join(pieces)
+            key = self.cache.key(text, language, self.voices[language])
+            await asyncio.to_thread(self.cache.put, f"{key}.wav", wav_header(sample_rate, len(pcm)) + pcm)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "voices": dict(self.voices),
+            "sentences": self.sentences,
+            "audio_seconds": round(self.audio_seconds, 1),
+            "cache": self.cache.get_stats(),
+        }
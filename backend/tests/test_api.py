@@ -1,3 +1,5 @@
+import time
+
 import pytest
 from fastapi.testclient import TestClient
 from main import app
@@ -13,14 +15,25 @@ def test_health_check():
     assert "Room" in data["message"]
 
 def test_upload_document():
-    """Test document upload endpoint."""
-    content = b"Test document content"
+    """Test an upload is queued (202) and then processed by the job queue."""
+    content = b"Test document content: Room answers questions about the documents you upload to it."
     files = {"file": ("test.txt", content, "text/plain")}
-    response = client.post("/upload", files=files)
-    assert response.status_code == 200
-    data = response.json()
-    assert "message" in data
-    assert "doc_id" in data
+    # Entering the client runs startup, which starts the job queue
+    with TestClient(app) as started:
+        response = started.post("/upload", files=files)
+        assert response.status_code == 202
+        data = response.json()
+        assert data["filename"] == "test.txt"
+        assert data["job_id"]
+
+        deadline = time.monotonic() + 30
+        while True:
+            job = started.get(f"/jobs/{data['job_id']}").json()
+            if job["status"] in ("done", "failed") or time.monotonic() > deadline:
+                break
+            time.sleep(0.05)
+    assert job["status"] == "done", job["error"]
+    assert "test.txt" in job["message"]
 
 def test_ask_question_english():
     """Test asking questions in English."""
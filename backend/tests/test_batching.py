@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+from room_rag.batching import MicroBatcher
+
+
+def test_concurrent_items_are_batched():
+    """Test items submitted together run in one call and get their own results back."""
+    calls = []
+
+    def square(items):
+        calls.append(list(items))
+        return [item * item for item in items]
+
+    batcher = MicroBatcher(square, max_batch=10, max_wait=0.01)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+    assert asyncio.run(scenario()) == [0, 1, 4, 9, 16]
+    assert calls == [[0, 1, 2, 3, 4]]
+    assert batcher.get_stats()["avg_batch_size"] == 5
+
+
+def test_batches_are_capped_and_run_back_to_back():
+    """Test a full batch starts at once and the overflow forms the next batch."""
+    calls = []
+
+    def echo(items):
+        calls.append(list(items))
+        time.sleep(0.01)
+        return items
+
+    batcher = MicroBatcher(echo, max_batch=3, max_wait=10)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(7)))
+
+    started = time.monotonic()
+    assert asyncio.run(scenario()) == list(range(7))
+    # The trailing partial batch does not wait out max_wait behind a running batch
+    assert time.monotonic() - started < 1
+    assert calls == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_lone_item_waits_at_most_max_wait():
+    """Test a single request is not held back longer than max_wait."""
+    batcher = MicroBatcher(lambda items: items, max_batch=32, max_wait=0.02)
+
+    async def scenario():
+        started = time.monotonic()
+        await batcher.submit("only")
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) < 0.5
+
+
+def test_errors_reach_every_waiter():
+    """Test a failing batch raises in each submitter and the batcher keeps working."""
+    def fail_on_boom(items):
+        if "boom" in items:
+            raise ValueError("model failed")
+        return items
+
+    batcher = MicroBatcher(fail_on_boom, max_batch=2, max_wait=0.01)
+
+    async def scenario():
+        results = await asyncio.gather(batcher.submit("ok"), batcher.submit("boom"), return_exceptions=True)
+        return results, await batcher.submit("again")
+
+    results, again = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert again == "again"
@@ -0,0 +1,63 @@
+import time
+
+import numpy as np
+from room_rag.cache import AnswerCache, normalize_query
+
+
+def letter_embedding(texts):
+    """Embed texts by letter counts, so reworded queries land close together."""
+    vectors = np.zeros((len(texts), 26), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for char in text:
+            if "a" <= char <= "z":
+                vectors[row, ord(char) - 97] += 1
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_normalize_query():
+    """Test case, whitespace and punctuation don't change the key."""
+    assert normalize_query("  What is   Room? ") == normalize_query("what is room")
+
+
+def test_hit_requires_same_chunks_and_version():
+    """Test answers are only reused for the same context and corpus version."""
+    cache = AnswerCache(max_entries=10, ttl=60)
+    cache.put("What is Room?", [1, 2], 3, "gpt", "An assistant.")
+
+    assert cache.get("what is room", [1, 2], 3, "gpt") == "An assistant."
+    assert cache.get("what is room", [1, 5], 3, "gpt") is None
+    assert cache.get("what is room", [1, 2], 4, "gpt") is None
+    assert cache.get("what is room", [1, 2], 3, "fallback") is None
+    assert cache.get_stats()["hits"] == 1
+    assert cache.get_stats()["misses"] == 3
+
+
+def test_lru_eviction():
+    """Test the least recently used entry is evicted first."""
+    cache = AnswerCache(max_entries=2, ttl=60)
+    cache.put("a", [], 0, "gpt", "A")
+    cache.put("b", [], 0, "gpt", "B")
+    cache.get("a", [], 0, "gpt")
+    cache.put("c", [], 0, "gpt", "C")
+
+    assert cache.get("b", [], 0, "gpt") is None
+    assert cache.get("a", [], 0, "gpt") == "A"
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_ttl_expiry():
+    """Test entries expire after their TTL."""
+    cache = AnswerCache(max_entries=2, ttl=0.01)
+    cache.put("a", [], 0, "gpt", "A")
+    time.sleep(0.02)
+    assert cache.get("a", [], 0, "gpt") is None
+
+
+def test_near_duplicate_lookup():
+    """Test a reworded query is served when its embedding is close enough."""
+    cache = AnswerCache(max_entries=10, ttl=60, embed=letter_embedding, similarity=0.9)
+    cache.put("what does the report say about revenue", [4], 1, "gpt", "Revenue grew.")
+
+    assert cache.get("what does the report say about the revenue", [4], 1, "gpt") == "Revenue grew."
+    assert cache.get("hindi", [4], 1, "gpt") is None
+    assert cache.get_stats()["near_hits"] == 1
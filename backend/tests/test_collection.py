@@ -0,0 +1,187 @@
+import asyncio
+import threading
+
+import pytest
+from room_rag.collection import CollectionFullError, CollectionManager, CollectionNotFoundError
+
+
+class FakeUpload:
+    """Minimal async upload object."""
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self._data = data
+
+    async def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self._data)
+        block, self._data = self._data[:size], self._data[size:]
+        return block
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    """Create a manager that keeps a single collection in memory."""
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    manager = CollectionManager(tmp_path, max_loaded=1)
+    yield manager
+    manager.close()
+
+
+async def upload(manager, collection, filename, text):
+    async with manager.use(collection, create=True) as engine:
+        return await engine.process_document(FakeUpload(filename, text.encode()))
+
+
+def test_collections_are_isolated(manager, tmp_path):
+    """Test documents are only visible in the collection they were uploaded to."""
+    async def scenario():
+        await upload(manager, "alice", "notes.txt", "Alice keeps notes about quantum computing research papers.")
+        await upload(manager, "bob", "recipes.txt", "Bob collects recipes for sourdough bread and pastries daily.")
+        async with manager.use("alice") as engine:
+            alice = engine.find_relevant_chunks("sourdough bread")
+        async with manager.use("bob") as engine:
+            bob = engine.find_relevant_chunks("sourdough bread")
+        return alice, bob
+
+    alice, bob = asyncio.run(scenario())
+    assert alice == []
+    assert bob and "sourdough" in bob[0]
+    assert (tmp_path / "collections" / "alice").is_dir()
+    assert manager.list_ids() == ["alice", "bob", "default"]
+
+
+def test_idle_collections_are_evicted_and_reloaded(manager):
+    """Test the LRU collection is closed when the limit is reached and reloads from disk."""
+    async def scenario():
+        await upload(manager, "alice", "notes.txt", "Alice keeps notes about quantum computing research papers.")
+        await upload(manager, "bob", "recipes.txt", "Bob collects recipes for sourdough bread and pastries daily.")
+        evicted = list(manager._loaded)
+        async with manager.use("alice") as engine:
+            return evicted, [doc.filename for doc in engine.documents]
+
+    evicted, documents = asyncio.run(scenario())
+    assert evicted == ["bob"]
+    assert manager.evictions == 2
+    assert documents == ["notes.txt"]
+
+
+def test_borrowed_collections_are_not_evicted(manager):
+    """Test a collection in use stays loaded even past the limit."""
+    async def scenario():
+        async with manager.use("alice", create=True):
+            async with manager.use("bob", create=True):
+                pass
+            return sorted(manager._loaded)
+
+    assert asyncio.run(scenario()) == ["alice", "bob"]
+
+
+def test_collection_budget_and_ids_are_enforced(tmp_path, monkeypatch):
+    """Test full collections refuse uploads and unsafe ids are rejected."""
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    manager = CollectionManager(tmp_path, collection_budget=1)
+    try:
+        asyncio.run(upload(manager, "alice", "notes.txt", "Alice keeps notes about quantum computing research papers."))
+        with pytest.raises(CollectionFullError):
+            asyncio.run(manager.check_budget("alice"))
+        with pytest.raises(ValueError):
+            CollectionManager.validate("../etc")
+    finally:
+        manager.close()
+
+
+def test_readonly_manager_sees_writes_and_can_take_over(manager, tmp_path):
+    """Test a read-only manager refreshes on every lease and reopens writable after promotion."""
+    reader = CollectionManager(tmp_path, readonly=True)
+
+    async def scenario():
+        async with reader.use("alice", create=True) as engine:
+            before = len(engine.documents)
+        await upload(manager, "alice", "notes.txt", "Alice keeps notes about quantum computing research papers.")
+        async with reader.use("alice") as engine:
+            after = [doc.filename for doc in engine.documents]
+        reader.become_writer()
+        async with reader.use("alice") as engine:
+            return before, after, engine.readonly
+
+    assert asyncio.run(scenario()) == (0, ["notes.txt"], False)
+    reader.close()
+
+
+def test_readonly_refresh_waits_for_running_queries(manager, tmp_path):
+    """Test a reader only replays the writer's changes once no lease is using the indexes."""
+    reader = CollectionManager(tmp_path, readonly=True, refresh_wait=5)
+
+    async def scenario():
+        seen = []
+        async with reader.use("alice", create=True) as engine:
+            await upload(manager, "alice", "notes.txt", "Alice keeps notes about quantum computing research papers.")
+            # The next lease waits for this one rather than refresh the indexes under it
+            waiting = asyncio.create_task(count_documents(reader))
+            await asyncio.sleep(0.05)
+            seen.append((len(engine.documents), waiting.done()))
+        seen.append(await waiting)
+        return seen
+
+    async def count_documents(reader):
+        async with reader.use("alice") as engine:
+            return len(engine.documents)
+
+    assert asyncio.run(scenario()) == [(0, False), 1]
+    reader.close()
+
+
+def test_drop_deletes_storage_once_the_last_lease_is_returned(manager, tmp_path):
+    """Test dropping removes a collection's directory whether it is resident, unloaded or in use."""
+    async def scenario():
+        await upload(manager, "alice", "notes.txt", "Alice keeps notes about quantum computing research papers.")
+        await upload(manager, "bob", "recipes.txt", "Bob collects recipes for sourdough bread and pastries daily.")
+        # max_loaded=1: alice was evicted to disk
+        await manager.drop("alice")
+        assert not manager.path_for("alice").exists()
+
+        async with manager.use("bob") as engine:
+            await manager.drop("bob")
+            assert manager.path_for("bob").exists() and engine.documents == []
+            assert "bob" not in manager.list_ids()
+        assert not manager.path_for("bob").exists()
+
+        async with manager.use("bob", create=True) as engine:
+            return len(engine.documents)
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_unknown_collections_are_not_created_by_reads(manager):
+    """Test using a collection that does not exist fails without creating its storage."""
+    async def scenario():
+        with pytest.raises(CollectionNotFoundError):
+            async with manager.use("mallory"):
+                pass
+        await manager.check_budget("mallory")
+        async with manager.use("default"):
+            pass
+
+    asyncio.run(scenario())
+    assert not manager.path_for("mallory").exists()
+    assert not manager.exists("mallory") and manager.exists("default")
+    assert manager.list_ids() == ["default"]
+
+
+def test_evicted_collections_are_closed_off_the_event_loop(manager):
+    """Test eviction snapshots an idle collection in a worker thread, not on the event loop."""
+    closed_in = []
+
+    async def scenario():
+        await upload(manager, "alice", "notes.txt", "Alice keeps notes about quantum computing research papers.")
+        engine = manager._loaded["alice"].engine
+        close = engine.close
+        engine.close = lambda: (closed_in.append(threading.current_thread()), close())
+        async with manager.use("bob", create=True):
+            pass
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(scenario())
+    assert closed_in and closed_in[0] is not loop_thread
+    assert list(manager._loaded) == ["bob"]
@@ -0,0 +1,61 @@
+from room_rag.context import ContextPacker, split_sentences, strip_overlap
+
+
+def count_words(text):
+    """Count whitespace-separated words, a stand-in tokenizer."""
+    return len(text.split())
+
+
+def test_sentences_split_on_end_punctuation_and_lines():
+    """Test sentences split after . ! ? and line breaks, not inside numbers."""
+    assert split_sentences("Revenue was 3.5 million. Growth!\nNext line? ok") == [
+        "Revenue was 3.5 million.", "Growth!", "Next line?", "ok"
+    ]
+
+
+def test_overlapping_chunk_edges_are_removed():
+    """Test text shared at the seam of two chunks is cut from either side."""
+    first = "The report opens with revenue and growth in the third quarter."
+    second = "growth in the third quarter. Then it covers hiring plans."
+    assert strip_overlap(second, first) == " Then it covers hiring plans."
+    assert strip_overlap(first, second) == "The report opens with revenue and "
+    assert strip_overlap("Unrelated text about other things.", first) == "Unrelated text about other things."
+
+
+def test_best_sentences_fill_the_budget():
+    """Test sentences matching the query win, keep document order and drop empty chunks."""
+    packer = ContextPacker(budget=12, count_tokens=count_words)
+    chunks = [
+        "The office moved to Berlin. Hiring plans were delayed until spring. Lunch is at noon.",
+        "Nothing relevant is said here at all.",
+        "Hiring plans were delayed until spring. Engineering hiring resumes in May.",
+    ]
+    passages, usage = packer.pack("When do hiring plans resume?", chunks)
+
+    assert passages == [
+        "Hiring plans were delayed until spring.",
+        "Engineering hiring resumes in May.",
+    ]
+    assert usage["context_tokens"] == 11 <= usage["budget"]
+    assert usage["raw_context_tokens"] == 33
+    assert usage["chunks_used"] == 2
+    assert packer.get_stats()["context_tokens_saved"] == 22
+
+
+def test_gaps_between_picked_sentences_are_marked():
+    """Test sentences that are not adjacent in a chunk are joined with an ellipsis."""
+    packer = ContextPacker(budget=100, count_tokens=count_words)
+    passages, _ = packer.pack("zebra", ["Zebras are striped. Cats purr. A zebra runs."])
+    assert passages == ["Zebras are striped. Cats purr. A zebra runs."]
+
+    packer = ContextPacker(budget=7, count_tokens=count_words)
+    passages, _ = packer.pack("zebra", ["A zebra runs. Cats purr loudly. The zebra sleeps."])
+    assert passages == ["A zebra runs. … The zebra sleeps."]
+
+
+def test_whole_chunks_are_cut_at_the_budget():
+    """Test chunk mode keeps ranked chunks whole and trims the one that crosses the budget."""
+    packer = ContextPacker(budget=6, extract_sentences=False, count_tokens=count_words)
+    passages, usage = packer.pack("anything", ["one two three four.", "five six seven eight."])
+    assert passages == ["one two three four.", "five six …"]
+    assert usage["chunks_used"] == 2
@@ -0,0 +1,110 @@
+import asyncio
+import pickle
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from room_rag.dense import DenseRetriever
+
+
+def bag_of_words(texts):
+    """Deterministic hashed bag-of-words encoder standing in for a model."""
+    vectors = np.zeros((len(texts), 64), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in text.lower().split():
+            vectors[row, sum(map(ord, word)) % 64] += 1
+    return vectors
+
+
+@pytest.fixture
+def retriever():
+    """Create a retriever with a few chunks."""
+    retriever = DenseRetriever(encoder=bag_of_words, flat_max=4)
+    retriever.add_many(0, ["revenue grew this quarter", "hindi translation support", "weather is sunny"])
+    return retriever
+
+
+def test_search_returns_nearest_chunk(retriever):
+    """Test the closest chunk is ranked first."""
+    assert retriever.search("quarter revenue", top_k=1)[0][0] == 0
+
+
+def test_switches_to_approximate_index(retriever):
+    """Test the index is rebuilt as HNSW above the flat size limit."""
+    assert retriever._index_kind == "flat"
+    retriever.add_many(3, ["sunny weather forecast", "revenue and profit"])
+    assert retriever._index_kind == "hnsw"
+    assert retriever.search("hindi translation", top_k=1)[0][0] == 1
+
+
+def test_removed_chunks_are_hidden_then_remapped(retriever):
+    """Test deleted chunks never come back and survive renumbering."""
+    retriever.remove(0)
+    assert 0 not in [chunk_id for chunk_id, _ in retriever.search("revenue", top_k=3)]
+
+    retriever.remap({1: 0, 2: 1})
+    assert len(retriever) == 2
+    assert retriever.search("weather sunny", top_k=1)[0][0] == 1
+
+
+def test_snapshot_round_trip(retriever):
+    """Test pickled retrievers keep their vectors and rebuild the index."""
+    restored = pickle.loads(pickle.dumps(retriever))
+    restored.encoder = bag_of_words
+    assert restored.search("hindi", top_k=1)[0][0] == 1
+
+
+def test_concurrent_queries_share_one_embedding_batch(retriever):
+    """Test queries searched at the same time are embedded in one call, with unchanged results."""
+    batches = []
+
+    def encoder(texts):
+        batches.append(list(texts))
+        return bag_of_words(texts)
+
+    retriever.encoder = encoder
+
+    async def scenario():
+        return await asyncio.gather(
+            retriever.search_async("quarter revenue", top_k=1),
+            retriever.search_async("hindi translation", top_k=1),
+            retriever.search_async("quarter revenue", top_k=1),
+        )
+
+    results = asyncio.run(scenario())
+    assert [hits[0][0] for hits in results] == [0, 1, 0]
+    assert batches == [["quarter revenue", "hindi translation"]]
+    assert retriever.batcher.get_stats()["largest_batch"] == 3
+
+
+def test_known_chunks_reuse_vectors(retriever):
+    """Test chunks mapped to indexed ones copy their vectors instead of being embedded."""
+    embedded = []
+
+    def encoder(texts):
+        embedded.extend(texts)
+        return bag_of_words(texts)
+
+    retriever.encoder = encoder
+    retriever.add_many(3, ["hindi translation support", "new profit forecast"], known={0: 1})
+
+    assert embedded == ["new profit forecast"]
+    np.testing.assert_array_equal(retriever.vectors[3], retriever.vectors[1])
+    assert retriever.search("profit forecast", top_k=1)[0][0] == 4
+
+
+def test_vectors_grow_in_place(retriever):
+    """Test batches are appended to a buffer with spare room rather than copying every vector each time."""
+    buffer = retriever._vectors
+    for start in range(3, 300, 3):
+        retriever.add_many(start, [f"note {start}", f"revenue {start}", f"weather {start}"])
+    assert retriever._vectors is buffer
+    assert len(retriever.vectors) == len(retriever.ids) == 300
+    assert retriever.ids.tolist() == list(range(300))
+
+    restored = pickle.loads(pickle.dumps(retriever))
+    restored.encoder = bag_of_words
+    np.testing.assert_array_equal(restored.vectors, retriever.vectors)
+    assert restored.search("hindi translation support", top_k=1)[0][0] == 1
@@ -0,0 +1,295 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from room_rag import ingest, metrics
+from room_rag.engine import RoomRAG
+from room_rag.llm import LLMClient
+from room_rag.pipeline import RetrievalPipeline
+
+
+class FakeUpload:
+    """Minimal async upload object."""
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self._data = data
+
+    async def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self._data)
+        block, self._data = self._data[:size], self._data[size:]
+        return block
+
+
+class FakeStreamingClient:
+    """Stands in for AsyncOpenAI, streaming a fixed answer."""
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+
+        async def stream():
+            for piece in self.pieces:
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+        return stream()
+
+
+@pytest.fixture
+def rag_engine(tmp_path, monkeypatch):
+    """Create an engine with its own storage and no OpenAI key."""
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    engine = RoomRAG(storage_path=tmp_path / "storage")
+    asyncio.run(engine.process_document(FakeUpload(
+        "room.txt",
+        b"Room is a multilingual AI assistant that helps you chat with your documents."
+    )))
+    asyncio.run(engine.process_document(FakeUpload(
+        "report.txt",
+        b"The quarterly revenue report shows growth in every region of the company."
+    )))
+    yield engine
+    engine.close()
+
+
+async def collect(events):
+    return [event async for event in events]
+
+
+def test_stream_sends_citations_before_tokens(rag_engine):
+    """Test citations are the first event and tokens follow from the model stream."""
+    rag_engine.llm = LLMClient(client=FakeStreamingClient(["Room is ", "an assistant."]))
+    events = asyncio.run(collect(rag_engine.stream_response("What is Room?")))
+
+    assert events[0]["event"] == "citations"
+    assert events[0]["data"][0]["filename"] == "room.txt"
+    assert [event["data"] for event in events[1:]] == ["Room is ", "an assistant."]
+    assert rag_engine.llm.client.calls[0]["stream"] is True
+
+
+def test_fallback_response_streams(rag_engine):
+    """Test the no-LLM path streams the same text get_response returns."""
+    events = asyncio.run(collect(rag_engine.stream_response("quarterly revenue")))
+    streamed = "".join(event["data"] for event in events if event["event"] == "token")
+
+    assert len(events) > 2
+    assert streamed == asyncio.run(rag_engine.get_response("quarterly revenue"))
+
+
+def test_answers_are_cached_until_the_corpus_changes(rag_engine):
+    """Test a repeated question hits the cache and an upload invalidates it."""
+    client = FakeStreamingClient([])
+
+    async def create(**kwargs):
+        client.calls.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Room helps."))])
+
+    client.chat.completions.create = create
+    rag_engine.llm = LLMClient(client=client)
+
+    assert asyncio.run(rag_engine.get_response("What is Room?")) == "Room helps."
+    assert asyncio.run(rag_engine.get_response("what is room")) == "Room helps."
+    assert len(client.calls) == 1
+
+    asyncio.run(rag_engine.process_document(FakeUpload("more.txt", b"Room also reads PDF files and plain text files that you upload to it.")))
+    asyncio.run(rag_engine.get_response("What is Room?"))
+    assert len(client.calls) == 2
+
+
+def test_text_upload_is_streamed_in_blocks(rag_engine, monkeypatch):
+    """Test a text upload larger than one read block is chunked across blocks."""
+    monkeypatch.setattr(RoomRAG, "READ_BLOCK_SIZE", 1000)
+    monkeypatch.setattr(RoomRAG, "INDEX_BATCH_SIZE", 2)
+    words = " ".join(f"token{i}" for i in range(3000)) + " zebra é"
+    data = words.encode("utf-8")
+    reads = []
+    upload = FakeUpload("big.txt", data)
+    original_read = upload.read
+
+    async def read(size=-1):
+        reads.append(size)
+        return await original_read(size)
+
+    upload.read = read
+    message = asyncio.run(rag_engine.process_document(upload))
+
+    assert "processed successfully" in message
+    assert set(reads) == {1000}
+    doc = rag_engine.documents[-1]
+    assert doc.size == len(data)
+    chunks = [rag_engine.store[i] for i in doc.chunk_ids]
+    starts = [int(rag_engine.store.char_starts[i]) for i in doc.chunk_ids]
+    assert all(words[start:start + len(chunk)] == chunk for start, chunk in zip(starts, chunks))
+    assert starts[0] == 0 and starts[-1] + len(chunks[-1]) == len(words)
+    assert rag_engine.find_relevant_chunks("zebra", top_k=1) == [chunks[-1]]
+
+
+def test_identical_upload_is_skipped(rag_engine):
+    """Test uploading the same bytes again stores nothing new, whatever the filename."""
+    data = b"Room is a multilingual AI assistant that helps you chat with your documents."
+    chunks_before = len(rag_engine.store)
+
+    assert "already uploaded" in asyncio.run(rag_engine.process_document(FakeUpload("room.txt", data)))
+    assert "identical to 'room.txt'" in asyncio.run(rag_engine.process_document(FakeUpload("copy.txt", data)))
+    assert len(rag_engine.store) == chunks_before
+    assert len(rag_engine.documents) == 2
+
+
+def test_new_version_replaces_the_document(rag_engine):
+    """Test an upload naming a stored document replaces it, reusing unchanged chunks."""
+    # Paragraphs of 166 five-letter words each fill one 1000-character chunk
+    sections = [" ".join([word] * 166) for word in ("apple", "mango", "peach")]
+    asyncio.run(rag_engine.process_document(FakeUpload("fruit.txt", "\n\n".join(sections).encode())))
+    previous = rag_engine.documents[-1].doc_id
+    sections[2] = " ".join(["guava"] * 166)
+
+    message = asyncio.run(rag_engine.process_document(
+        FakeUpload("fruit-v2.txt", "\n\n".join(sections).encode()), replace=previous
+    ))
+
+    assert "1 of 3 text chunks changed" in message
+    assert [doc.filename for doc in rag_engine.documents] == ["room.txt", "report.txt", "fruit-v2.txt"]
+    assert "guava" in rag_engine.find_relevant_chunks("guava", top_k=1)[0]
+    assert rag_engine.find_relevant_chunks("peach", top_k=1) == []
+    with pytest.raises(KeyError):
+        asyncio.run(rag_engine.process_document(FakeUpload("fruit.txt", b"kiwi " * 40), replace=previous))
+
+
+def test_same_filename_is_kept_unless_replaced(rag_engine):
+    """Test an upload sharing a stored document's filename is added next to it, not over it."""
+    asyncio.run(rag_engine.process_document(FakeUpload(
+        "room.txt", b"An unrelated room.txt about the conference room booking rules and its projector."
+    )))
+
+    assert [doc.filename for doc in rag_engine.documents] == ["room.txt", "report.txt", "room.txt"]
+    assert "multilingual" in rag_engine.find_relevant_chunks("multilingual assistant", top_k=1)[0]
+
+
+def test_readonly_engine_refreshes_from_the_writer(rag_engine):
+    """Test a read-only engine finds documents the writing engine adds after it opened."""
+    reader = RoomRAG(storage_path=rag_engine.storage_path, readonly=True)
+    assert len(reader.documents) == 2
+    assert not reader.refresh()
+    with pytest.raises(PermissionError):
+        asyncio.run(reader.process_document(FakeUpload("x.txt", b"x" * 100)))
+
+    asyncio.run(rag_engine.process_document(FakeUpload(
+        "zoo.txt", b"The zoo keeps penguins, otters and a very old tortoise named Harriet."
+    )))
+    assert reader.refresh()
+    assert reader.find_relevant_chunks("tortoise Harriet", top_k=1) == [rag_engine.store[len(rag_engine.store) - 1]]
+    reader.close()
+
+
+def test_failed_refresh_is_retried_from_the_store(rag_engine, monkeypatch):
+    """Test a refresh that fails part way rebuilds the indexes on the next one instead of losing records."""
+    reader = RoomRAG(storage_path=rag_engine.storage_path, readonly=True)
+    asyncio.run(rag_engine.process_document(FakeUpload(
+        "zoo.txt", b"The zoo keeps penguins, otters and a very old tortoise named Harriet."
+    )))
+
+    def broken(index, records):
+        raise OSError("disk hiccup")
+    monkeypatch.setattr(reader, "_replay", broken)
+    with pytest.raises(OSError):
+        reader.refresh()
+    monkeypatch.undo()
+    assert reader.needs_refresh()
+
+    assert reader.refresh()
+    assert not reader.needs_refresh()
+    assert reader.find_relevant_chunks("tortoise Harriet", top_k=1) == [rag_engine.store[len(rag_engine.store) - 1]]
+    reader.close()
+
+
+def test_prompt_context_is_packed_to_the_budget(rag_engine):
+    """Test the model only receives context within the token budget, and usage is recorded."""
+    rag_engine.context_packer.budget = 20
+    chunks = [" ".join(["filler"] * 50) + ". Room answers questions.", "Room is an assistant."]
+    messages, usage = rag_engine._build_messages("What is Room?", chunks)
+
+    assert "filler filler" not in messages[1]["content"]
+    assert "Room answers questions." in messages[1]["content"]
+    assert usage["context_tokens"] <= 20
+    assert usage["prompt_tokens"] > usage["context_tokens"]
+    assert rag_engine.context_packer.get_stats()["avg_prompt_tokens"] == usage["prompt_tokens"]
+
+
+def test_each_answer_reports_its_own_token_usage(rag_engine):
+    """Test concurrent chats each get their own context, prompt and model-reported token counts."""
+    client = FakeStreamingClient([])
+
+    async def create(**kwargs):
+        client.calls.append(kwargs)
+        reported = SimpleNamespace(prompt_tokens=100 * len(client.calls), completion_tokens=7)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Room helps."))], usage=reported)
+
+    client.chat.completions.create = create
+    rag_engine.llm = LLMClient(client=client)
+
+    async def chat(query):
+        with metrics.request("chat"):
+            await rag_engine.get_response(query)
+            return metrics.usage()
+
+    async def scenario():
+        return await asyncio.gather(chat("What is Room?"), chat("How did revenue grow?"))
+
+    first, second = asyncio.run(scenario())
+    assert {first["reported_prompt"], second["reported_prompt"]} == {100, 200}
+    assert first["completion"] == second["completion"] == 7
+    assert all(usage["prompt"] > usage["context"] > 0 for usage in (first, second))
+    assert metrics.get_stats()["tokens"]["chat reported_prompt"] == {"calls": 2, "avg": 150.0}
+
+
+def test_pipeline_stage_timings_belong_to_their_request(rag_engine):
+    """Test each retrieval stage of the hybrid pipeline is timed in the request that ran it."""
+    rag_engine.pipeline = RetrievalPipeline(retrievers={"lexical": rag_engine._find_hits}, get_text=str)
+
+    async def scenario():
+        with metrics.request("chat") as timings:
+            hits = await rag_engine.retrieve_hits("What is Room?")
+        return hits, timings
+
+    hits, timings = asyncio.run(scenario())
+    assert hits
+    assert {"retrieval_lexical", "retrieval_fusion"} <= set(timings)
+    assert not hasattr(rag_engine, "last_timings")
+
+
+def test_text_shorter_than_the_minimum_is_rejected(rag_engine):
+    """Test text uploads use the same minimum length as PDFs: exactly the minimum is accepted."""
+    text = ("abcd " * 10).strip()  # 49 characters
+    assert len(text) + 1 == ingest.MIN_TEXT_CHARS
+    short = asyncio.run(rag_engine.process_document(FakeUpload("short.txt", text.encode())))
+    enough = asyncio.run(rag_engine.process_document(FakeUpload("enough.txt", (text + "e").encode())))
+    assert short.startswith("Warning")
+    assert not enough.startswith("Warning")
+    assert [doc.filename for doc in rag_engine.documents][-1] == "enough.txt"
+
+
+def test_pipeline_fallback_embeds_the_query_off_the_event_loop(rag_engine):
+    """Test an empty pipeline result falls back to the batched async dense search, not the blocking one."""
+    calls = []
+
+    class FakeDense:
+        def __len__(self):
+            return 1
+
+        def search(self, query, top_k):
+            raise AssertionError("blocking search on the event loop")
+
+        async def search_async(self, query, top_k):
+            calls.append(query)
+            return [(0, 1.0)]
+
+    rag_engine.dense = FakeDense()
+    rag_engine.pipeline = RetrievalPipeline(retrievers={"lexical": lambda query, top_k: []}, get_text=str)
+    assert asyncio.run(rag_engine.retrieve_hits("What is Room?")) == [(0, 1.0)]
+    assert calls == ["What is Room?"]
+    rag_engine.dense = None  # Nothing to snapshot at close
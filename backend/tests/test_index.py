@@ -0,0 +1,129 @@
+import pickle
+import threading
+
+import pytest
+from room_rag.index import InvertedIndex, analyze, query_terms, tokenize
+
+
+@pytest.fixture
+def index():
+    """Create a small populated index."""
+    index = InvertedIndex()
+    index.add_many(0, [
+        "Room is a multilingual AI assistant for your documents.",
+        "The weather today is sunny with a light breeze.",
+        "Room supports English and Hindi translation of documents.",
+    ])
+    return index
+
+
+def test_tokenize_strips_punctuation():
+    """Test tokenization lowercases and drops punctuation."""
+    assert tokenize("What is Room?") == ["what", "is", "room"]
+
+
+def test_query_terms_removes_stop_words():
+    """Test stop words are removed from queries."""
+    assert query_terms("What is the weather in Room?") == ["weather", "room"]
+
+
+def test_search_ranks_matching_chunks(index):
+    """Test BM25 ranks chunks that contain the query terms."""
+    hits = index.search(["hindi", "room"], top_k=3)
+    chunk_ids = [chunk_id for chunk_id, score in hits]
+    assert chunk_ids[0] == 2
+    assert 1 not in chunk_ids
+
+
+def test_rare_terms_weigh_more(index):
+    """Test IDF favours rarer terms."""
+    assert index.idf("weather") > index.idf("room")
+
+
+def test_incremental_add(index):
+    """Test chunks added later are searchable."""
+    index.add(3, "Quarterly revenue grew by twelve percent.")
+    assert index.search(["revenue"])[0][0] == 3
+    assert len(index) == 4
+
+
+def test_clear(index):
+    """Test clearing the index."""
+    index.clear()
+    assert len(index) == 0
+    assert index.search(["room"]) == []
+
+
+def test_search_after_removals_and_merges(monkeypatch):
+    """Test removed chunks disappear from results across buffer merges."""
+    monkeypatch.setattr(InvertedIndex, "MERGE_MIN", 4)
+    index = InvertedIndex()
+    index.add_many(0, [f"alpha beta chunk{i}" for i in range(10)])
+    for chunk_id in (0, 3, 7):
+        index.remove(chunk_id, f"alpha beta chunk{chunk_id}")
+    index.add_many(10, [f"alpha gamma chunk{i}" for i in range(10, 15)])
+
+    hits = index.search(["alpha"], top_k=20)
+    assert sorted(chunk_id for chunk_id, _ in hits) == [1, 2, 4, 5, 6, 8, 9, 10, 11, 12, 13, 14]
+    assert index.search(["chunk3"]) == []
+    assert len(index) == 12
+
+
+def test_equal_scores_rank_by_chunk_id():
+    """Test ties are broken by chunk id, so results are deterministic."""
+    index = InvertedIndex()
+    index.add_many(0, ["same words here"] * 6)
+    assert [chunk_id for chunk_id, _ in index.search(["words"], top_k=3)] == [0, 1, 2]
+
+
+def test_loads_dict_postings_snapshot(index):
+    """Test snapshots written with dict postings are converted on load."""
+    texts = [
+        "Room is a multilingual AI assistant for your documents.",
+        "The weather today is sunny with a light breeze.",
+        "Room supports English and Hindi translation of documents.",
+    ]
+    postings, doc_lengths = {}, {}
+    for chunk_id, text in enumerate(texts):
+        doc_lengths[chunk_id], counts = analyze(text)
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((chunk_id, tf))
+
+    legacy = InvertedIndex.__new__(InvertedIndex)
+    legacy.__setstate__({
+        "k1": 1.5, "b": 0.75, "postings": postings,
+        "doc_lengths": doc_lengths, "total_length": sum(doc_lengths.values()),
+    })
+    assert len(legacy) == 3
+    assert legacy.search(["hindi", "room"], top_k=3) == index.search(["hindi", "room"], top_k=3)
+
+
+def test_concurrent_search_and_add():
+    """Searches in worker threads never collide with chunks being added (or pickled) meanwhile."""
+    index = InvertedIndex()
+    done = threading.Event()
+    errors = []
+
+    def search():
+        try:
+            while not done.is_set():
+                index.search(["room", "documents"], top_k=3)
+        except Exception as e:  # pragma: no cover - the failure being guarded against
+            errors.append(e)
+
+    threads = [threading.Thread(target=search) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    try:
+        words = " ".join(f"w{i}" for i in range(50))
+        for chunk_id in range(3000):
+            index.add(chunk_id, f"Room chunk {chunk_id} about documents {words}")
+    finally:
+        done.set()
+        for thread in threads:
+            thread.join()
+
+    assert errors == []
+    restored = pickle.loads(pickle.dumps(index))
+    assert restored.search(["chunk"], top_k=1) == index.search(["chunk"], top_k=1)
+    restored.add(3000, "still growable")
@@ -0,0 +1,204 @@
+import asyncio
+import os
+
+import pytest
+from room_rag.ingest import (
+    Chunk, IngestBusyError, IngestPool, ParseCache, TextStream, chunk_document, clean_text, prepare_text,
+)
+
+
+def test_prepare_text_cleans_chunks_and_tokenizes():
+    """Test the worker-side preparation step."""
+    chars, chunks, analyses, seconds = prepare_text("Room   is\n\na multilingual   assistant.")
+    assert chunks == [Chunk("Room is\n\na multilingual assistant.", 0, 0)]
+    assert chars == len(chunks[0].text)
+    length, counts = analyses[0]
+    assert length == 5
+    assert counts == {"room": 1, "multilingual": 1, "assistant": 1}
+    assert set(seconds) == {"clean", "chunk", "tokenize"}
+
+
+def test_run_executes_in_worker_process():
+    """Test work is submitted to the process pool."""
+    pool = IngestPool(max_workers=1)
+    try:
+        _, chunks, _, _ = asyncio.run(pool.run(prepare_text, "hello   world"))
+        assert chunks == [Chunk("hello world", 0, 0)]
+    finally:
+        pool.shutdown()
+
+
+def make_pdf(pages):
+    """A minimal PDF with one line of Helvetica text per page."""
+    count = len(pages)
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{4 + 2 * i} 0 R" for i in range(count)), count),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(pages):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    pdf, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return pdf
+
+
+def test_pdf_pages_are_extracted_in_parallel_without_resending_the_file():
+    """Test workers get the upload's path and a page range, never its bytes, and the spool file is removed."""
+    pool = IngestPool(max_workers=2, pages_per_task=2)
+    sent = []
+    run = pool.run
+
+    async def recording_run(fn, *args):
+        sent.append(args)
+        return await run(fn, *args)
+
+    pool.run = recording_run
+    updates = []
+    try:
+        text = asyncio.run(pool.extract_pdf(make_pdf([f"Line on page {n}" for n in range(1, 6)]),
+                                            lambda **fields: updates.append(fields)))
+    finally:
+        pool.shutdown()
+
+    assert text.split("\n\n") == [f"Page {n}: Line on page {n}" for n in range(1, 6)]
+    assert not any(isinstance(arg, bytes) for args in sent for arg in args)
+    assert sorted(args[1:] for args in sent[1:]) == [(0, 2), (2, 4), (4, 5)]
+    assert not os.path.exists(sent[0][0])
+    assert updates[0] == {"pages_total": 5} and updates[-1] == {"pages_parsed": 5}
+
+
+def test_saturated_pool_applies_backpressure():
+    """Test uploads beyond the pending limit are rejected after the queue timeout."""
+    pool = IngestPool(max_workers=1, max_pending=1, queue_timeout=0.05)
+
+    async def scenario():
+        async with pool.slot():
+            assert pool.get_stats()["pending"] == 1
+            with pytest.raises(IngestBusyError):
+                async with pool.slot():
+                    pass
+        async with pool.slot():
+            return pool.get_stats()["pending"]
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_text_stream_matches_whole_document_cleaning():
+    """Test streaming in small pieces yields the same chunks as cleaning the whole text."""
+    text = ("Intro line.\n\n%PDF-1.4 1 0 obj << /Type /Catalog >> endobj  body   text "
+            + "word " * 300 + "A sentence ends here. " * 30 + "\n \n2 0 obj << /Length 5 >> endobj tail\tend "
+            + "multi-\nlingual ﬁle cafe\u0301 ") * 3
+    expected = chunk_document(clean_text(text), chunk_size=500)
+
+    for piece_size in (7, 64, 1000):
+        stream = TextStream(chunk_size=500)
+        chunks = []
+        for start in range(0, len(text), piece_size):
+            chunks += stream.feed(text[start:start + piece_size])
+        chunks += stream.finish()
+        assert chunks == expected
+
+
+def test_text_stream_keeps_unclosed_markers_as_text():
+    """Test an "obj" with no closing "endobj" is not treated as an artifact."""
+    stream = TextStream()
+    chunks = stream.feed("objects are ") + stream.feed("fine") + stream.finish()
+    assert [chunk.text for chunk in chunks] == ["objects are fine"]
+
+
+def test_clean_text_removes_pdf_objects_but_keeps_prose():
+    """Test PDF syntax is stripped while words like "object" and a stray "endobj" survive."""
+    assert clean_text("%PDF-1.4\n1 0 obj\n<< /Type /Catalog >>\nendobj\nHello  there") == "Hello there"
+    assert clean_text("An object model.\n\nSee the endobj docs.") == "An object model.\n\nSee the endobj docs."
+    # An unclosed "obj" costs one scan, not one scan per occurrence
+    assert clean_text("obj " * 50_000) == ("obj " * 50_000).strip()
+
+
+def test_clean_text_normalizes_unicode_and_repairs_hyphenation():
+    """Test NFKC normalization, invisible characters and words broken across lines."""
+    text = "The ﬁrst multi-\nlingual docu\u00adment,\u00a0by Jean-\nPaul\u200b.\r\n\r\nNext   page"
+    assert clean_text(text) == "The first multilingual document, by Jean-\nPaul.\n\nNext page"
+
+
+def test_chunks_end_at_paragraphs_and_keep_headings():
+    """Test a half-full chunk ends at a blank line and a heading stays with its paragraph."""
+    first = " ".join(["First paragraph sentence."] * 25)
+    second = " ".join(["Second paragraph sentence."] * 10)
+    text = clean_text(f"{first}\n\nHeading\n\n{second}")
+    chunks = chunk_document(text, chunk_size=1000, overlap=150)
+
+    assert [chunk.text for chunk in chunks] == [first, f"Heading\n\n{second}"]
+    assert all(text[chunk.char_start:chunk.char_start + len(chunk.text)] == chunk.text for chunk in chunks)
+
+
+def test_chunks_cut_inside_a_paragraph_overlap_by_whole_sentences():
+    """Test the next chunk repeats the last sentences of a cut paragraph, up to the overlap."""
+    text = " ".join(f"Sentence number {i:02d} is here." for i in range(60))
+    chunks = chunk_document(text, chunk_size=300, overlap=60)
+
+    assert len(chunks) > 1
+    for previous, chunk in zip(chunks, chunks[1:]):
+        repeated = text[chunk.char_start:previous.char_start + len(previous.text)]
+        assert previous.text.endswith(repeated) and chunk.text.startswith(repeated)
+        assert 0 < len(repeated) <= 60 and repeated.endswith(".")
+    assert all(len(chunk.text) <= 300 for chunk in chunks)
+    assert all(text[chunk.char_start:chunk.char_start + len(chunk.text)] == chunk.text for chunk in chunks)
+
+
+def test_long_sentences_are_split_between_words():
+    """Test a sentence longer than a chunk is cut at word boundaries."""
+    chunks = chunk_document(" ".join(["word"] * 100), chunk_size=50, overlap=0)
+    assert all(len(chunk.text) <= 50 and chunk.text.split(" ") == ["word"] * len(chunk.text.split(" "))
+               for chunk in chunks)
+    assert sum(len(chunk.text.split(" ")) for chunk in chunks) == 100
+
+
+def test_chunks_record_the_page_they_start_on():
+    """Test PDF page markers are dropped from chunks and recorded as their page."""
+    text = clean_text("Page 1: Cover page.\n\nPage 2: " + "Body text. " * 40 + "\n\nPage 3: " + "Last words. " * 20)
+    chunks = chunk_document(text, chunk_size=200, overlap=0, pages=True)
+
+    assert chunks[0] == Chunk("Cover page. Body text." + " Body text." * 16, 1, 0)
+    assert [chunk.page for chunk in chunks] == [1, 2, 2, 3]
+    assert not any("Page" in chunk.text for chunk in chunks)
+
+
+def test_parse_cache_round_trips_and_evicts_least_recently_used(tmp_path):
+    """Test cached parses come back intact and the oldest go once the cache is full."""
+    cache = ParseCache(tmp_path, max_bytes=10_000)
+    entry = {"chunks": ["Page 1: Room"], "pages": [1], "pages_total": 1, "preview": "Page 1: Room"}
+    cache.put("a" * 64, entry)
+    assert cache.get("a" * 64) == entry
+    assert cache.get("b" * 64) is None
+
+    for name in "cdefgh":
+        cache.put(name * 64, {"chunks": [os.urandom(2000).hex()]})
+    assert cache.get("a" * 64) is None
+    assert cache.get("h" * 64) is not None
+    assert sum(path.stat().st_size for path in tmp_path.iterdir()) <= 10_000
+
+
+def test_parse_cache_lists_the_directory_only_when_full(tmp_path, monkeypatch):
+    """Test puts below the size limit are counted rather than re-listing the cache."""
+    cache = ParseCache(tmp_path, max_bytes=10_000)
+    listings = []
+    trim = cache._trim
+    monkeypatch.setattr(cache, "_trim", lambda: listings.append(1) or trim())
+    for name in "abc":
+        cache.put(name * 64, {"chunks": ["Page 1: Room"]})
+    assert len(listings) == 1  # The first write learns the directory's size
+    for name in "defgh":
+        cache.put(name * 64, {"chunks": [os.urandom(2000).hex()]})
+    assert len(listings) > 1
+    assert sum(path.stat().st_size for path in tmp_path.iterdir()) <= 10_000
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import subprocess
+import sys
+
+import pytest
+from room_rag.ingest import IngestBusyError
+from room_rag.jobs import JobQueue
+
+
+class FakeUpload:
+    """Minimal async upload object."""
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self._data = data
+
+    async def read(self, size=-1):
+        block, self._data = self._data[:size], self._data[size:]
+        return block
+
+
+async def echo_handler(upload, progress, prefix=""):
+    """Handler that reports progress and echoes the upload."""
+    if upload is None:
+        return f"{prefix}no upload"
+    content = await upload.read()
+    progress(pages_total=1, pages_parsed=1, chunks=2)
+    return f"{prefix}{upload.filename}: {content.decode()}"
+
+
+def test_job_runs_in_background(tmp_path):
+    """Test a submitted job is processed and reports progress."""
+    async def scenario():
+        queue = JobQueue(echo_handler, tmp_path, workers=1)
+        await queue.start()
+        job = await queue.submit(FakeUpload("a.txt", b"hello"))
+        assert job["status"] == "queued"
+        await queue._queue.join()
+        await queue.stop()
+        return queue.get(job["id"]), queue.get_stats()
+
+    job, stats = asyncio.run(scenario())
+    assert job["status"] == "done"
+    assert job["message"] == "a.txt: hello"
+    assert job["chunks"] == 2
+    assert stats["completed"] == 1
+    assert stats["queue_depth"] == 0
+
+
+def test_unfinished_jobs_resume_after_restart(tmp_path):
+    """Test queued jobs are persisted and picked up again on the next start."""
+    async def submit_without_workers():
+        queue = JobQueue(echo_handler, tmp_path, workers=1)
+        queue._queue = asyncio.Queue()
+        return (await queue.submit(FakeUpload("b.txt", b"later")))["id"]
+
+    async def restart():
+        queue = JobQueue(echo_handler, tmp_path, workers=1)
+        await queue.start()
+        await queue._queue.join()
+        await queue.stop()
+        return queue
+
+    job_id = asyncio.run(submit_without_workers())
+    queue = asyncio.run(restart())
+    assert queue.get(job_id)["status"] == "done"
+    assert not list(tmp_path.glob("*.upload"))
+
+
+def test_full_queue_refuses_uploads(tmp_path):
+    """Test uploads are refused once the queue is full."""
+    async def scenario():
+        queue = JobQueue(echo_handler, tmp_path, max_queued=1)
+        queue._queue = asyncio.Queue()
+        await queue.submit(FakeUpload("a.txt", b"one"))
+        with pytest.raises(IngestBusyError):
+            await queue.submit(FakeUpload("b.txt", b"two"))
+
+    asyncio.run(scenario())
+
+
+def test_job_params_reach_the_handler(tmp_path):
+    """Test keyword parameters given at submit time are passed to the handler."""
+    async def scenario():
+        queue = JobQueue(echo_handler, tmp_path, workers=1)
+        await queue.start()
+        job = await queue.submit(FakeUpload("a.txt", b"hi"), prefix="team/")
+        await queue._queue.join()
+        await queue.stop()
+        return queue.get(job["id"])
+
+    assert asyncio.run(scenario())["message"] == "team/a.txt: hi"
+
+
+def test_jobs_from_other_processes_run_in_the_writer(tmp_path):
+    """Test a job submitted through a non-writing queue is picked up and can be waited on."""
+    async def scenario():
+        writer = JobQueue(echo_handler, tmp_path, workers=1, poll_interval=0.01)
+        await writer.start()
+        other = JobQueue(echo_handler, tmp_path)
+        job = await other.submit(prefix="delete: ")
+        done = await other.wait(job["id"], timeout=5)
+        await writer.stop()
+        return done
+
+    job = asyncio.run(scenario())
+    assert job["status"] == "done"
+    assert job["message"] == "delete: no upload"
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="no fcntl on Windows")
+def test_only_one_process_is_the_writer(tmp_path):
+    """Test a queue stands by while another process holds the writer lock."""
+    holder = subprocess.Popen(
+        [sys.executable, "-c", (
+            "import fcntl, sys, time\n"
+            f"f = open({str(tmp_path / 'writer.lock')!r}, 'a+')\n"
+            "fcntl.lockf(f, fcntl.LOCK_EX)\n"
+            "print('locked', flush=True)\n"
+            "sys.stdin.read()\n"
+        )],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+    )
+    assert holder.stdout.readline() == b"locked\n"
+
+    async def scenario():
+        queue = JobQueue(echo_handler, tmp_path, workers=1, poll_interval=0.01)
+        await queue.start()
+        standby = queue.is_writer
+        holder.stdin.close()
+        holder.wait()
+        for _ in range(100):
+            if queue.is_writer:
+                break
+            await asyncio.sleep(0.02)
+        took_over = queue.is_writer
+        await queue.stop()
+        return standby, took_over
+
+    assert asyncio.run(scenario()) == (False, True)
+
+
+def test_history_is_trimmed_and_shared_without_rescanning(tmp_path):
+    """Test old finished jobs are deleted, and every process reports the writer's figures."""
+    legacy = {"id": "job_legacy", "filename": None, "upload": False, "params": {}, "status": "queued",
+              "chunks": 0, "created_at": 0, "started_at": None, "finished_at": None}
+    (tmp_path / "job_legacy.json").write_text(json.dumps(legacy))
+
+    async def scenario():
+        queue = JobQueue(echo_handler, tmp_path, workers=1, max_history=2)
+        await queue.start()
+        for name in ("a.txt", "b.txt"):
+            await queue.submit(FakeUpload(name, b"x"))
+        await queue._queue.join()
+        await queue.stop()
+        return queue.get_stats(), JobQueue(echo_handler, tmp_path, workers=1).get_stats(), queue.get("job_legacy")
+
+    stats, other, legacy = asyncio.run(scenario())
+    # Of three finished jobs (the legacy one resumed first), the two newest are kept
+    assert legacy is None
+    assert len(list(tmp_path.glob("job_*.json"))) == 2
+    assert not list((tmp_path / "pending").iterdir())
+    assert stats == other
+    assert stats["completed"] == 2 and stats["queue_depth"] == 0 and stats["chunks_per_second"]
@@ -0,0 +1,100 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+from room_rag.llm import LLMBusyError, LLMClient
+
+
+class FakeCompletions:
+    """Stands in for ``chat.completions``: answers after scripted delays or failures."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        step = self.script.pop(0) if self.script else 0.0
+        try:
+            if isinstance(step, Exception):
+                raise step
+            await asyncio.sleep(step)
+            return SimpleNamespace(answer=f"call {self.calls}")
+        finally:
+            self.active -= 1
+
+
+def fake_client(*script):
+    completions = FakeCompletions(script)
+    return SimpleNamespace(chat=SimpleNamespace(completions=completions)), completions
+
+
+def server_error():
+    request = httpx.Request("POST", "https://api.example.com/v1/chat/completions")
+    return openai.InternalServerError("boom", response=httpx.Response(500, request=request), body=None)
+
+
+def test_concurrency_is_capped():
+    """Test no more than max_concurrency requests are sent at once."""
+    client, completions = fake_client(*[0.01] * 10)
+    llm = LLMClient(client=client, max_concurrency=3)
+
+    async def scenario():
+        await asyncio.gather(*(llm.complete() for _ in range(10)))
+
+    asyncio.run(scenario())
+    assert completions.peak == 3
+    stats = llm.get_stats()
+    assert stats["completed"] == 10
+    assert stats["in_flight"] == 0
+
+
+def test_full_queue_fails_fast():
+    """Test requests beyond the queue limit are rejected instead of waiting."""
+    client, _ = fake_client(0.05, 0.05)
+    llm = LLMClient(client=client, max_concurrency=1, max_queued=0)
+
+    async def scenario():
+        return await asyncio.gather(llm.complete(), llm.complete(), return_exceptions=True)
+
+    first, second = asyncio.run(scenario())
+    assert first.answer == "call 1"
+    assert isinstance(second, LLMBusyError)
+    assert llm.get_stats()["rejected"] == 1
+
+
+def test_server_errors_are_retried():
+    """Test retryable errors are retried with backoff and counted."""
+    client, completions = fake_client(server_error(), server_error(), 0.0)
+    llm = LLMClient(client=client, max_retries=2)
+    llm.backoff_base = 0.001
+
+    assert asyncio.run(llm.complete()).answer == "call 3"
+    assert llm.get_stats()["retries"] == 2
+
+
+def test_deadline_bounds_the_call():
+    """Test a call that outlives its deadline raises a timeout."""
+    client, _ = fake_client(1.0)
+    llm = LLMClient(client=client, timeout=0.05)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(llm.complete())
+    assert llm.get_stats()["timeouts"] == 1
+
+
+def test_slow_requests_are_hedged():
+    """Test a slow completion is sent again and the faster answer wins."""
+    client, completions = fake_client(1.0, 0.0)
+    llm = LLMClient(client=client, hedge_after=0.02)
+
+    assert asyncio.run(llm.complete()).answer == "call 2"
+    stats = llm.get_stats()
+    assert stats["hedges"] == 1
+    assert stats["hedge_wins"] == 1
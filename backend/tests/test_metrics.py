@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+import pytest
+from room_rag import metrics
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_stages_are_attributed_to_their_request():
+    """Stages, also those run in worker threads, are timed under the request they belong to."""
+    def blocking():
+        with metrics.stage("index"):
+            time.sleep(0.002)
+
+    async def handle():
+        with metrics.request("upload") as timings:
+            with metrics.stage("read"):
+                pass
+            await asyncio.to_thread(blocking)
+        return timings
+
+    timings = asyncio.run(handle())
+    assert set(timings) == {"read", "index"}
+    assert timings["index"] >= 0.002
+    assert metrics.server_timing({"read": 0.0012}) == "read;dur=1.2"
+
+    with pytest.raises(ValueError):
+        with metrics.request("chat"):
+            raise ValueError("boom")
+    # Outside a request, stages are background work
+    metrics.observe("compact", 0.5)
+
+    stats = metrics.get_stats()
+    assert set(stats["requests"]) == {"upload ok", "chat error"}
+    assert set(stats["stages"]) == {"upload read", "upload index", "background compact"}
+
+
+def test_prometheus_text_format():
+    """Histograms are cumulative with a +Inf bucket; gauge label values are escaped."""
+    for seconds in (0.003, 0.004, 0.2, 100):
+        metrics.observe("retrieval", seconds, operation="chat")
+    gauges = [metrics.Gauge("room_chunks", "Chunks stored for a collection.", [({"collection": 'a"b'}, 42)])]
+    lines = metrics.render(gauges).splitlines()
+
+    assert "# TYPE room_stage_duration_seconds histogram" in lines
+    assert 'room_stage_duration_seconds_bucket{operation="chat",stage="retrieval",le="0.0025"} 0' in lines
+    assert 'room_stage_duration_seconds_bucket{operation="chat",stage="retrieval",le="0.005"} 2' in lines
+    assert 'room_stage_duration_seconds_bucket{operation="chat",stage="retrieval",le="60"} 3' in lines
+    assert 'room_stage_duration_seconds_bucket{operation="chat",stage="retrieval",le="+Inf"} 4' in lines
+    assert 'room_stage_duration_seconds_count{operation="chat",stage="retrieval"} 4' in lines
+    assert "# TYPE room_chunks gauge" in lines
+    assert 'room_chunks{collection="a\\"b"} 42' in lines
+
+
+def test_token_counts_belong_to_their_request():
+    """Token counts are summed per request and kept in a histogram per operation and kind."""
+    async def handle(tokens):
+        with metrics.request("chat"):
+            metrics.count_tokens("prompt", tokens)
+            await asyncio.sleep(0)
+            metrics.count_tokens("prompt", 1)
+            return metrics.usage()
+
+    async def scenario():
+        return await asyncio.gather(handle(100), handle(3000))
+
+    assert asyncio.run(scenario()) == [{"prompt": 101}, {"prompt": 3001}]
+    assert metrics.usage() == {}
+    lines = metrics.render().splitlines()
+    assert 'room_request_tokens_bucket{operation="chat",kind="prompt",le="128"} 3' in lines
+    assert 'room_request_tokens_count{operation="chat",kind="prompt"} 4' in lines
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+
+from room_rag.pipeline import RetrievalPipeline, parse_budgets, reciprocal_rank_fusion
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    """Test chunks ranked by both retrievers beat chunks ranked by one."""
+    fused = reciprocal_rank_fusion([[(1, 9.0), (2, 5.0)], [(3, 0.9), (1, 0.8)]])
+    assert fused[0][0] == 1
+    assert {chunk_id for chunk_id, _ in fused} == {1, 2, 3}
+
+
+def test_parse_budgets():
+    """Test budgets are parsed from milliseconds into seconds."""
+    assert parse_budgets("lexical=50, dense=200") == {"lexical": 0.05, "dense": 0.2}
+
+
+def test_slow_stage_is_dropped():
+    """Test a retriever that misses its budget is left out of fusion."""
+    def slow(query, top_k):
+        time.sleep(0.2)
+        return [(9, 1.0)]
+
+    pipeline = RetrievalPipeline(
+        retrievers={"lexical": lambda q, k: [(1, 2.0), (2, 1.0)], "dense": slow},
+        get_text=str,
+        budgets={"dense": 0.05}
+    )
+    hits, timings = asyncio.run(pipeline.retrieve("query", top_k=5))
+    assert [chunk_id for chunk_id, _ in hits] == [1, 2]
+    assert timings["dense"]["timed_out"] is True
+    assert pipeline.get_stats()["dense"]["timeouts"] == 1
+
+
+def test_reranker_reorders_fused_results():
+    """Test the reranker's scores decide the final order."""
+    pipeline = RetrievalPipeline(
+        retrievers={"lexical": lambda q, k: [(1, 2.0), (2, 1.0)]},
+        get_text=lambda chunk_id: f"chunk {chunk_id}",
+        reranker=lambda query, texts: [float(text.endswith("2")) for text in texts]
+    )
+    hits, timings = asyncio.run(pipeline.retrieve("query", top_k=2))
+    assert [chunk_id for chunk_id, _ in hits] == [2, 1]
+    assert "rerank" in timings
+
+
+def test_async_stages_are_awaited():
+    """Test coroutine retrievers and rerankers run on the loop under their budgets."""
+    async def dense(query, top_k):
+        return [(3, 0.9), (1, 0.5)]
+
+    async def never(query, top_k):
+        await asyncio.sleep(1)
+
+    async def rerank(query, texts):
+        return [float(text.endswith("1")) for text in texts]
+
+    pipeline = RetrievalPipeline(
+        retrievers={"dense": dense, "slow": never},
+        get_text=lambda chunk_id: f"chunk {chunk_id}",
+        reranker=rerank,
+        budgets={"slow": 0.05}
+    )
+    hits, timings = asyncio.run(pipeline.retrieve("query", top_k=2))
+    assert [chunk_id for chunk_id, _ in hits] == [1, 3]
+    assert timings["slow"]["timed_out"] is True
+
+
+def test_timed_out_threads_stay_on_the_pipeline_pool():
+    """Test synchronous stages run on the pipeline's own pool, so stragglers leave the default executor free."""
+    threads = []
+
+    def slow(query, top_k):
+        threads.append(threading.current_thread().name)
+        time.sleep(0.2)
+        return [(9, 1.0)]
+
+    pipeline = RetrievalPipeline(retrievers={"dense": slow}, get_text=str, budgets={"dense": 0.05})
+
+    async def scenario():
+        hits, _ = await pipeline.retrieve("query")
+        # The abandoned stage is still sleeping, but not in the default executor
+        return hits, await asyncio.to_thread(lambda: threading.current_thread().name)
+
+    hits, default_thread = asyncio.run(scenario())
+    assert hits == []
+    assert threads[0].startswith("retrieval-stage")
+    assert not default_thread.startswith("retrieval-stage")
@@ -1,66 +1,85 @@
+import asyncio
+
 import pytest
-import os
-from pathlib import Path
-import shutil
+from room_rag import metrics
 from room_rag.engine import RoomRAG
 
+CONTENT = b"""
+Room is a multilingual AI assistant that helps you chat with your documents.
+It supports both English and Hindi, and can process text and voice input.
+"""
+
+
+class Upload:
+    """Minimal async upload object."""
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self._data = data
+
+    async def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self._data)
+        block, self._data = self._data[:size], self._data[size:]
+        return block
+
+
 @pytest.fixture
-def rag_engine():
-    """Create a test RAG engine instance."""
-    engine = RoomRAG()
+def rag_engine(tmp_path, monkeypatch):
+    """Create a test RAG engine instance with its own storage."""
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    engine = RoomRAG(storage_path=tmp_path / "storage")
     yield engine
-    # Cleanup after tests
-    if os.path.exists("room_rag"):
-        shutil.rmtree("room_rag")
+    engine.close()
+
 
-@pytest.mark.asyncio
-async def test_document_ingestion(rag_engine):
+def test_document_ingestion(rag_engine):
     """Test document ingestion functionality."""
-    # Test content
-    content = b"""
-    Room is a multilingual AI assistant that helps you chat with your documents.
-    It supports both English and Hindi, and can process text and voice input.
-    """
-    filename = "test.txt"
-    
-    # Test ingestion
-    doc_id = await rag_engine.ingest(content, filename)
-    assert doc_id is not None
-    assert doc_id.startswith("doc_")
-    assert len(rag_engine.documents) > 0
-
-@pytest.mark.asyncio
-async def test_document_query(rag_engine):
+    message = asyncio.run(rag_engine.process_document(Upload("test.txt", CONTENT)))
+
+    assert "processed successfully" in message
+    assert len(rag_engine.documents) == 1
+    assert rag_engine.documents[0].doc_id.startswith("doc_")
+    assert len(rag_engine.store) > 0
+
+
+def test_document_query(rag_engine):
     """Test document querying functionality."""
-    # First ingest a document
-    content = b"""
-    Room is a multilingual AI assistant that helps you chat with your documents.
-    It supports both English and Hindi, and can process text and voice input.
-    """
-    filename = "test.txt"
-    await rag_engine.ingest(content, filename)
-    
-    # Test querying
-    response = await rag_engine.query("What is Room?")
-    assert response is not None
+    asyncio.run(rag_engine.process_document(Upload("test.txt", CONTENT)))
+
+    chunks = rag_engine.find_relevant_chunks("What is Room?")
+    assert chunks and "AI assistant" in chunks[0]
+    response = asyncio.run(rag_engine.get_response("What is Room?"))
     assert "Room" in response
     assert "AI assistant" in response
 
-@pytest.mark.asyncio
-async def test_clear_data(rag_engine):
+
+def test_clear_data(rag_engine):
     """Test clearing all data."""
-    # First ingest a document
-    content = b"Test content"
-    filename = "test.txt"
-    await rag_engine.ingest(content, filename)
-    
-    # Clear data
-    rag_engine.clear()
-    
-    # Verify data is cleared
+    asyncio.run(rag_engine.process_document(Upload("test.txt", CONTENT)))
+
+    rag_engine.clear_documents()
+
     assert len(rag_engine.documents) == 0
-    assert rag_engine.index.ntotal == 0
+    assert len(rag_engine.store) == 0
+    assert len(rag_engine.index) == 0
+    assert rag_engine.find_relevant_chunks("Room") == []
 
 
+def test_stages_are_timed(rag_engine):
+    """Uploads and chats record the time each of their stages took."""
+    metrics.reset()
 
+    async def upload_and_ask():
+        with metrics.request("upload") as upload:
+            await rag_engine.process_document(Upload("test.txt", CONTENT))
+        with metrics.request("chat") as chat:
+            await rag_engine.get_response("What is Room?")
+        return upload, chat
 
+    upload, chat = asyncio.run(upload_and_ask())
+    assert set(upload) == {"read", "clean", "chunk", "index"}
+    assert set(chat) == {"retrieval"}  # No OpenAI key: no prompt or model stages
+    stages = metrics.get_stats()["stages"]
+    assert stages["upload index"]["calls"] == 1
+    assert stages["chat retrieval"]["calls"] == 1
@@ -0,0 +1,154 @@
+from array import array
+
+import pytest
+from room_rag.store import ChunkStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Create a store with two documents."""
+    store = ChunkStore(tmp_path)
+    store.add_document({"filename": "a.txt"}, ["alpha one", "alpha two"])
+    store.add_document({"filename": "b.txt"}, ["beta one"])
+    yield store
+    store.close()
+
+
+def test_chunks_survive_reopen(store, tmp_path):
+    """Test chunks and documents are reloaded from disk."""
+    store.close()
+    reopened = ChunkStore(tmp_path)
+    assert list(reopened) == ["alpha one", "alpha two", "beta one"]
+    assert [doc.filename for doc in reopened.documents.values()] == ["a.txt", "b.txt"]
+    reopened.close()
+
+
+def test_torn_log_write_is_discarded(store, tmp_path):
+    """Test a partially written log record is ignored on reopen."""
+    with open(store.data_file, "ab") as f:
+        f.write(b"orphaned chunk")
+    with open(store.log_file, "ab") as f:
+        f.write(b'{"op": "add", "doc_id": "doc_tor')
+    store.close()
+
+    reopened = ChunkStore(tmp_path)
+    assert len(reopened) == 3
+    assert reopened.add_document({"filename": "c.txt"}, ["gamma"]).first_chunk == 3
+    assert reopened[3] == "gamma"
+    reopened.close()
+
+
+def test_aborted_writer_leaves_no_trace(store, tmp_path):
+    """Test an aborted streaming write is discarded and the next write lines up."""
+    writer = store.writer()
+    writer.append("half written")
+    writer.abort()
+
+    record = store.add_document({"filename": "c.txt"}, iter(["gamma one", "gamma two"]))
+    assert (record.first_chunk, record.chunk_count) == (3, 2)
+    store.close()
+
+    reopened = ChunkStore(tmp_path)
+    assert list(reopened) == ["alpha one", "alpha two", "beta one", "gamma one", "gamma two"]
+    reopened.close()
+
+
+def test_compaction_drops_deleted_documents(store, tmp_path):
+    """Test compaction rewrites only live chunks into a new generation."""
+    doc_id = next(iter(store.documents))
+    store.delete_document(doc_id)
+    assert store.dead_chunks == 2
+
+    remap = store.compact()
+    assert remap == {2: 0}
+    assert list(store) == ["beta one"]
+    assert store.dead_chunks == 0
+
+    store.close()
+    reopened = ChunkStore(tmp_path)
+    assert list(reopened) == ["beta one"]
+    assert reopened.document_for_chunk(0).filename == "b.txt"
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "MANIFEST", f"chunks.{reopened.generation}.col",
+        f"chunks.{reopened.generation}.dat", f"docs.{reopened.generation}.log",
+    ]
+    reopened.close()
+
+
+def test_index_snapshot_round_trip(store):
+    """Test index snapshots record how much of the log they cover."""
+    store.save_index({"terms": 3})
+    assert store.load_index() == ({"terms": 3}, 2)
+
+
+def test_chunk_columns_map_back_to_documents(store, tmp_path):
+    """Test chunk ids resolve to their document, page and character offset."""
+    record = store.add_document({"filename": "c.pdf", "sha": "abc"}, ["Page 1: one", "two", "Page 2: three"], [1, 1, 2])
+    store.close()
+
+    reopened = ChunkStore(tmp_path)
+    assert reopened.document_for_chunk(1).filename == "a.txt"
+    assert reopened.document_for_chunk(4).doc_id == record.doc_id
+    assert reopened.document_for_chunk(4).extra == {"sha": "abc"}
+    assert list(reopened.pages) == [0, 0, 0, 1, 1, 2]
+    assert list(reopened.char_starts) == [0, 10, 0, 0, 12, 16]
+    reopened.close()
+
+
+def test_explicit_char_starts_are_kept(store):
+    """Test chunk offsets given by the chunker are stored as-is (overlapping chunks, paragraph breaks)."""
+    record = store.add_document({"filename": "c.txt"}, ["One. Two.", "Two. Three.", "Four."], char_starts=[0, 5, 17])
+    assert [int(store.char_starts[i]) for i in record.chunk_ids] == [0, 5, 17]
+
+
+def test_offsets_file_from_older_versions_is_upgraded(tmp_path):
+    """Test a store written with (start, end) offset pairs still opens."""
+    (tmp_path / "chunks.0.dat").write_bytes(b"alpha onebeta")
+    (tmp_path / "chunks.0.off").write_bytes(array("q", [0, 9, 9, 13]).tobytes())
+    (tmp_path / "docs.0.log").write_text(
+        '{"op": "add", "doc_id": "doc_a", "filename": "a.txt", "first_chunk": 0, "chunk_count": 2}\n'
+    )
+
+    store = ChunkStore(tmp_path)
+    assert list(store) == ["alpha one", "beta"]
+    assert store.document_for_chunk(1).doc_id == "doc_a"
+    assert not (tmp_path / "chunks.0.off").exists()
+    store.close()
+
+
+def test_readonly_store_follows_the_writer(store, tmp_path):
+    """Test a read-only store picks up documents, deletions and compaction by the writer."""
+    reader = ChunkStore(tmp_path, readonly=True)
+    assert list(reader) == ["alpha one", "alpha two", "beta one"]
+    assert not reader.changed()
+    with pytest.raises(PermissionError):
+        reader.add_document({"filename": "c.txt"}, ["gamma"])
+
+    store.add_document({"filename": "c.txt"}, ["gamma"])
+    assert reader.changed()
+    assert reader.refresh()
+    assert reader[3] == "gamma"
+    assert reader.document_for_chunk(3).filename == "c.txt"
+
+    doc_id = next(iter(store.documents))
+    store.delete_document(doc_id)
+    store.compact()
+    assert not reader.refresh()
+    assert list(reader) == ["beta one", "gamma"]
+    assert doc_id not in reader.documents
+    reader.close()
+
+
+def test_readonly_store_ignores_an_uncommitted_tail(store, tmp_path):
+    """Test a reader skips a record the writer is still writing and reads it once complete."""
+    reader = ChunkStore(tmp_path, readonly=True)
+    line = b'{"op": "delete", "doc_id": "%s"}\n' % next(iter(store.documents)).encode()
+    with open(store.log_file, "ab") as f:
+        f.write(line[:10])
+        f.flush()
+        assert reader.refresh()
+        assert len(reader.documents) == 2
+        f.write(line[10:])
+    assert reader.refresh()
+    assert len(reader.documents) == 1
+    reader.close()
@@ -0,0 +1,94 @@
+import asyncio
+
+import numpy as np
+from room_voice.stt import SAMPLE_RATE, SpeechRecognizer, StreamingTranscriber, VoiceActivityDetector
+
+
+def tone(seconds, amplitude=0.3, frequency=220):
+    """16-bit PCM of a sine tone, standing in for speech."""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * 32767 * np.sin(2 * np.pi * frequency * t)).astype("<i2").tobytes()
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype="<i2").tobytes()
+
+
+class FakeWhisper:
+    """Records every batch; "transcribes" audio as its length in tenths of a second."""
+
+    def __init__(self):
+        self.batches = []
+
+    def load(self, name):
+        return name
+
+    def decode(self, model, audios, language):
+        self.batches.append([len(audio) for audio in audios])
+        return [f"{language}:{round(len(audio) / SAMPLE_RATE * 10)}" for audio in audios]
+
+
+def recognizer(fake):
+    return SpeechRecognizer(model_name="fake", max_wait=0.01, loader=fake.load, decoder=fake.decode)
+
+
+def test_voice_activity_detection():
+    """Tones are speech, silence and steady low noise are not."""
+    vad = VoiceActivityDetector(480)
+    speech = np.frombuffer(tone(0.03), dtype="<i2") / 32768
+    noise = np.random.default_rng(0).normal(0, 0.002, 480)
+    assert vad.is_speech(speech)
+    assert not vad.is_speech(np.zeros(480))
+    assert not any(vad.is_speech(noise) for _ in range(50))
+    assert vad.is_speech(speech)
+
+
+def test_streaming_transcription():
+    """Utterances are cut at silence, partials stream while speech grows, silence is not transcribed."""
+    fake = FakeWhisper()
+    partials = []
+
+    async def on_partial(text):
+        partials.append(text)
+
+    async def dictate():
+        session = StreamingTranscriber(recognizer(fake), "en", on_partial, partial_interval_ms=300,
+                                       silence_ms=300, preroll_ms=90)
+        for chunk in [silence(1), tone(1), silence(0.6), tone(0.5)]:
+            # Frames arrive in small, unaligned pieces
+            for start in range(0, len(chunk), 1001):
+                session.feed(chunk[start:start + 1001])
+                await asyncio.sleep(0)
+        await asyncio.sleep(0.05)
+        return await session.finish()
+
+    transcript = asyncio.run(dictate())
+    # Two utterances: 1 s of tone plus pre-roll and trailing silence, then 0.5 s of tone plus pre-roll
+    assert transcript == "en:14 en:6"
+    assert partials and all(text.startswith("en:") for text in partials)
+    # The leading second of silence never reached the model
+    assert max(length for batch in fake.batches for length in batch) < 1.5 * SAMPLE_RATE
+
+
+def test_sessions_share_batches():
+    """Concurrent sessions are transcribed in one forward pass."""
+    fake = FakeWhisper()
+    shared = recognizer(fake)
+
+    async def dictate_all():
+        sessions = [StreamingTranscriber(shared, "hi", partial_interval_ms=10_000) for _ in range(3)]
+        for session in sessions:
+            session.feed(tone(0.5) + silence(1))
+        return await asyncio.gather(*(session.finish() for session in sessions))
+
+    assert asyncio.run(dictate_all()) == ["hi:12"] * 3
+    assert [len(batch) for batch in fake.batches] == [3]
+    assert shared.get_stats()["batching"]["largest_batch"] == 3
+
+
+def test_transcribe_sync_splits_windows():
+    """Long recordings are decoded in 30-second windows, batched."""
+    fake = FakeWhisper()
+    audio = np.zeros(70 * SAMPLE_RATE, dtype=np.float32)
+    assert recognizer(fake).transcribe_sync(audio, "en") == "en:300 en:300 en:100"
+    assert len(fake.batches) == 1
@@ -1,9 +1,15 @@
+import asyncio
+
 import pytest
+from room_translate.memory import TranslationMemory
+from room_translate.neural import NeuralBackend
+from room_translate.phrases import PhraseTable, load_phrase_table
 from room_translate.translator import RoomTranslator
 
 @pytest.fixture
-def translator():
-    """Create a test translator instance."""
+def translator(monkeypatch):
+    """Create a test translator instance with the built-in phrases."""
+    monkeypatch.delenv("TRANSLATION_PHRASES", raising=False)
     return RoomTranslator()
 
 def test_language_detection(translator):
@@ -11,58 +17,110 @@ def test_language_detection(translator):
     # Test English text
     text_en = "Hello, how are you?"
     assert translator.detect_language(text_en) == "en"
-    
+
     # Test Hindi text
     text_hi = "नमस्ते, आप कैसे हैं?"
     assert translator.detect_language(text_hi) == "hi"
 
 def test_english_to_hindi_translation(translator):
-    """Test English to Hindi translation."""
-    text = "Hello, how are you?"
-    translation = translator.translate_to_hindi(text)
-    assert translation is not None
-    assert len(translation) > 0
-    assert translator.detect_language(translation) == "hi"
-
-def test_hindi_to_english_translation(translator):
-    """Test Hindi to English translation."""
-    text = "नमस्ते, आप कैसे हैं?"
-    translation = translator.translate_to_english(text)
-    assert translation is not None
-    assert len(translation) > 0
-    assert translator.detect_language(translation) == "en"
-
-def test_batch_translation(translator):
-    """Test batch translation functionality."""
-    texts = [
-        "Hello, how are you?",
-        "What is your name?",
-        "Nice to meet you!"
-    ]
-    translations = translator.batch_translate(texts, "hi")
-    assert len(translations) == len(texts)
-    for translation in translations:
-        assert translation is not None
-        assert len(translation) > 0
-        assert translator.detect_language(translation) == "hi"
-
-def test_text_normalization(translator):
-    """Test text normalization functionality."""
-    # Test multiple spaces
-    text = "Hello   world  !"
-    normalized = translator._normalize_text(text)
-    assert normalized == "Hello world!"
-    
-    # Test punctuation spacing
-    text = "Hello , world !"
-    normalized = translator._normalize_text(text)
-    assert normalized == "Hello, world!"
-    
-    # Test quotes
-    text = "He said "hello" to me"
-    normalized = translator._normalize_text(text)
-    assert normalized == 'He said "hello" to me'
+    """Every phrase is translated in place, not just the first one found."""
+    translation = translator.translate("Hello, how are you? Good morning and thank you.", "en", "hi")
+    assert translation == "नमस्ते, कैसे हो आप? सुप्रभात and धन्यवाद."
+
+    # Phrases match whole words only ("no" is not in "know")
+    assert translator.translate("I know.", "en", "hi") == "I know. (Hindi translation coming soon!)"
+
+def test_phrase_table_longest_match():
+    """Overlapping phrases resolve leftmost-longest; punctuation breaks a phrase."""
+    table = PhraseTable({"good": "अच्छा", "good morning": "सुप्रभात", "morning": "सुबह", "a b c": "X", "b c d": "Y"})
+    assert table.translate("Good morning") == ("सुप्रभात", 1)
+    assert table.translate("good, morning") == ("अच्छा, सुबह", 2)
+    assert table.translate("a b c d") == ("X d", 1)
+    assert table.translate("b c d") == ("Y", 1)
+    assert table.translate("nothing") == ("nothing", 0)
+
+def test_phrase_table_file(tmp_path, monkeypatch):
+    """Phrases from TRANSLATION_PHRASES are added to and override the built-in ones."""
+    path = tmp_path / "phrases.tsv"
+    path.write_text("# English\tHindi\n\nhello\tहैलो\nsee you soon\tफिर मिलेंगे\n", encoding="utf-8")
+    assert load_phrase_table(path) == {"hello": "हैलो", "see you soon": "फिर मिलेंगे"}
+
+    monkeypatch.setenv("TRANSLATION_PHRASES", str(path))
+    translator = RoomTranslator()
+    assert translator.translate("Hello, see you soon!", "en", "hi") == "हैलो, फिर मिलेंगे!"
+    assert translator.get_stats()["phrases"] == 12
+
+def test_translation_cache(translator):
+    """Repeated sentences are served from the cache."""
+    text = "Thank you. Goodbye."
+    assert translator.translate(text, "en", "hi") == "धन्यवाद. अलविदा."
+    assert translator.translate(text, "en", "hi") == "धन्यवाद. अलविदा."
+
+    stats = translator.get_stats()["cache"]
+    assert stats["misses"] == 2
+    assert stats["hits"] == 2
+
+class FakeModel:
+    """Records every batch; "translates" by upper-casing."""
+
+    def __init__(self):
+        self.loads = []
+        self.batches = []
+
+    def load(self, name):
+        self.loads.append(name)
+        return name
+
+    def generate(self, loaded, sentences, beams=1):
+        self.batches.append(list(sentences))
+        return [sentence.upper() for sentence in sentences]
+
+def neural_translator(tmp_path, fake, **kwargs):
+    memory = TranslationMemory(tmp_path / "memory.sqlite3")
+    backend = NeuralBackend(models="en-hi=fake-en-hi", memory=memory, max_wait=0.01,
+                            loader=fake.load, generator=fake.generate, **kwargs)
+    return RoomTranslator(neural=backend)
+
+def test_neural_backend_batches_and_remembers(tmp_path):
+    """Concurrent answers share forward passes; the memory outlives the translator."""
+    fake = FakeModel()
+    translator = neural_translator(tmp_path, fake)
+    assert fake.loads == []  # Loaded on first use, not at startup
+
+    async def translate_all():
+        return await asyncio.gather(
+            translator.translate_async("First answer. Shared sentence.", "en", "hi"),
+            translator.translate_async("Second answer.\n\nShared sentence.", "en", "hi"),
+        )
+
+    first, second = asyncio.run(translate_all())
+    assert first == "FIRST ANSWER. SHARED SENTENCE."
+    assert second == "SECOND ANSWER.\n\nSHARED SENTENCE."
+    assert fake.loads == ["fake-en-hi"]
+    assert len(fake.batches) == 1
+    assert sorted(fake.batches[0]) == ["First answer.", "Second answer.", "Shared sentence."]
+    translator.close()
 
+    # A new process finds the translations in the memory
+    fake = FakeModel()
+    translator = neural_translator(tmp_path, fake)
+    assert translator.translate("Shared sentence. New one.", "en", "hi") == "SHARED SENTENCE. NEW ONE."
+    assert fake.batches == [["New one."]]
+    assert translator.get_stats()["neural"]["memory"]["hits"] == 1
+    translator.close()
 
+def test_neural_backend_falls_back_to_phrases(tmp_path):
+    """A model that fails to load is switched off and the phrase table takes over."""
+    fake = FakeModel()
 
+    def broken(name):
+        raise OSError("model not found")
 
+    fake.load = broken
+    translator = neural_translator(tmp_path, fake)
+    assert asyncio.run(translator.translate_async("Thank you.", "en", "hi")) == "धन्यवाद."
+    assert translator.get_stats()["neural"]["failed"] == {"fake-en-hi": "model not found"}
+    assert not translator.neural.supports("en", "hi")
+    # Directions without a model use the phrase table too
+    assert translator.translate("नमस्ते", "hi", "en") == "नमस्ते (English translation coming soon!)"
+    translator.close()
@@ -1,18 +1,34 @@
-import pytest
+import asyncio
 import os
+
 import numpy as np
-from pathlib import Path
-import shutil
+import pytest
 from room_voice.processor import RoomVoice
+from room_voice.tts import AudioCache, SpeechSynthesizer, read_wav, wav_header
+
+
+class FakeSynthesizer:
+    """Records every call; "speaks" a text as one sample per character."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, text, voice):
+        self.calls.append((text, voice))
+        return np.full(len(text), len(self.calls), dtype="<i2").tobytes(), 8000
+
 
 @pytest.fixture
-def voice_processor():
-    """Create a test voice processor instance."""
-    processor = RoomVoice()
-    yield processor
-    # Cleanup after tests
-    if os.path.exists("static/audio"):
-        shutil.rmtree("static/audio")
+def fake():
+    return FakeSynthesizer()
+
+
+@pytest.fixture
+def voice_processor(tmp_path, fake):
+    """Create a test voice processor instance with a fake synthesizer."""
+    synthesizer = SpeechSynthesizer(tmp_path, voices="en=en-us,hi=hi", synthesize=fake)
+    return RoomVoice(audio_path=tmp_path, synthesizer=synthesizer)
+
 
 def create_test_audio(duration_seconds=2, sample_rate=16000):
     """Create test audio data."""
@@ -23,58 +39,89 @@ def create_test_audio(duration_seconds=2, sample_rate=16000):
     audio = (audio * 32767).astype(np.int16)
     return audio.tobytes()
 
+
+def collect(stream):
+    async def read():
+        return [chunk async for chunk in stream]
+    return asyncio.run(read())
+
+
 def test_speech_to_text(voice_processor):
     """Test speech-to-text functionality."""
-    # Create test audio
-    audio_data = create_test_audio()
-    
-    # Test transcription
-    text = voice_processor.speech_to_text(audio_data)
+    text = voice_processor.speech_to_text(create_test_audio())
     assert text is not None
     assert isinstance(text, str)
 
-def test_text_to_speech_english(voice_processor):
-    """Test text-to-speech functionality for English."""
-    text = "Hello, how are you?"
-    
-    # Test TTS
-    audio_path = voice_processor.text_to_speech(text, lang="en")
-    assert audio_path is not None
-    assert audio_path.startswith("/static/audio/")
-    assert Path("static/audio").exists()
-
-def test_text_to_speech_hindi(voice_processor):
-    """Test text-to-speech functionality for Hindi."""
-    text = "नमस्ते, आप कैसे हैं?"
-    
-    # Test TTS
-    audio_path = voice_processor.text_to_speech(text, lang="hi")
-    assert audio_path is not None
-    assert audio_path.startswith("/static/audio/")
-    assert Path("static/audio").exists()
-
-def test_cleanup_old_files(voice_processor):
-    """Test cleanup of old audio files."""
-    # Create some test files
-    text = "Test audio"
-    voice_processor.text_to_speech(text, lang="en")
-    
-    # Run cleanup
-    voice_processor.cleanup_old_files(max_age_hours=0)
-    
-    # Check if files are cleaned up
-    files = list(Path("static/audio").glob("*.wav"))
-    assert len(files) == 0
 
-def test_supported_languages(voice_processor):
-    """Test getting supported languages."""
-    languages = voice_processor.get_supported_languages()
-    assert isinstance(languages, dict)
-    assert "en" in languages
-    assert "hi" in languages
-    assert languages["en"] == "English"
-    assert languages["hi"] == "Hindi"
+def test_text_to_speech_streams_then_serves_from_cache(voice_processor, fake, tmp_path):
+    """The first request streams sentence by sentence; the next one is a static file."""
+    text = "Hello there. How are you?"
+    url = voice_processor.text_to_speech(text, "en")
+    assert url.startswith("/voice/speech/")
+    key = url.rsplit("/", 1)[1]
+    assert voice_processor.speech_url(key) is None
+
+    chunks = collect(voice_processor.speech_stream(key))
+    # The header, then one chunk per sentence, each sent as soon as it is synthesized
+    assert [len(chunk) for chunk in chunks] == [44, 2 * len("Hello there."), 2 * len("How are you?")]
+    assert fake.calls == [("Hello there.", "en-us"), ("How are you?", "en-us")]
+
+    url = voice_processor.text_to_speech(text, "en")
+    assert url == f"/static/audio/{key}.wav"
+    assert voice_processor.speech_url(key) == url
+    pcm, sample_rate = read_wav((tmp_path / f"{key}.wav").read_bytes())
+    assert pcm == b"".join(chunks[1:]) and sample_rate == 8000
+
+    # Sentences are cached too: a new answer only voices what is new
+    collect(voice_processor.speech_stream(voice_processor.text_to_speech("How are you?\nFine.", "en").rsplit("/", 1)[1]))
+    assert fake.calls[2:] == [("Fine.", "en-us")]
+
+
+def test_text_to_speech_unavailable(tmp_path, fake):
+    """No URL for languages without a voice, or for text with nothing to say."""
+    voice = RoomVoice(audio_path=tmp_path, synthesizer=SpeechSynthesizer(tmp_path, voices="en=en-us", synthesize=fake))
+    assert voice.text_to_speech("नमस्ते", "hi") is None
+    assert voice.text_to_speech("...", "en") is None
+    assert voice.speech_stream("0" * 64) is None
+    assert fake.calls == []
 
 
+def test_audio_cache_evicts_least_recently_used(tmp_path):
+    """Past its size the cache drops the files used longest ago."""
+    cache = AudioCache(tmp_path, max_bytes=250)
+    cache.put("a.wav", b"a" * 100)
+    cache.put("b.wav", b"b" * 100)
+    os.utime(tmp_path / "a.wav", (1, 1))
+    os.utime(tmp_path / "b.wav", (2, 2))
+    assert cache.get("a.wav") == b"a" * 100  # Now the most recently used
+    cache.put("c.wav", b"c" * 100)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["a.wav", "c.wav"]
+    assert cache.get_stats()["hits"] == 1
 
 
+def test_audio_cache_lists_the_directory_only_when_full(tmp_path, monkeypatch):
+    """Writes below the size limit are counted, not re-listed; passing it trims once."""
+    cache = AudioCache(tmp_path, max_bytes=450)
+    listings = []
+    trim = cache._trim
+    monkeypatch.setattr(cache, "_trim", lambda: listings.append(1) or trim())
+    for name in "abcd":
+        cache.put(f"{name}.wav", name.encode() * 100)
+    assert len(listings) == 1  # The first write learns the directory's size
+    cache.put("e.wav", b"e" * 100)
+    assert len(listings) == 2
+    assert len(list(tmp_path.iterdir())) == 4
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_read_wav_stream_header():
+    """A WAV written as a stream (unknown length) reads back to its end."""
+    pcm = np.arange(100, dtype="<i2").tobytes()
+    assert read_wav(wav_header(22050) + pcm) == (pcm, 22050)
+    assert read_wav(wav_header(22050, len(pcm)) + pcm + b"junk") == (pcm, 22050)
+
+
+def test_supported_languages(voice_processor):
+    """Test getting supported languages."""
+    languages = voice_processor.get_supported_languages()
+    assert languages == {"en": "English", "hi": "Hindi"}
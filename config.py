@@ -25,14 +25,56 @@ MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
 ALLOWED_EXTENSIONS = {".pdf", ".txt", ".doc", ".docx"}
 
 # RAG Configuration
-CHUNK_SIZE = 2000
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 1000))  # characters; chunks follow sentences and paragraphs
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 150))  # characters of a cut paragraph the next chunk repeats
 TOP_K_CHUNKS = 5
+RAG_RETRIEVER = os.getenv("RAG_RETRIEVER", "lexical")  # "lexical" (BM25), "dense" (FAISS) or "hybrid"
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+DENSE_INDEX_TYPE = os.getenv("DENSE_INDEX_TYPE", "hnsw")  # used above DENSE_FLAT_MAX: "hnsw" or "ivf"
+DENSE_FLAT_MAX = int(os.getenv("DENSE_FLAT_MAX", 20000))
+RAG_RERANKER = os.getenv("RAG_RERANKER", "false").lower() == "true"  # cross-encoder rerank in hybrid mode
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RAG_STAGE_BUDGETS = os.getenv("RAG_STAGE_BUDGETS", "lexical=100,dense=250,rerank=400")  # ms per stage
+PIPELINE_STAGE_WORKERS = int(os.getenv("PIPELINE_STAGE_WORKERS", 8))  # threads for synchronous retrieval stages
+RAG_CANDIDATES = int(os.getenv("RAG_CANDIDATES", 20))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1500))  # tokens of document context per LLM request
+CONTEXT_EXTRACT_SENTENCES = os.getenv("CONTEXT_EXTRACT_SENTENCES", "true").lower() == "true"  # send the best sentences, not whole chunks
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", 32))  # queries embedded per forward pass
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", 5))  # wait for concurrent queries to batch with
+RERANK_BATCH_MAX_SIZE = int(os.getenv("RERANK_BATCH_MAX_SIZE", 8))  # requests reranked per forward pass
+RERANK_BATCH_MAX_WAIT_MS = float(os.getenv("RERANK_BATCH_MAX_WAIT_MS", 5))  # wait for concurrent reranks to batch with
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 512))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))  # seconds
+ANSWER_CACHE_SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "true").lower() == "true"  # needs the dense retriever
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))
+COLLECTIONS_MAX_LOADED = int(os.getenv("COLLECTIONS_MAX_LOADED", 8))  # collections kept in memory
+COLLECTIONS_MEMORY_BUDGET_MB = int(os.getenv("COLLECTIONS_MEMORY_BUDGET_MB", 2048))  # all resident collections
+COLLECTION_MEMORY_BUDGET_MB = int(os.getenv("COLLECTION_MEMORY_BUDGET_MB", 512))  # one collection; uploads get 507 beyond
+COLLECTIONS_REFRESH_WAIT = float(os.getenv("COLLECTIONS_REFRESH_WAIT", 5))  # seconds a reader waits for queries before refreshing
 
 # Translation Configuration
 SUPPORTED_LANGUAGES = ["en", "hi"]
+TRANSLATION_PHRASES = os.getenv("TRANSLATION_PHRASES", "")  # extra English<TAB>Hindi phrase table file
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", 4096))  # translated sentences kept
+TRANSLATION_BACKEND = os.getenv("TRANSLATION_BACKEND", "phrases")  # "phrases" or "neural" (local seq2seq models)
+TRANSLATION_MODELS = os.getenv("TRANSLATION_MODELS", "en-hi=Helsinki-NLP/opus-mt-en-hi,hi-en=Helsinki-NLP/opus-mt-hi-en")
+TRANSLATION_MEMORY_PATH = os.getenv("TRANSLATION_MEMORY_PATH", "room_translate/storage/memory.sqlite3")
+TRANSLATION_BATCH_MAX_SIZE = int(os.getenv("TRANSLATION_BATCH_MAX_SIZE", 16))  # sentences per forward pass
+TRANSLATION_BATCH_MAX_WAIT_MS = float(os.getenv("TRANSLATION_BATCH_MAX_WAIT_MS", 10))  # wait for concurrent sentences
+TRANSLATION_BEAMS = int(os.getenv("TRANSLATION_BEAMS", 1))  # beam width; 1 is greedy and fastest
 
 # Voice Configuration
 VOICE_ENABLED = os.getenv("VOICE_ENABLED", "false").lower() == "true"
+STT_MODEL = os.getenv("STT_MODEL", "base")  # Whisper model: tiny, base, small, ... (multilingual for Hindi)
+STT_MAX_SESSIONS = int(os.getenv("STT_MAX_SESSIONS", 16))  # concurrent /voice/stream connections per process
+STT_BATCH_MAX_SIZE = int(os.getenv("STT_BATCH_MAX_SIZE", 8))  # audio windows per forward pass, across sessions
+STT_BATCH_MAX_WAIT_MS = float(os.getenv("STT_BATCH_MAX_WAIT_MS", 20))  # wait for other sessions to batch with
+STT_PARTIAL_INTERVAL_MS = float(os.getenv("STT_PARTIAL_INTERVAL_MS", 1000))  # speech between partial transcripts
+STT_SILENCE_MS = float(os.getenv("STT_SILENCE_MS", 700))  # silence that ends an utterance
+STT_MAX_UTTERANCE_S = float(os.getenv("STT_MAX_UTTERANCE_S", 25))  # longer speech is transcribed in pieces
+STT_VAD_THRESHOLD_DB = float(os.getenv("STT_VAD_THRESHOLD_DB", -45))  # quietest level counted as speech (dBFS)
+TTS_VOICES = os.getenv("TTS_VOICES", "en=en-us,hi=hi")  # espeak-ng voice per language
+TTS_CACHE_MAX_MB = int(os.getenv("TTS_CACHE_MAX_MB", 512))  # synthesized audio kept in static/audio
 
 # Logging Configuration
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
@@ -42,6 +84,18 @@ LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*").split(",")
 
 # Performance Configuration
-MAX_WORKERS = int(os.getenv("MAX_WORKERS", 4))
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", 4))  # also sizes the ingestion process pool
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", 2 * MAX_WORKERS))  # documents parsed at once
+INGEST_QUEUE_TIMEOUT = float(os.getenv("INGEST_QUEUE_TIMEOUT", 30))  # seconds to wait for a slot before 503
+PARSE_CACHE_MAX_MB = int(os.getenv("PARSE_CACHE_MAX_MB", 256))  # parsed PDFs kept per collection, by upload hash
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", 2))  # background upload jobs run at once
+INGEST_MAX_QUEUED = int(os.getenv("INGEST_MAX_QUEUED", 100))  # queued uploads before /upload returns 503
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))  # uvicorn worker processes; one of them applies writes
 WORKER_TIMEOUT = int(os.getenv("WORKER_TIMEOUT", 120))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))  # OpenAI requests in flight per process
+LLM_MAX_QUEUED = int(os.getenv("LLM_MAX_QUEUED", 64))  # requests waiting for a slot before failing fast
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 30))  # deadline per request in seconds, including retries
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))  # retries on connection errors, 429 and 5xx
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", 0))  # seconds before a slow completion is re-sent; 0 = off
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", 32))  # HTTP connections kept to the API
 
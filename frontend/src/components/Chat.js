@@ -146,8 +146,13 @@ const Chat = ({ uploadedFiles }) => {
     setInput('');
     setIsLoading(true);
 
+    const aiMessageId = Date.now() + 1;
+    const updateAiMessage = (text) => {
+      setMessages(prev => prev.map(m => (m.id === aiMessageId ? { ...m, text } : m)));
+    };
+
     try {
-      const response = await fetch(`${API_BASE}/chat`, {
+      const response = await fetch(`${API_BASE}/chat/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -158,17 +163,39 @@ const Chat = ({ uploadedFiles }) => {
           use_voice: false,
         }),
       });
+      if (!response.ok) throw new Error('Chat request failed');
 
-      const data = await response.json();
-      
-      const aiMessage = {
-        id: Date.now() + 1,
-        text: data.response,
+      setMessages(prev => [...prev, {
+        id: aiMessageId,
+        text: '',
         isUser: false,
         timestamp: new Date(),
-      };
+      }]);
 
-      setMessages(prev => [...prev, aiMessage]);
+      // Read Server-Sent Events as they arrive and grow the answer in place
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let text = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const raw of events) {
+          const event = raw.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] ?? 'null');
+          if (event === 'token') {
+            text += data;
+            updateAiMessage(text);
+          } else if (event === 'done') {
+            updateAiMessage(data.response);
+          } else if (event === 'error') {
+            throw new Error(data.detail);
+          }
+        }
+      }
     } catch (error) {
       console.error('Error sending message:', error);
       const errorMessage = {
@@ -177,7 +204,7 @@ const Chat = ({ uploadedFiles }) => {
         isUser: false,
         timestamp: new Date(),
       };
-      setMessages(prev => [...prev, errorMessage]);
+      setMessages(prev => [...prev.filter(m => m.id !== aiMessageId), errorMessage]);
     } finally {
       setIsLoading(false);
     }
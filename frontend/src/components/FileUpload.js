@@ -60,6 +60,18 @@ const FileList = styled(Paper)(({ theme }) => ({
   overflow: 'hidden',
 }));
 
+// Uploads are processed in the background; poll the job until it finishes
+const waitForJob = async (jobId) => {
+  while (true) {
+    const response = await fetch(`${API_BASE}/jobs/${jobId}`);
+    if (!response.ok) throw new Error('Could not fetch upload status');
+    const job = await response.json();
+    if (job.status === 'done') return job;
+    if (job.status === 'failed') throw new Error(job.error || 'Processing failed');
+    await new Promise(resolve => setTimeout(resolve, 1000));
+  }
+};
+
 const FileUpload = ({ onFilesUploaded }) => {
   const [uploadedFiles, setUploadedFiles] = useState([]);
   const [uploading, setUploading] = useState(false);
@@ -84,12 +96,13 @@ const FileUpload = ({ onFilesUploaded }) => {
 
         if (response.ok) {
           const result = await response.json();
+          const job = result.job_id ? await waitForJob(result.job_id) : result;
           newFiles.push({
             name: file.name,
             size: file.size,
             type: file.type,
             status: 'success',
-            message: result.message,
+            message: job.message,
           });
           newStatus[file.name] = 'success';
         } else {